@@ -0,0 +1,103 @@
+"""
+Windowed min/avg/max aggregation of decoded BMS state frames.
+"""
+
+import time
+
+
+class _Window:
+    __slots__ = ("started", "count", "keys", "sums", "mins", "maxs", "last")
+
+    def __init__(self, started, state):
+        self.started = started
+        self.count = 0
+        # Only float fields are aggregated; everything else keeps its last value
+        self.keys = tuple(key for key, value in state.items() if type(value) is float)
+        size = len(self.keys)
+        self.sums = [0.0] * size
+        self.mins = [float("inf")] * size
+        self.maxs = [float("-inf")] * size
+        self.last = state
+
+    def add(self, state):
+        sums, mins, maxs = self.sums, self.mins, self.maxs
+        for i, key in enumerate(self.keys):
+            value = state[key]
+            sums[i] += value
+            if value < mins[i]:
+                mins[i] = value
+            if value > maxs[i]:
+                maxs[i] = value
+        self.count += 1
+        self.last = state
+
+    def result(self, precision):
+        state = dict(self.last)
+        count = self.count
+        minimum = {}
+        maximum = {}
+        for i, key in enumerate(self.keys):
+            state[key] = round(self.sums[i] / count, precision)
+            minimum[key] = self.mins[i]
+            maximum[key] = self.maxs[i]
+        state["min"] = minimum
+        state["max"] = maximum
+        state["samples"] = count
+        return state
+
+
+class StateAggregator:
+    """Accumulates state frames per key and emits one min/avg/max state per window."""
+
+    def __init__(self, window=10, precision=3, clock=time.monotonic):
+        self.window = window
+        self.precision = precision
+        self.clock = clock
+        self._windows = {}
+        self._next_expiry_check = 0
+
+    def add(self, key, state):
+        """Add a frame; return the aggregated state when it should be published, else None.
+
+        A window is emitted once it is older than the configured length, or
+        immediately when the alarm bits differ from the previous frame. A
+        frame with a different layout (e.g. after a cell count change) emits
+        the pending window and starts a new one with that frame.
+        """
+        now = self.clock()
+        window = self._windows.get(key)
+        if window is not None and len(window.last) != len(state):
+            closed = window.result(self.precision)
+            window = self._windows[key] = _Window(now, state)
+            window.add(state)
+            return closed
+        if window is None:
+            window = self._windows[key] = _Window(now, state)
+        alarm_changed = window.count > 0 and window.last.get("alarms") != state.get("alarms")
+        window.add(state)
+        if alarm_changed or now - window.started >= self.window:
+            del self._windows[key]
+            return window.result(self.precision)
+        return None
+
+    def flush(self, key=None):
+        """Emit and reset pending windows; returns a list of (key, state)."""
+        keys = list(self._windows) if key is None else [key]
+        results = []
+        for k in keys:
+            window = self._windows.pop(k, None)
+            if window is not None and window.count:
+                results.append((k, window.result(self.precision)))
+        return results
+
+    def flush_expired(self):
+        """Emit windows whose length elapsed without a new frame arriving."""
+        now = self.clock()
+        if now < self._next_expiry_check:
+            return []
+        self._next_expiry_check = now + min(1, self.window)
+        expired = [key for key, window in self._windows.items() if now - window.started >= self.window]
+        results = []
+        for key in expired:
+            results.extend(self.flush(key))
+        return results
@@ -0,0 +1,53 @@
+"""
+Edge-triggered alarm tracking on the 24-bit alarm mask of each BMS.
+
+Only the mask of the previous frame is kept per BMS. A frame whose mask is
+unchanged costs one dict lookup and an int compare; on a change the XOR of
+the two masks gives the alarms that were raised or cleared, and only those
+are published:
+
+    {topic_values}/01/alarms/cell_ovp   ON / OFF (retained)
+    {topic_values}/01/alarm_event       {"bms": "01", "alarm": "Cell OVP", "bit": 4, "event": "raised", "time": "..."}
+"""
+
+import datetime
+import re
+
+import jk02_decoder
+
+ALARM_NAMES = jk02_decoder.ALARM_NAMES
+ALARM_SLUGS = tuple(re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_") for name in ALARM_NAMES)
+ALL_ALARMS = (1 << len(ALARM_NAMES)) - 1
+
+
+def changed_bits(changed):
+    """Bit numbers set in changed, lowest first."""
+    while changed:
+        low = changed & -changed
+        yield low.bit_length() - 1
+        changed ^= low
+
+
+def event_message(bms_id, bit, active, timestamp):
+    return {
+        "bms": bms_id,
+        "alarm": ALARM_NAMES[bit],
+        "bit": bit,
+        "event": "raised" if active else "cleared",
+        "time": datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+    }
+
+
+class AlarmTracker:
+    """Last alarm mask per BMS."""
+
+    def __init__(self):
+        self.masks = {}
+
+    def update(self, bms_id, mask):
+        """Store the mask of a new frame; returns the changed bits, all bits for a BMS seen first."""
+        previous = self.masks.get(bms_id)
+        if previous == mask:
+            return 0
+        self.masks[bms_id] = mask
+        return ALL_ALARMS if previous is None else previous ^ mask
@@ -0,0 +1,169 @@
+"""
+Derived per-pack analytics, updated incrementally from every cell info frame.
+
+- Charge / discharge energy (Wh) and charge (Ah) counters, integrated from
+  bat_power and bat_current with the trapezoidal rule. Totals are persisted
+  so the counters keep increasing across restarts, as the Home Assistant
+  energy dashboard expects.
+- Exponentially weighted deviation of every cell from the pack mean voltage,
+  which moves away from zero for a drifting cell while ordinary noise averages out.
+- Exponentially smoothed cell resistances.
+
+Each update only touches the running values of one pack, independent of how
+long the proxy has been running.
+"""
+
+import json
+import logging
+import math
+import os
+import time
+
+import jk02_decoder
+
+COUNTERS = ("charge_wh", "discharge_wh", "charge_ah", "discharge_ah")
+
+
+class _Pack:
+    __slots__ = ("charge_wh", "discharge_wh", "charge_ah", "discharge_ah",
+                 "last_time", "last_power", "last_current", "deviation", "resistance", "dirty")
+
+    def __init__(self):
+        self.charge_wh = self.discharge_wh = 0.0
+        self.charge_ah = self.discharge_ah = 0.0
+        self.last_time = None
+        self.last_power = self.last_current = 0.0
+        self.deviation = []
+        self.resistance = []
+        self.dirty = False
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in COUNTERS}
+        data["deviation"] = self.deviation
+        data["resistance"] = self.resistance
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        pack = cls()
+        for name in COUNTERS:
+            setattr(pack, name, float(data.get(name, 0.0)))
+        pack.deviation = [float(value) for value in data.get("deviation", ())]
+        pack.resistance = [float(value) for value in data.get("resistance", ())]
+        return pack
+
+
+class PackAnalytics:
+    """Energy counters and cell trends of all packs, persisted to a JSON file.
+
+    Samples further apart than max_gap seconds (proxy or gateway outage) are
+    not integrated, since the power in between is unknown. Not thread-safe:
+    meant to run on the decode worker.
+    """
+
+    def __init__(self, path=None, deviation_tau=600, resistance_tau=3600, max_gap=60, clock=time.monotonic):
+        self.path = path
+        self.deviation_tau = deviation_tau
+        self.resistance_tau = resistance_tau
+        self.max_gap = max_gap
+        self.clock = clock
+        self.logger = logging.getLogger(__name__)
+        self.packs = {}
+        self._unsaved = False
+        if path is not None:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            self.logger.error("Cannot read analytics totals %s: %s", self.path, e)
+            return
+        self.packs = {bms_id: _Pack.from_dict(pack) for bms_id, pack in data.items()}
+        self.logger.info("Analytics totals for %d BMS loaded from %s", len(self.packs), self.path)
+
+    def save(self):
+        """Write the totals if they changed since the last save; atomic via rename."""
+        if self.path is None or not self._unsaved:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        try:
+            with open(temporary, "w") as f:
+                json.dump({bms_id: pack.to_dict() for bms_id, pack in self.packs.items()}, f)
+            os.replace(temporary, self.path)
+            self._unsaved = False
+        except OSError as e:
+            self.logger.error("Cannot write analytics totals %s: %s", self.path, e)
+
+    def update(self, bms_id, state, cell_count):
+        pack = self.packs.get(bms_id)
+        if pack is None:
+            pack = self.packs[bms_id] = _Pack()
+        now = self.clock()
+        power = state["bat_power"]
+        current = state["bat_current"]
+
+        dt = None if pack.last_time is None else now - pack.last_time
+        if dt is not None and 0 < dt <= self.max_gap:
+            hours = dt / 3600
+            energy = (pack.last_power + power) * 0.5 * hours
+            charge = (pack.last_current + current) * 0.5 * hours
+            # positive current charges the pack
+            if energy >= 0:
+                pack.charge_wh += energy
+            else:
+                pack.discharge_wh -= energy
+            if charge >= 0:
+                pack.charge_ah += charge
+            else:
+                pack.discharge_ah -= charge
+        pack.last_time = now
+        pack.last_power = power
+        pack.last_current = current
+
+        if cell_count > 0:
+            keys = jk02_decoder.cell_keys(cell_count)
+            voltages = [state[key] for key in keys[0::2]]
+            resistances = [state[key] for key in keys[1::2]]
+            mean = sum(voltages) / cell_count
+            if len(pack.deviation) != cell_count:
+                # first frame, or a pack rebuilt with another cell count
+                pack.deviation = [voltage - mean for voltage in voltages]
+                pack.resistance = resistances
+            elif dt is not None:
+                alpha = 1 - math.exp(-dt / self.deviation_tau)
+                pack.deviation = [d + alpha * (voltage - mean - d) for d, voltage in zip(pack.deviation, voltages)]
+                alpha = 1 - math.exp(-dt / self.resistance_tau)
+                pack.resistance = [r + alpha * (value - r) for r, value in zip(pack.resistance, resistances)]
+
+        pack.dirty = True
+        self._unsaved = True
+
+    def take_dirty(self):
+        """bms ids updated since the last call."""
+        dirty = [bms_id for bms_id, pack in self.packs.items() if pack.dirty]
+        for bms_id in dirty:
+            self.packs[bms_id].dirty = False
+        return dirty
+
+    def snapshot(self, bms_id):
+        """Published analytics of one pack: energy in kWh, charge in Ah, deviations in mV, resistances in mΩ."""
+        pack = self.packs[bms_id]
+        result = {
+            "charge_energy": round(pack.charge_wh / 1000, 4),
+            "discharge_energy": round(pack.discharge_wh / 1000, 4),
+            "charge_ah": round(pack.charge_ah, 3),
+            "discharge_ah": round(pack.discharge_ah, 3),
+        }
+        if pack.deviation:
+            worst = max(range(len(pack.deviation)), key=lambda i: abs(pack.deviation[i]))
+            result["cell_dev_max"] = round(pack.deviation[worst] * 1000, 2)
+            result["cell_dev_max_index"] = worst + 1
+            for i, (deviation, resistance) in enumerate(zip(pack.deviation, pack.resistance)):
+                result[f"cd{i+1:02d}"] = round(deviation * 1000, 2)
+                result[f"rt{i+1:02d}"] = round(resistance, 4)
+        return result
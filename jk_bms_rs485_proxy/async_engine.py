@@ -0,0 +1,214 @@
+"""
+asyncio engine: paho driven through its socket hooks, decode/publish/periodic work as coroutines.
+
+Everything runs on the event loop thread, so callbacks, decoding and
+publishing never race each other and additional work (timers, more inputs)
+is just another task instead of another thread.
+"""
+
+import asyncio
+import logging
+import threading
+
+from pipeline import Pipeline
+
+
+class AsyncPipeline(Pipeline):
+    """Pipeline whose decode, publish and periodic workers are tasks on the running loop.
+
+    The queues, spool handling and publish semantics are those of Pipeline.
+    Backpressure: the decode task yields after every payload and stops
+    decoding while the outbound queue is full, until the publish task has
+    drained it to half; excess state payloads are then shed from the inbound
+    queue, oldest first, as in the threaded pipeline.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connected = asyncio.Event()
+        self._inbound_ready = asyncio.Event()
+        self._outbound_ready = asyncio.Event()
+        self._outbound_drained = asyncio.Event()
+        self._tasks = []
+
+    def start(self):
+        """Start the workers; must be called from a coroutine on the loop."""
+        loop = asyncio.get_running_loop()
+        self._tasks = [
+            loop.create_task(self._decode_task(), name="jk-bms-decode"),
+            loop.create_task(self._publish_task(), name="jk-bms-publish"),
+        ]
+        for interval, callback, _ in self._periodic:
+            self._tasks.append(loop.create_task(self._periodic_task(interval, callback), name=f"jk-bms-{callback.__name__}"))
+
+    def stop(self, timeout=2):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self.spool is not None:
+            self._spool_pending()
+            self.spool.close()
+
+    def submit(self, payload, priority=False):
+        self.inbound.put(payload, priority)
+        self._inbound_ready.set()
+
+    def enqueue_publish(self, topic, payload, qos=0, retain=False, priority=False, coalesce=True):
+        self.outbound.put((priority, topic, payload, qos, retain), priority, topic if coalesce else None)
+        self._outbound_ready.set()
+
+    async def _decode_task(self):
+        outbound = self.outbound
+        while True:
+            payload = self.inbound.get(0)
+            if payload is None:
+                self._inbound_ready.clear()
+                await self._inbound_ready.wait()
+                continue
+            try:
+                self.decode(payload)
+            except Exception as e:
+                self.logger.error("Error in decode worker: %s", e, exc_info=True)
+            if len(outbound) >= outbound.maxsize and self.connected.is_set():
+                self._outbound_drained.clear()
+                await self._outbound_drained.wait()
+            else:
+                # Let socket reads and the publish task run between payloads
+                await asyncio.sleep(0)
+
+    async def _publish_task(self):
+        outbound = self.outbound
+        next_replay = 0
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self.connected.is_set():
+                self._spool_pending()
+                self._outbound_drained.set()
+                try:
+                    await asyncio.wait_for(self.connected.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            timeout = self.poll_interval
+            if self.spool is not None and len(self.spool):
+                now = loop.time()
+                if now >= next_replay:
+                    next_replay = now + self.replay_interval
+                    self._replay_one()
+                timeout = min(timeout, max(0, next_replay - loop.time()))
+
+            item = outbound.get(0)
+            if item is None:
+                self._outbound_drained.set()
+                self._outbound_ready.clear()
+                try:
+                    await asyncio.wait_for(self._outbound_ready.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            priority, topic, payload, qos, retain = item
+            if not self._publish(topic, payload, qos, retain):
+                if priority:
+                    # Retry after reconnect unless a newer value for the topic is queued
+                    outbound.put_front(item, topic)
+                elif self.spool is not None:
+                    self.spool.append(topic, payload)
+                await asyncio.sleep(self.poll_interval)
+                continue
+            if len(outbound) <= outbound.maxsize // 2:
+                self._outbound_drained.set()
+            await asyncio.sleep(0)
+
+    async def _periodic_task(self, interval, callback):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                callback()
+            except Exception as e:
+                self.logger.error("Error in periodic task %s: %s", callback.__name__, e, exc_info=True)
+
+
+class AsyncMqttLoop:
+    """Runs a paho client on an asyncio loop via on_socket_* hooks instead of loop_forever().
+
+    Connecting (DNS and TCP connect block in paho) happens in the default
+    executor; socket registration is marshalled back to the loop thread.
+    Reconnects back off exponentially up to max_delay seconds.
+    """
+
+    MISC_INTERVAL = 1
+
+    def __init__(self, client, max_delay=120):
+        self.client = client
+        self.max_delay = max_delay
+        self.logger = logging.getLogger(__name__)
+        self._loop = None
+        self._loop_thread = None
+        self._closed = None
+        self._established = False
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    def _call(self, callback, *args):
+        if threading.get_ident() == self._loop_thread:
+            callback(*args)
+        else:
+            self._loop.call_soon_threadsafe(callback, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._call(self._loop.add_reader, sock, client.loop_read)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._call(self._socket_closed, sock)
+
+    def _socket_closed(self, sock):
+        self._loop.remove_reader(sock)
+        self._loop.remove_writer(sock)
+        self._closed.set()
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._call(self._loop.add_writer, sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._call(self._loop.remove_writer, sock)
+
+    async def _misc(self):
+        """Keepalive pings and timeouts, which loop_forever() would otherwise handle."""
+        while True:
+            await asyncio.sleep(self.MISC_INTERVAL)
+            self.client.loop_misc()
+            if self.client.is_connected():
+                self._established = True
+
+    async def run(self, host, port, keepalive=60):
+        """Connect, and reconnect whenever the socket closes, until cancelled."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._closed = asyncio.Event()
+        delay = 1
+        while True:
+            self._closed.clear()
+            self._established = False
+            try:
+                await self._loop.run_in_executor(None, self.client.connect, host, port, keepalive)
+            except (OSError, ValueError) as e:
+                self.logger.warning("Connection to %s:%s failed: %s - retrying in %ss", host, port, e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_delay)
+                continue
+
+            misc = self._loop.create_task(self._misc())
+            try:
+                await self._closed.wait()
+            finally:
+                misc.cancel()
+            if self._established:
+                # The connection was up before it dropped, start over with a short delay
+                delay = 1
+            self.logger.warning("Connection to %s:%s closed - reconnecting in %ss", host, port, delay)
+            await asyncio.sleep(delay)
+            if not self._established:
+                delay = min(delay * 2, self.max_delay)
@@ -0,0 +1,104 @@
+"""
+Per-BMS availability driven by one shared timer wheel.
+
+Every BMS has a single entry on the wheel, due when it would time out. A
+frame only records its arrival time; when the entry comes due and the BMS
+has been heard from since, the entry is moved to its new deadline instead
+of being fired. The cost per frame is a dict store whatever the number of
+BMS, and the periodic check only touches the wheel slots that elapsed.
+"""
+
+import math
+import time
+
+
+class TimerWheel:
+    """Hashed timing wheel with resolution-second slots covering horizon seconds."""
+
+    def __init__(self, resolution, horizon, start):
+        self.resolution = resolution
+        self.slots = [[] for _ in range(int(math.ceil(horizon / resolution)) + 1)]
+        self.current = int(start // resolution)
+
+    def schedule(self, key, when):
+        """Fire key at the advance() that reaches the slot of when (at most horizon ahead).
+
+        The key may fire up to one resolution early; callers check the actual
+        deadline and schedule again if it has not passed yet.
+        """
+        tick = max(int(when // self.resolution), self.current + 1)
+        self.slots[tick % len(self.slots)].append((tick, key))
+
+    def advance(self, now):
+        """Move the wheel to now and return the keys that came due."""
+        target = int(now // self.resolution)
+        fired = []
+        slot_count = len(self.slots)
+        for step in range(1, min(target - self.current, slot_count) + 1):
+            slot = self.slots[(self.current + step) % slot_count]
+            if not slot:
+                continue
+            pending = []
+            for entry in slot:
+                if entry[0] <= target:
+                    fired.append(entry[1])
+                else:
+                    pending.append(entry)
+            slot[:] = pending
+        self.current = max(self.current, target)
+        return fired
+
+
+class AvailabilityTracker:
+    """online / offline state of every BMS, offline after timeout seconds without a frame."""
+
+    def __init__(self, timeout=60, clock=time.monotonic):
+        self.timeout = timeout
+        self.clock = clock
+        self.wheel = TimerWheel(1, timeout, clock())
+        # bms id -> True (online), False (offline) or None (not heard from in this run)
+        self.status = {}
+        self._last_seen = {}
+
+    @property
+    def online(self):
+        return sum(1 for online in self.status.values() if online)
+
+    def watch(self, bms_id):
+        """Track a BMS known from an earlier run: it goes offline unless it reports within timeout."""
+        if bms_id not in self.status:
+            self.status[bms_id] = None
+            self._schedule(bms_id, self.clock())
+
+    def seen(self, bms_id):
+        """Record a frame; True if the BMS was not online before."""
+        now = self.clock()
+        status = self.status.get(bms_id, False)
+        if status is True:
+            self._last_seen[bms_id] = now
+            return False
+        if status is None:
+            self._last_seen[bms_id] = now
+        else:
+            # New, or back from offline: the wheel holds no entry for it
+            self._schedule(bms_id, now)
+        self.status[bms_id] = True
+        return True
+
+    def _schedule(self, bms_id, now):
+        self._last_seen[bms_id] = now
+        self.wheel.schedule(bms_id, now + self.timeout)
+
+    def expire(self):
+        """BMS that just went offline."""
+        now = self.clock()
+        offline = []
+        for bms_id in self.wheel.advance(now):
+            deadline = self._last_seen[bms_id] + self.timeout
+            if deadline > now:
+                self.wheel.schedule(bms_id, deadline)
+                continue
+            if self.status[bms_id] is not False:
+                self.status[bms_id] = False
+                offline.append(bms_id)
+        return offline
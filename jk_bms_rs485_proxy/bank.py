@@ -0,0 +1,187 @@
+"""
+Virtual battery bank summarising all BMS of parallel packs.
+
+Totals are kept as running sums: a frame replaces its pack's previous
+contribution, so an update costs the same whatever the number of packs.
+Bank-wide extremes (min/max cell voltage, hottest pack) are tracked
+incrementally as well and only recomputed across packs when the pack that
+held an extreme moves away from it. Packs silent for longer than
+stale_after seconds are taken out of the bank until they report again.
+"""
+
+import collections
+import time
+
+import jk02_decoder
+
+BANK_ID = "bank"
+ALARM_BITS = len(jk02_decoder.ALARM_NAMES)
+
+
+class _Pack:
+    __slots__ = ("voltage", "current", "power", "soc", "cap_remaining", "cap_total",
+                 "cell_min", "cell_min_index", "cell_max", "cell_max_index", "temp_max", "alarm_mask")
+
+    def __init__(self, state, alarm_mask):
+        self.voltage = state["bat_voltage"]
+        self.current = state["bat_current"]
+        self.power = state["bat_power"]
+        self.soc = state["soc"]
+        self.cap_remaining = state["cap_remaining"]
+        self.cap_total = state["cap_total"]
+        self.cell_min_index = state["cell_min_index"]
+        self.cell_max_index = state["cell_max_index"]
+        self.cell_min = state.get(f"cv{self.cell_min_index:02d}", state["cell_avg_volt"])
+        self.cell_max = state.get(f"cv{self.cell_max_index:02d}", state["cell_avg_volt"])
+        self.temp_max = max(state["temp_mos"], state["temp1"], state["temp2"], state["temp3"], state["temp4"])
+        self.alarm_mask = alarm_mask
+
+
+class BankAggregator:
+    """Running bank totals over the online packs."""
+
+    def __init__(self, stale_after=60, clock=time.monotonic):
+        self.stale_after = stale_after
+        self.clock = clock
+        self.packs = {}
+        self.stale = set()
+        self.dirty = False
+        # bms id -> last update, oldest first, so expiry only looks at the front
+        self._seen = collections.OrderedDict()
+        self._voltage = 0.0
+        self._current = 0.0
+        self._power = 0.0
+        self._soc_weighted = 0.0
+        self._cap_remaining = 0.0
+        self._cap_total = 0.0
+        self._alarm_counts = [0] * ALARM_BITS
+        self._alarm_mask = 0
+        # bms id holding each extreme, None when it has to be recomputed
+        self._min_id = None
+        self._max_id = None
+        self._temp_id = None
+
+    def update(self, bms_id, state, alarm_mask):
+        """Replace the contribution of one pack with its latest decoded state."""
+        pack = _Pack(state, alarm_mask)
+        previous = self.packs.get(bms_id)
+        if previous is not None:
+            self._subtract(previous)
+            self._update_alarms(previous.alarm_mask, alarm_mask)
+        else:
+            self._update_alarms(0, alarm_mask)
+            self.stale.discard(bms_id)
+        self.packs[bms_id] = pack
+        self._add(pack)
+        self._track_extremes(bms_id, pack, previous)
+
+        self._seen[bms_id] = self.clock()
+        self._seen.move_to_end(bms_id)
+        self.dirty = True
+
+    def _add(self, pack):
+        self._voltage += pack.voltage
+        self._current += pack.current
+        self._power += pack.power
+        self._soc_weighted += pack.soc * pack.cap_total
+        self._cap_remaining += pack.cap_remaining
+        self._cap_total += pack.cap_total
+
+    def _subtract(self, pack):
+        self._voltage -= pack.voltage
+        self._current -= pack.current
+        self._power -= pack.power
+        self._soc_weighted -= pack.soc * pack.cap_total
+        self._cap_remaining -= pack.cap_remaining
+        self._cap_total -= pack.cap_total
+
+    def _update_alarms(self, old_mask, new_mask):
+        changed = old_mask ^ new_mask
+        counts = self._alarm_counts
+        while changed:
+            bit = (changed & -changed).bit_length() - 1
+            changed &= changed - 1
+            if new_mask >> bit & 1:
+                counts[bit] += 1
+                self._alarm_mask |= 1 << bit
+            else:
+                counts[bit] -= 1
+                if not counts[bit]:
+                    self._alarm_mask &= ~(1 << bit)
+
+    def _track_extremes(self, bms_id, pack, previous):
+        packs = self.packs
+        if self._min_id is not None:
+            if pack.cell_min < packs[self._min_id].cell_min:
+                self._min_id = bms_id
+            elif bms_id == self._min_id and previous is not None and pack.cell_min > previous.cell_min:
+                self._min_id = None
+        if self._max_id is not None:
+            if pack.cell_max > packs[self._max_id].cell_max:
+                self._max_id = bms_id
+            elif bms_id == self._max_id and previous is not None and pack.cell_max < previous.cell_max:
+                self._max_id = None
+        if self._temp_id is not None:
+            if pack.temp_max > packs[self._temp_id].temp_max:
+                self._temp_id = bms_id
+            elif bms_id == self._temp_id and previous is not None and pack.temp_max < previous.temp_max:
+                self._temp_id = None
+
+    def expire(self):
+        """Take packs out of the bank that have not reported for stale_after seconds."""
+        deadline = self.clock() - self.stale_after
+        expired = []
+        while self._seen:
+            bms_id, seen = next(iter(self._seen.items()))
+            if seen > deadline:
+                break
+            del self._seen[bms_id]
+            pack = self.packs.pop(bms_id)
+            self._subtract(pack)
+            self._update_alarms(pack.alarm_mask, 0)
+            if bms_id in (self._min_id, self._max_id, self._temp_id):
+                self._min_id = self._max_id = self._temp_id = None
+            self.stale.add(bms_id)
+            self.dirty = True
+            expired.append(bms_id)
+        return expired
+
+    def _rescan(self):
+        items = self.packs.items()
+        if self._min_id is None:
+            self._min_id = min(items, key=lambda item: item[1].cell_min)[0]
+        if self._max_id is None:
+            self._max_id = max(items, key=lambda item: item[1].cell_max)[0]
+        if self._temp_id is None:
+            self._temp_id = max(items, key=lambda item: item[1].temp_max)[0]
+
+    def snapshot(self):
+        """The bank state dict, or None when no pack is online."""
+        self.dirty = False
+        online = len(self.packs)
+        if not online:
+            return None
+        self._rescan()
+        lowest = self.packs[self._min_id]
+        highest = self.packs[self._max_id]
+        cap_total = self._cap_total
+        return {
+            "bat_voltage": round(self._voltage / online, 3),
+            "bat_current": round(self._current, 3),
+            "bat_power": round(self._power, 3),
+            "soc": round(self._soc_weighted / cap_total, 1) if cap_total > 0 else 0,
+            "cap_remaining": round(self._cap_remaining, 3),
+            "cap_total": round(cap_total, 3),
+            "cell_min_volt": lowest.cell_min,
+            "cell_min_bms": self._min_id,
+            "cell_min_index": lowest.cell_min_index,
+            "cell_max_volt": highest.cell_max,
+            "cell_max_bms": self._max_id,
+            "cell_max_index": highest.cell_max_index,
+            "temp_max": self.packs[self._temp_id].temp_max,
+            "temp_max_bms": self._temp_id,
+            "packs_online": online,
+            "packs_stale": len(self.stale),
+            "alarm": "ON" if self._alarm_mask else "OFF",
+            "alarms": jk02_decoder.alarm_names(self._alarm_mask),
+        }
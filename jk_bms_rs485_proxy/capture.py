@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Binary capture of raw topic_tx payloads and time-accurate replay.
+
+Capture file layout (optionally gzip compressed):
+    header:  b"JKCAP" version:u8 start_time:f64   (wall clock, seconds)
+    record:  offset_ns:u64 topic_len:u16 payload_len:u32 topic payload
+where offset_ns is the monotonic time since the file was opened.
+
+Replay a capture through the decoder without a broker:
+    python3 capture.py capture.jkcap --speed 10 --topic-tx "rs485tx/+/tx"
+or publish its raw payloads to a (local) broker for a running proxy:
+    python3 capture.py capture.jkcap --broker localhost:1883 --speed 1
+"""
+
+import argparse
+import collections
+import gzip
+import logging
+import os
+import struct
+import sys
+import time
+
+MAGIC = b"JKCAP"
+VERSION = 1
+_HEADER = struct.Struct("<5sBd")
+_RECORD = struct.Struct("<QHI")
+
+
+class CaptureWriter:
+    """Appends raw payloads to a capture file, rotating at max_bytes."""
+
+    def __init__(self, path, max_bytes=0, backup_count=5, compress=False, start_ns=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+        self.records = 0
+        self.logger = logging.getLogger(__name__)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = None
+        self._open(start_ns)
+
+    def _open(self, start_ns=None):
+        """Start a file; start_ns back-dates it for payloads received before it was opened."""
+        opener = gzip.open if self.compress else open
+        self._file = opener(self.path, "wb")
+        now = time.monotonic_ns()
+        self._start = now if start_ns is None else start_ns
+        self._written = _HEADER.size
+        self._file.write(_HEADER.pack(MAGIC, VERSION, time.time() - (now - self._start) / 1e9))
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self._open()
+
+    def write(self, topic, payload, timestamp_ns=None):
+        """Record one payload; timestamp_ns is a time.monotonic_ns() value."""
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+        topic = topic.encode() if isinstance(topic, str) else topic
+        offset = max(0, timestamp_ns - self._start)
+        self._file.write(_RECORD.pack(offset, len(topic), len(payload)))
+        self._file.write(topic)
+        self._file.write(payload)
+        self._written += _RECORD.size + len(topic) + len(payload)
+        self.records += 1
+        if self.max_bytes and self._written >= self.max_bytes:
+            self._rotate()
+
+    def flush(self):
+        """Make everything written so far readable, even if the file is never closed."""
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_capture(path):
+    """Yield (offset_seconds, topic, payload) records from a capture file."""
+    with open(path, "rb") as probe:
+        compressed = probe.read(2) == b"\x1f\x8b"
+    opener = gzip.open if compressed else open
+    with opener(path, "rb") as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+        magic, version, _ = _HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a JK-BMS capture file")
+        while True:
+            try:
+                record = f.read(_RECORD.size)
+                if len(record) < _RECORD.size:
+                    return
+                offset, topic_length, payload_length = _RECORD.unpack(record)
+                topic = f.read(topic_length)
+                payload = f.read(payload_length)
+            except EOFError:
+                # A gzip stream that was never closed (crash or kill) ends without
+                # its end marker; everything flushed before that is still readable
+                return
+            if len(payload) < payload_length:
+                # Truncated by a crash while writing
+                return
+            yield offset / 1e9, topic.decode(), payload
+
+
+def paced(records, speed):
+    """Re-emit records at their captured pace divided by speed (0 = as fast as possible)."""
+    started = None
+    for offset, topic, payload in records:
+        if speed > 0:
+            now = time.monotonic()
+            if started is None:
+                started = now - offset / speed
+            delay = started + offset / speed - now
+            if delay > 0:
+                time.sleep(delay)
+        yield topic, payload
+
+
+class _PublishResult:
+    rc = 0
+
+    def __init__(self, mid):
+        self.mid = mid
+
+
+class NullMQTTClient:
+    """Stands in for paho when replaying without a broker; counts publishes."""
+
+    def __init__(self, echo=False):
+        self.echo = echo
+        self.published = 0
+        self.bytes = 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.published += 1
+        self.bytes += len(payload or b"")
+        if self.echo:
+            print(topic, payload if isinstance(payload, str) else payload.decode(errors="replace"))
+        return _PublishResult(self.published)
+
+    def subscribe(self, *args, **kwargs):
+        pass
+
+    def message_callback_add(self, *args, **kwargs):
+        pass
+
+
+def replay_decode(paths, speed, echo=False, topic_tx="rs485tx/tx"):
+    """Feed captures through the proxy's decoder with publishing stubbed out.
+
+    Every record is decoded as received on its captured topic, namespaced
+    by topic_tx exactly as the live proxy would; records whose topic does
+    not match topic_tx are skipped, as the proxy never subscribed to them.
+    """
+    from rs485_mqtt_ha_proxy import RS485MQTTClient
+
+    proxy = RS485MQTTClient("replay", 0, "", "", topic_tx, "homeassistant", "rs485tx/bms")
+    proxy.client = NullMQTTClient(echo)
+    proxy.discovery.attach(proxy.client)
+    # Nothing acknowledges publishes here, so do not wait for PUBACKs
+    proxy.discovery.qos = 0
+    outbound = proxy.pipeline.outbound
+
+    frames = 0
+    skipped = collections.Counter()
+    started = time.perf_counter()
+    for path in paths:
+        for topic, payload in paced(read_capture(path), speed):
+            if not proxy.sources.matches(topic):
+                skipped[topic] += 1
+                continue
+            proxy.process_payload((topic, payload, time.monotonic_ns()))
+            frames += 1
+            while True:
+                item = outbound.get(0)
+                if item is None:
+                    break
+                _, out_topic, out_payload, qos, retain = item
+                proxy.safe_publish(out_topic, out_payload, qos, retain)
+    elapsed = time.perf_counter() - started
+    counters = dict(proxy.reassembler.counters)
+    print(f"Replayed {frames} payloads in {elapsed:.3f}s ({frames / elapsed if elapsed else 0:.0f}/s), "
+          f"{proxy.client.published} publishes, {proxy.client.bytes} bytes, reassembler {counters}")
+    for topic, count in skipped.items():
+        print(f"Skipped {count} payloads on {topic}, which does not match topic_tx {topic_tx}", file=sys.stderr)
+
+
+def replay_broker(paths, speed, host, port, username=None, password=None, topic=None):
+    """Publish captured raw payloads to a broker so a running proxy consumes them."""
+    import paho.mqtt.client as mqtt
+
+    client = mqtt.Client()
+    if username:
+        client.username_pw_set(username, password)
+    client.connect(host, port, 60)
+    client.loop_start()
+    count = 0
+    try:
+        for path in paths:
+            for captured_topic, payload in paced(read_capture(path), speed):
+                client.publish(topic or captured_topic, payload)
+                count += 1
+    finally:
+        client.loop_stop()
+        client.disconnect()
+    print(f"Published {count} payloads to {host}:{port}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay JK-BMS RS485 capture files")
+    parser.add_argument("paths", nargs="+", help="capture files, replayed in the given order")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor, 0 = as fast as possible")
+    parser.add_argument("--broker", help="host:port to publish the raw payloads to instead of decoding in-process")
+    parser.add_argument("--username")
+    parser.add_argument("--password")
+    parser.add_argument("--topic", help="override the captured topic when publishing to a broker")
+    parser.add_argument("--topic-tx", default=os.getenv("TOPIC_TX", "rs485tx/tx"),
+                        help="the add-on's topic_tx, used to namespace captured topics when decoding (default: $TOPIC_TX or rs485tx/tx)")
+    parser.add_argument("--echo", action="store_true", help="print decoded messages")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    if args.broker:
+        host, _, port = args.broker.partition(":")
+        replay_broker(args.paths, args.speed, host, int(port or 1883), args.username, args.password, args.topic)
+    else:
+        replay_decode(args.paths, args.speed, args.echo, args.topic_tx)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+Compact, versioned output stream for machine consumers.
+
+Records are positional arrays of the raw integers from the frame, encoded as
+compact JSON, MessagePack or CBOR, and are built straight from the frame
+without going through the Home Assistant state dict:
+
+    cell info: [1, 2, timestamp_ms, <CELL_INFO fields>..., balancing_mode, alarm_mask, [cell mV], [cell resistance]]
+    settings:  [1, 1, timestamp_ms, <SETTINGS fields>...]
+
+Field names, scales and offsets (value = raw * scale + offset) are published
+retained as JSON on {topic}/schema; records go to {topic}/{bms id}.
+"""
+
+import json
+import struct
+import time
+
+import jk02_decoder
+
+SCHEMA_VERSION = 1
+FORMATS = ("json", "msgpack", "cbor")
+
+_BALANCING_MODE_OFFSET = jk02_decoder.BALANCING_MODE_OFFSET
+
+
+def pack_msgpack(value):
+    """MessagePack encoding of ints, floats, strings, bytes, lists, dicts, bools and None."""
+    out = bytearray()
+    _msgpack(value, out)
+    return bytes(out)
+
+
+def _msgpack(value, out):
+    if value is None:
+        out.append(0xC0)
+    elif value is True or value is False:
+        out.append(0xC3 if value else 0xC2)
+    elif isinstance(value, int):
+        if value >= 0:
+            if value < 0x80:
+                out.append(value)
+            elif value < 0x100:
+                out += struct.pack(">BB", 0xCC, value)
+            elif value < 0x10000:
+                out += struct.pack(">BH", 0xCD, value)
+            elif value < 0x100000000:
+                out += struct.pack(">BI", 0xCE, value)
+            else:
+                out += struct.pack(">BQ", 0xCF, value)
+        elif value >= -32:
+            out.append(value & 0xFF)
+        elif value >= -0x80:
+            out += struct.pack(">Bb", 0xD0, value)
+        elif value >= -0x8000:
+            out += struct.pack(">Bh", 0xD1, value)
+        elif value >= -0x80000000:
+            out += struct.pack(">Bi", 0xD2, value)
+        else:
+            out += struct.pack(">Bq", 0xD3, value)
+    elif isinstance(value, float):
+        out += struct.pack(">Bd", 0xCB, value)
+    elif isinstance(value, (list, tuple)):
+        length = len(value)
+        if length < 16:
+            out.append(0x90 | length)
+        else:
+            out += struct.pack(">BI", 0xDD, length)
+        for item in value:
+            _msgpack(item, out)
+    elif isinstance(value, dict):
+        length = len(value)
+        if length < 16:
+            out.append(0x80 | length)
+        else:
+            out += struct.pack(">BI", 0xDF, length)
+        for key, item in value.items():
+            _msgpack(key, out)
+            _msgpack(item, out)
+    elif isinstance(value, str):
+        data = value.encode()
+        if len(data) < 32:
+            out.append(0xA0 | len(data))
+        else:
+            out += struct.pack(">BI", 0xDB, len(data))
+        out += data
+    elif isinstance(value, (bytes, bytearray)):
+        out += struct.pack(">BI", 0xC6, len(value))
+        out += value
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__} as MessagePack")
+
+
+def pack_cbor(value):
+    """CBOR (RFC 8949) encoding of the same types as pack_msgpack."""
+    out = bytearray()
+    _cbor(value, out)
+    return bytes(out)
+
+
+def _cbor_head(major, length, out):
+    major <<= 5
+    if length < 24:
+        out.append(major | length)
+    elif length < 0x100:
+        out += struct.pack(">BB", major | 24, length)
+    elif length < 0x10000:
+        out += struct.pack(">BH", major | 25, length)
+    elif length < 0x100000000:
+        out += struct.pack(">BI", major | 26, length)
+    else:
+        out += struct.pack(">BQ", major | 27, length)
+
+
+def _cbor(value, out):
+    if value is None:
+        out.append(0xF6)
+    elif value is True or value is False:
+        out.append(0xF5 if value else 0xF4)
+    elif isinstance(value, int):
+        if value >= 0:
+            _cbor_head(0, value, out)
+        else:
+            _cbor_head(1, -1 - value, out)
+    elif isinstance(value, float):
+        out += struct.pack(">Bd", 0xFB, value)
+    elif isinstance(value, (list, tuple)):
+        _cbor_head(4, len(value), out)
+        for item in value:
+            _cbor(item, out)
+    elif isinstance(value, dict):
+        _cbor_head(5, len(value), out)
+        for key, item in value.items():
+            _cbor(key, out)
+            _cbor(item, out)
+    elif isinstance(value, str):
+        data = value.encode()
+        _cbor_head(3, len(data), out)
+        out += data
+    elif isinstance(value, (bytes, bytearray)):
+        _cbor_head(2, len(value), out)
+        out += value
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__} as CBOR")
+
+
+def _pack_json(value):
+    return json.dumps(value, separators=(",", ":"))
+
+
+_ENCODERS = {"json": _pack_json, "msgpack": pack_msgpack, "cbor": pack_cbor}
+
+
+def _field_schema(fields):
+    schema = []
+    for key, _, _, kind, scale, extra in fields:
+        if kind == jk02_decoder.SCALED:
+            schema.append([key, scale, 0])
+        elif kind == jk02_decoder.INTEGER:
+            schema.append([key, 1, extra])
+        else:
+            schema.append([key, 1, 0])
+    return schema
+
+
+def schema(encoding):
+    """The JSON-serialisable description of the record layouts."""
+    return {
+        "version": SCHEMA_VERSION,
+        "encoding": encoding,
+        "header": ["version", "frame_type", "timestamp_ms"],
+        "cell_info": (
+            _field_schema(jk02_decoder.CELL_INFO_HEAD_FIELDS + jk02_decoder.CELL_INFO_FIELDS)
+            + [["balancing_mode", 1, 0], ["alarm_mask", 1, 0],
+               ["cell_voltages", jk02_decoder.CELL_SCALE, 0], ["cell_resistances", jk02_decoder.CELL_SCALE, 0]]
+        ),
+        "settings": _field_schema(jk02_decoder.SETTINGS_FIELDS),
+    }
+
+
+class CompactEncoder:
+    """Encodes frames into compact records; one instance per output stream."""
+
+    def __init__(self, topic, encoding="json", clock=time.time):
+        if encoding not in _ENCODERS:
+            raise ValueError(f"Unknown compact encoding '{encoding}', expected one of {FORMATS}")
+        self.topic = topic
+        self.encoding = encoding
+        self.encode = _ENCODERS[encoding]
+        self.clock = clock
+
+    def schema_message(self):
+        return f"{self.topic}/schema", json.dumps(schema(self.encoding), separators=(",", ":"))
+
+    def topic_for(self, bms_id):
+        return f"{self.topic}/{bms_id}"
+
+    def cell_info(self, payload, cell_count):
+        buffer = memoryview(payload)
+        record = [SCHEMA_VERSION, jk02_decoder.FRAME_TYPE_CELL_INFO, int(self.clock() * 1000)]
+        record += jk02_decoder.CELL_INFO_HEAD_LAYOUT.unpack(buffer)
+        record += jk02_decoder.CELL_INFO_LAYOUT.unpack(buffer)
+        record.append(payload[_BALANCING_MODE_OFFSET])
+        record.append(jk02_decoder.read_alarm_mask(buffer))
+        if cell_count > 0:
+            cells = jk02_decoder.cell_struct(cell_count)
+            record.append(cells.unpack_from(buffer, jk02_decoder.CELL_VOLTAGE_OFFSET))
+            record.append(cells.unpack_from(buffer, jk02_decoder.CELL_RESISTANCE_OFFSET))
+        else:
+            record += ((), ())
+        return self.encode(record)
+
+    def settings(self, payload):
+        record = [SCHEMA_VERSION, jk02_decoder.FRAME_TYPE_SETTINGS, int(self.clock() * 1000)]
+        record += jk02_decoder.SETTINGS_LAYOUT.unpack(memoryview(payload))
+        return self.encode(record)
@@ -0,0 +1,130 @@
+"""
+Forensics for bad frames: sampled raw-frame tracing and a crash ring buffer.
+
+FrameTracer logs the hex dump of a sample of the decoded frames, with a
+sample rate per BMS id:
+
+    trace_frames: "01=1, roomA/02=0.1, *=0.01"
+
+traces every frame of BMS #01, every 10th of roomA #02 and every 100th of
+all others. CrashRing keeps references to the last raw payloads and writes
+them as a capture file (see capture.py) together with the traceback when
+decoding raises, so the failure can be replayed with
+
+    python3 capture.py /share/jk_bms_rs485_proxy/crash/crash-<time>.jkcap
+"""
+
+import collections
+import datetime
+import glob
+import logging
+import os
+import time
+
+from capture import CaptureWriter
+
+
+def parse_trace_rates(spec):
+    """'01=1, *=0.01' -> {'01': 1.0, '*': 0.01}."""
+    rates = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        bms_id, separator, rate = item.rpartition("=")
+        if not separator or not bms_id.strip():
+            raise ValueError(f"Invalid trace_frames entry '{item}', expected <bms id>=<rate>")
+        rate = float(rate)
+        if not 0 <= rate <= 1:
+            raise ValueError(f"Invalid trace_frames rate in '{item}', expected a value from 0 to 1")
+        rates[bms_id.strip()] = rate
+    return rates
+
+
+class _HexDump:
+    """Formats a payload only if the log record is actually emitted."""
+    __slots__ = ("payload",)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __str__(self):
+        return bytes(self.payload).hex(" ")
+
+
+class FrameTracer:
+    """Logs every Nth frame of a BMS, N = 1 / its sample rate."""
+
+    def __init__(self, rates):
+        self.rates = dict(rates)
+        self.logger = logging.getLogger("frames")
+        self._every = {}
+        self._counts = collections.Counter()
+
+    def _interval(self, bms_id):
+        rate = self.rates.get(bms_id, self.rates.get("*", 0.0))
+        # From a rate of 2, round() would give an interval of 0, which disables tracing
+        return max(1, round(1 / rate)) if rate > 0 else 0
+
+    def trace(self, bms_id, frame_type, payload):
+        every = self._every.get(bms_id)
+        if every is None:
+            every = self._every[bms_id] = self._interval(bms_id)
+        if not every:
+            return
+        count = self._counts[bms_id]
+        self._counts[bms_id] = count + 1
+        if count % every == 0:
+            self.logger.info("BMS #%s frame type %s, %d bytes: %s", bms_id, frame_type, len(payload), _HexDump(payload))
+
+
+class CrashRing:
+    """The last size raw payloads, dumped to directory when decoding fails.
+
+    Dumps are at most one per min_interval seconds, and only the newest
+    max_dumps are kept.
+    """
+
+    def __init__(self, size, directory, min_interval=60, max_dumps=20, clock=time.monotonic):
+        self.payloads = collections.deque(maxlen=size)
+        self.directory = directory
+        self.min_interval = min_interval
+        self.max_dumps = max_dumps
+        self.clock = clock
+        self.dumps = 0
+        self.logger = logging.getLogger(__name__)
+        self._last_dump = None
+
+    def add(self, source, payload, received_ns):
+        self.payloads.append((source, payload, received_ns))
+
+    def dump(self, error_text):
+        """Write the ring and error_text to a new capture file; returns its path or None."""
+        now = self.clock()
+        if not self.payloads or (self._last_dump is not None and now - self._last_dump < self.min_interval):
+            return None
+        self._last_dump = now
+        name = datetime.datetime.now().strftime("crash-%Y%m%d-%H%M%S-%f")
+        path = os.path.join(self.directory, f"{name}.jkcap")
+        try:
+            writer = CaptureWriter(path, start_ns=self.payloads[0][2])
+            for source, payload, received_ns in self.payloads:
+                writer.write(source, payload, received_ns)
+            writer.close()
+            with open(os.path.join(self.directory, f"{name}.txt"), "w") as f:
+                f.write(error_text)
+        except OSError as e:
+            self.logger.error("Cannot write crash dump %s: %s", path, e)
+            return None
+        self.dumps += 1
+        self._prune()
+        return path
+
+    def _prune(self):
+        captures = sorted(glob.glob(os.path.join(self.directory, "crash-*.jkcap")))
+        for path in captures[:-self.max_dumps]:
+            for stale in (path, path[:-len(".jkcap")] + ".txt"):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
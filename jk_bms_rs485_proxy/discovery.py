@@ -0,0 +1,178 @@
+"""
+Home Assistant discovery publishing: cached, retained, diff-checked and paced.
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import threading
+
+import paho.mqtt.client as mqtt
+
+NODE_PREFIX = "jk_bms_"
+
+
+def config_hash(payload):
+    if isinstance(payload, str):
+        payload = payload.encode()
+    return hashlib.blake2b(payload, digest_size=8).digest()
+
+
+class DiscoveryManager:
+    """Publishes discovery configs retained, only when their content changed.
+
+    Retained configs already on the broker are read back after connecting,
+    so a restart does not republish unchanged entities. Only the nodes of
+    this add-on are subscribed (one subscription per known node id), and
+    the subscriptions are dropped again by finish_readback().
+    Publishing goes through a bounded in-flight window which is refilled from
+    on_publish(), keeping a registration burst from stalling state traffic.
+    """
+
+    def __init__(self, topic_registration, max_in_flight=10, qos=1):
+        self.topic_registration = topic_registration
+        self.max_in_flight = max_in_flight
+        self.qos = qos
+        self.client = None
+        self.logger = logging.getLogger(__name__)
+        self._payloads = {}
+        self._known = {}
+        self._pending = collections.deque()
+        self._queued = set()
+        self._in_flight = set()
+        self._early_acks = set()
+        self._sending = 0
+        self._readback = []
+        self._lock = threading.Lock()
+
+    def readback_topic(self, node="+"):
+        return f"{self.topic_registration}/+/{node}/+/config"
+
+    def attach(self, client):
+        self.client = client
+        client.message_callback_add(self.readback_topic(), self.on_retained_message)
+
+    def on_connect(self, client, nodes=()):
+        """Read back the retained configs of nodes and resume publishing after a reconnect.
+
+        Nodes published during this run are read back as well. Returns True
+        if a readback subscription was made.
+        """
+        with self._lock:
+            nodes = set(nodes)
+            nodes.update(topic.rsplit("/", 3)[-3] for topic in self._payloads)
+        self._readback = [self.readback_topic(node) for node in sorted(nodes)]
+        if self._readback:
+            client.subscribe([(topic, self.qos) for topic in self._readback])
+        with self._lock:
+            # Unacknowledged messages are resent by paho itself
+            self._in_flight.clear()
+        self._pump()
+        return bool(self._readback)
+
+    def finish_readback(self, client):
+        """Unsubscribe from the configs once the broker has delivered the retained ones."""
+        if self._readback:
+            client.unsubscribe(self._readback)
+            self._readback = []
+
+    def on_retained_message(self, client, userdata, msg):
+        node = msg.topic.rsplit("/", 3)[-3]
+        if not node.startswith(NODE_PREFIX):
+            return
+        with self._lock:
+            self._known[msg.topic] = config_hash(msg.payload)
+
+    def publish(self, topic, config):
+        """Queue a config dict for publishing unless the broker already has it."""
+        payload = json.dumps(config, separators=(",", ":"), ensure_ascii=False)
+        digest = config_hash(payload)
+        with self._lock:
+            self._payloads[topic] = payload
+            if self._known.get(topic) == digest:
+                return
+            self._known[topic] = digest
+            if topic in self._queued:
+                return
+            self._queued.add(topic)
+            self._pending.append(topic)
+        self._pump()
+
+    def remove(self, topic):
+        """Queue an empty retained config, which deletes the entity in Home Assistant."""
+        with self._lock:
+            if topic not in self._payloads and topic not in self._known:
+                return
+            self._payloads[topic] = ""
+            self._known.pop(topic, None)
+            if topic in self._queued:
+                return
+            self._queued.add(topic)
+            self._pending.append(topic)
+        self._pump()
+
+    def digest(self, node):
+        """Hash over the configs currently published for a discovery node id."""
+        h = hashlib.blake2b(digest_size=8)
+        with self._lock:
+            for topic in sorted(t for t, payload in self._payloads.items() if payload and t.rsplit("/", 3)[-3] == node):
+                h.update(topic.encode())
+                h.update(self._payloads[topic].encode())
+        return h.hexdigest()
+
+    def on_publish(self, client, userdata, mid):
+        with self._lock:
+            if mid not in self._in_flight:
+                if self._sending:
+                    # Acknowledged before _pump() got to record the mid
+                    self._early_acks.add(mid)
+                return
+            self._in_flight.discard(mid)
+        self._pump()
+
+    @property
+    def pending(self):
+        """Configs waiting to be published."""
+        return len(self._pending)
+
+    def _pump(self):
+        # Never hold the lock while calling into paho: on_publish() runs with
+        # paho's internal message mutex held and would deadlock against it.
+        while True:
+            with self._lock:
+                if self.client is None or not self._pending:
+                    return
+                if len(self._in_flight) + self._sending >= self.max_in_flight:
+                    return
+                topic = self._pending.popleft()
+                self._queued.discard(topic)
+                payload = self._payloads[topic]
+                self._sending += 1
+
+            try:
+                result = self.client.publish(topic, payload, qos=self.qos, retain=True)
+            except Exception as e:
+                self.logger.error("Exception during discovery publish to %s: %s", topic, e)
+                result = None
+
+            with self._lock:
+                self._sending -= 1
+                # With qos > 0 paho keeps a message it could not send and
+                # delivers it after reconnecting; queueing it again would send it twice
+                failed = result is None or (result.rc != mqtt.MQTT_ERR_SUCCESS
+                                            and not (result.rc == mqtt.MQTT_ERR_NO_CONN and self.qos > 0))
+                if failed:
+                    # Retry once the connection is back
+                    if topic not in self._queued:
+                        self._pending.appendleft(topic)
+                        self._queued.add(topic)
+                elif self.qos > 0:
+                    if result.mid in self._early_acks:
+                        self._early_acks.discard(result.mid)
+                    else:
+                        self._in_flight.add(result.mid)
+                if not self._sending:
+                    self._early_acks.clear()
+            if failed:
+                return
@@ -0,0 +1,78 @@
+"""
+Streaming reassembly of JK02 frames from arbitrarily chunked MQTT payloads.
+
+https://github.com/txubelaxu/esphome-jk-bms/blob/main/components/jk_rs485_sniffer/jk_rs485_sniffer.cpp
+"""
+
+import collections
+
+from jk02_decoder import FRAME_HEADER, FRAME_LENGTH
+
+CHECKSUM_OFFSET = 299
+
+
+def frame_checksum_ok(frame):
+    """JK02 frames carry the 8-bit sum of bytes 0..298 at byte 299."""
+    return sum(memoryview(frame)[:CHECKSUM_OFFSET]) & 0xFF == frame[CHECKSUM_OFFSET]
+
+
+class FrameReassembler:
+    """Per-source byte buffers that yield complete, checksum-verified frames.
+
+    A payload may hold any number of frames, a frame may be split across
+    payloads, and garbage (such as the gateway's 11-byte prefix) between
+    frames is skipped by searching for the next header. The search position
+    only moves forward within a feed and consumed bytes are dropped once per
+    feed, so resyncing never rescans the buffer from the start.
+    """
+
+    def __init__(self, verify_checksum=True, on_reject=None):
+        """on_reject(source, frame) is called for every frame failing its checksum."""
+        self.verify_checksum = verify_checksum
+        self.on_reject = on_reject
+        self.counters = collections.Counter()
+        self._buffers = {}
+
+    def feed(self, source, chunk):
+        """Append a chunk for source and return the list of complete frames."""
+        buffer = self._buffers.get(source)
+        if buffer is None:
+            buffer = self._buffers[source] = bytearray()
+        buffer += chunk
+
+        frames = []
+        position = 0
+        end = len(buffer)
+        while True:
+            start = buffer.find(FRAME_HEADER, position)
+            if start < 0:
+                # Keep a possible partial header at the end
+                keep = max(position, end - (len(FRAME_HEADER) - 1))
+                self.counters["discarded_bytes"] += keep - position
+                position = keep
+                break
+            self.counters["discarded_bytes"] += start - position
+            if end - start < FRAME_LENGTH:
+                position = start
+                break
+            frame = bytes(buffer[start:start + FRAME_LENGTH])
+            if self.verify_checksum and not frame_checksum_ok(frame):
+                self.counters["bad_checksum"] += 1
+                if self.on_reject is not None:
+                    self.on_reject(source, frame)
+                # Resync on the next header after this one
+                position = start + 1
+                continue
+            frames.append(frame)
+            self.counters["frames"] += 1
+            position = start + FRAME_LENGTH
+
+        if position:
+            del buffer[:position]
+        return frames
+
+    def reset(self, source=None):
+        if source is None:
+            self._buffers.clear()
+        else:
+            self._buffers.pop(source, None)
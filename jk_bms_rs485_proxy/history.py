@@ -0,0 +1,216 @@
+"""
+In-process time-series history per BMS and field, in fixed-size array rings.
+
+Every tracked field of a BMS keeps a raw ring of the last RAW_POINTS samples
+and downsampled tiers (1 s, 1 min, 15 min) holding avg/min/max per bucket.
+Tiers are updated incrementally as samples arrive: only the open bucket is
+accumulated, and it is written to its ring slot when the next bucket starts.
+Each series has a fixed size, so the total is capped by the memory budget.
+"""
+
+import time
+from array import array
+
+RAW_POINTS = 300
+# name, bucket seconds, buckets kept
+TIERS = (
+    ("1s", 1, 600),
+    ("1m", 60, 1440),
+    ("15m", 900, 672),
+)
+TIER_NAMES = ("raw",) + tuple(name for name, _, _ in TIERS)
+
+DEFAULT_FIELDS = ("bat_voltage", "bat_current", "bat_power", "soc", "temp", "cell_volt_diff", "cv")
+
+# raw: float64 time + float32 value; tiers: int64 bucket + float32 avg/min/max
+SERIES_BYTES = RAW_POINTS * 12 + sum(capacity * 20 for _, _, capacity in TIERS)
+
+
+class _Raw:
+    __slots__ = ("times", "values", "head", "count")
+
+    def __init__(self, capacity):
+        self.times = array("d", bytes(8 * capacity))
+        self.values = array("f", bytes(4 * capacity))
+        self.head = 0
+        self.count = 0
+
+    def add(self, t, value):
+        head = self.head
+        self.times[head] = t
+        self.values[head] = value
+        self.head = (head + 1) % len(self.times)
+        if self.count < len(self.times):
+            self.count += 1
+
+    def window(self, since, until):
+        capacity = len(self.times)
+        start = (self.head - self.count) % capacity
+        times, values = [], []
+        for i in range(self.count):
+            slot = (start + i) % capacity
+            t = self.times[slot]
+            if since <= t <= until:
+                times.append(t)
+                values.append(round(self.values[slot], 4))
+        return {"t": times, "v": values}
+
+
+class _Tier:
+    __slots__ = ("resolution", "buckets", "avg", "low", "high", "current", "sum", "count", "minimum", "maximum")
+
+    def __init__(self, resolution, capacity):
+        self.resolution = resolution
+        self.buckets = array("q", [-1]) * capacity
+        self.avg = array("f", bytes(4 * capacity))
+        self.low = array("f", bytes(4 * capacity))
+        self.high = array("f", bytes(4 * capacity))
+        self.current = -1
+        self.sum = 0.0
+        self.count = 0
+        self.minimum = 0.0
+        self.maximum = 0.0
+
+    def add(self, t, value):
+        bucket = int(t // self.resolution)
+        if bucket == self.current:
+            self.sum += value
+            self.count += 1
+            if value < self.minimum:
+                self.minimum = value
+            elif value > self.maximum:
+                self.maximum = value
+            return
+        if self.count:
+            self._close()
+        self.current = bucket
+        self.sum = self.minimum = self.maximum = value
+        self.count = 1
+
+    def _close(self):
+        slot = self.current % len(self.buckets)
+        self.buckets[slot] = self.current
+        self.avg[slot] = self.sum / self.count
+        self.low[slot] = self.minimum
+        self.high[slot] = self.maximum
+
+    def window(self, since, until):
+        resolution = self.resolution
+        capacity = len(self.buckets)
+        last = int(until // resolution)
+        first = max(int(since // resolution), last - capacity + 1)
+        times, avgs, lows, highs = [], [], [], []
+        for bucket in range(first, last + 1):
+            if bucket == self.current and self.count:
+                avg, low, high = self.sum / self.count, self.minimum, self.maximum
+            else:
+                slot = bucket % capacity
+                if self.buckets[slot] != bucket:
+                    continue
+                avg, low, high = self.avg[slot], self.low[slot], self.high[slot]
+            times.append(bucket * resolution)
+            avgs.append(round(avg, 4))
+            lows.append(round(low, 4))
+            highs.append(round(high, 4))
+        return {"t": times, "avg": avgs, "min": lows, "max": highs}
+
+
+class _Series:
+    __slots__ = ("raw", "tiers")
+
+    def __init__(self):
+        self.raw = _Raw(RAW_POINTS)
+        self.tiers = tuple(_Tier(resolution, capacity) for _, resolution, capacity in TIERS)
+
+    def add(self, t, value):
+        self.raw.add(t, value)
+        for tier in self.tiers:
+            tier.add(t, value)
+
+
+class HistoryStore:
+    """Ring-buffered history of the numeric state fields matching the configured prefixes.
+
+    Series are created on first sight of a (BMS, field) pair until the
+    memory budget is used up; later series are not recorded (counted in
+    rejected). Not thread-safe: add() and query() are meant to run on the
+    decode worker.
+    """
+
+    def __init__(self, fields=DEFAULT_FIELDS, budget_bytes=32 * 1024 * 1024, clock=time.time):
+        self.prefixes = tuple(fields)
+        self.max_series = budget_bytes // SERIES_BYTES
+        self.clock = clock
+        self.rejected = 0
+        self._series = {}
+        self._tracked = {}
+
+    def _is_tracked(self, field):
+        tracked = self._tracked.get(field)
+        if tracked is None:
+            tracked = self._tracked[field] = field.startswith(self.prefixes)
+        return tracked
+
+    @property
+    def memory_bytes(self):
+        return len(self._series) * SERIES_BYTES
+
+    def add(self, bms_id, state, t=None):
+        """Record the tracked numeric fields of one decoded state."""
+        if t is None:
+            t = self.clock()
+        series = self._series
+        is_tracked = self._is_tracked
+        for field, value in state.items():
+            if not is_tracked(field) or type(value) not in (int, float):
+                continue
+            key = (bms_id, field)
+            s = series.get(key)
+            if s is None:
+                if len(series) >= self.max_series:
+                    self.rejected += 1
+                    continue
+                s = series[key] = _Series()
+            s.add(t, value)
+
+    def query(self, bms_ids, fields, tier="1m", since=None, until=None):
+        """Return {bms id: {field: window}} for the requested packs and fields.
+
+        bms_ids may contain "*" for all packs, fields may end in "*" to match
+        a prefix ("cv*" for all cell voltages). since/until are epoch
+        seconds; values <= 0 are relative to now. Raw windows are {"t": [...], "v": [...]}, tier windows carry
+        "avg", "min" and "max" lists per bucket start time "t".
+        """
+        if tier not in TIER_NAMES:
+            raise ValueError(f"Unknown tier '{tier}', expected one of {TIER_NAMES}")
+        now = self.clock()
+        since = -3600 if since is None else since
+        until = now if until is None else until
+        if since <= 0:
+            since += now
+        if until <= 0:
+            until += now
+        tier_index = TIER_NAMES.index(tier) - 1
+
+        if "*" in bms_ids:
+            bms_ids = sorted({key_bms for key_bms, _ in self._series})
+        result = {}
+        for bms_id in bms_ids:
+            windows = {}
+            for field in self._expand(bms_id, fields):
+                s = self._series.get((bms_id, field))
+                if s is None:
+                    continue
+                store = s.raw if tier_index < 0 else s.tiers[tier_index]
+                windows[field] = store.window(since, until)
+            result[bms_id] = windows
+        return result
+
+    def _expand(self, bms_id, fields):
+        """Resolve "cv*"-style prefixes against the series recorded for bms_id."""
+        for field in fields:
+            if field.endswith("*"):
+                prefix = field[:-1]
+                yield from sorted(f for key_bms, f in self._series if key_bms == bms_id and f.startswith(prefix))
+            else:
+                yield field
@@ -0,0 +1,265 @@
+"""
+Table-driven decoder for JK02 RS485 frames.
+
+The 0x01 (settings) and 0x02 (cell info) layouts are declared once as data and
+compiled into struct.Struct unpackers, so decoding a frame is a couple of
+unpack_from() calls over a memoryview instead of per-field slicing.
+
+https://github.com/txubelaxu/esphome-jk-bms/blob/main/components/jk_rs485_bms/jk_rs485_bms.cpp
+"""
+
+import math
+import struct
+import sys
+from operator import itemgetter
+
+FRAME_HEADER = b'\x55\xAA\xEB\x90'
+FRAME_LENGTH = 308
+
+FRAME_TYPE_SETTINGS = 0x01
+FRAME_TYPE_CELL_INFO = 0x02
+
+FRAME_TYPE_OFFSET = 4
+SETTINGS_ADDRESS_OFFSET = 264 + 6
+CELL_INFO_ADDRESS_OFFSET = 300
+CELL_COUNT_OFFSET = 114
+
+CELL_VOLTAGE_OFFSET = 6
+CELL_RESISTANCE_OFFSET = 64 + 16
+MAX_CELLS = 32
+
+# Field kinds
+SCALED = 0   # signed integer * scale, truncated to precision digits
+INTEGER = 1  # unsigned byte + bias
+SWITCH = 2   # unsigned byte, "ON" if non-zero
+
+_FORMATS = {"i32": "l", "i16": "h", "u8": "B"}
+
+# key, offset, width, kind, scale, precision / bias
+SETTINGS_FIELDS = (
+    ("charge_voltage", 38, "i32", SCALED, 0.001, 3),
+    ("float_voltage", 42, "i32", SCALED, 0.001, 3),
+    ("max_charge_current", 50, "i32", SCALED, 0.001, 3),
+    ("max_discharge_current", 62, "i32", SCALED, 0.001, 3),
+    ("charge_enabled_switch", 118, "u8", SWITCH, None, None),
+    ("discharge_enabled_switch", 122, "u8", SWITCH, None, None),
+    ("balance_start_voltage", 138, "i32", SCALED, 0.001, 3),
+    ("balance_trigger_voltage", 26, "i32", SCALED, 0.001, 5),
+    ("max_balance_current", 78, "i32", SCALED, 0.001, 3),
+    ("balancer_switch", 126, "u8", SWITCH, None, None),
+    ("soc100_voltage", 30, "i32", SCALED, 0.001, 3),
+    ("soc_zero_voltage", 34, "i32", SCALED, 0.001, 3),
+    ("cell_uvp", 10, "i32", SCALED, 0.001, 3),
+    ("cell_ovp", 18, "i32", SCALED, 0.001, 3),
+    ("power_off_voltage", 46, "i32", SCALED, 0.001, 3),
+)
+
+# Fields decoded ahead of the derived "bat_power" value
+CELL_INFO_HEAD_FIELDS = (
+    ("bat_voltage", 118 + 16*2, "i32", SCALED, 0.001, 3),
+    ("bat_current", 126 + 16*2, "i32", SCALED, 0.001, 3),
+)
+
+CELL_INFO_FIELDS = (
+    ("soc", 141 + 16*2, "u8", INTEGER, None, 0),
+    ("soh", 158 + 16*2, "u8", INTEGER, None, 0),
+    ("cycles", 150 + 16*2, "u8", INTEGER, None, 0),
+    ("cap_remaining", 142 + 16*2, "i32", SCALED, 0.001, 3),
+    ("cap_total", 146 + 16*2, "i32", SCALED, 0.001, 3),
+    ("temp_mos", 112 + 16*2, "i16", SCALED, 0.1, 3),
+    ("temp1", 130 + 16*2, "i16", SCALED, 0.1, 3),
+    ("temp2", 132 + 16*2, "i16", SCALED, 0.1, 3),
+    # ("temperature_3", 222 + 16*2, "i16", SCALED, 0.1, 3), # MOS?
+    ("temp3", 224 + 16*2, "i16", SCALED, 0.1, 3),
+    ("temp4", 226 + 16*2, "i16", SCALED, 0.1, 3),
+    ("cell_avg_volt", 58 + 16, "i16", SCALED, 0.001, 3),
+    ("cell_volt_diff", 60 + 16, "i16", SCALED, 0.001, 3),
+    ("cell_max_index", 62 + 16, "u8", INTEGER, None, 1),
+    ("cell_min_index", 63 + 16, "u8", INTEGER, None, 1),
+    ("bal_current", 138 + 16*2, "i16", SCALED, 0.001, 3),
+)
+
+# Raw bytes feeding the derived balancing/alarm values
+BALANCING_MODE_OFFSET = 140 + 16*2
+ALARM_OFFSET = 134
+
+CELL_SCALE = 0.001
+CELL_PRECISION = 3
+_CELL_FACTOR = 10**CELL_PRECISION
+
+BALANCING_MODES = {0x00: "Off", 0x01: "Charging balancer"}
+BALANCING_MODE_DEFAULT = "Discharging balancer"
+
+# Bit 0 .. Bit 23 of alarm bytes 134-136
+ALARM_NAMES = (
+    "Wire resistance",
+    "MOS OTP",
+    "Cell quantity",
+    "Current sensor error",
+    "Cell OVP",
+    "Battery OVP",
+    "Charge OCP",
+    "Charge SCP",
+    "Charge OTP",
+    "Charge UTP",
+    "CPU Aux comm error",
+    "Cell UVP",
+    "Batt UVP",
+    "Discharge OCP",
+    "Discharge SCP",
+    "Charge MOS",
+    "Discharge MOS",
+    "GPS Disconnected",
+    "Modify PWD in time",
+    "Discharge On Failed",
+    "Battery Over Temp Alarm",
+    "Temperature sensor anomaly",
+    "PLC Module anomaly",
+    "Reserved",
+)
+
+
+def _build_alarm_table(first_bit):
+    """Map every value of one alarm byte to the tuple of alarm names it sets."""
+    return tuple(
+        tuple(ALARM_NAMES[first_bit + bit] for bit in range(8) if (value >> bit) & 1)
+        for value in range(256)
+    )
+
+
+ALARM_TABLES = tuple(_build_alarm_table(first_bit) for first_bit in (0, 8, 16))
+
+
+class FrameLayout:
+    """A set of fixed-offset fields compiled into a single struct.Struct."""
+
+    def __init__(self, fields):
+        ordered = sorted(range(len(fields)), key=lambda i: fields[i][1])
+        fmt = "<"
+        position = 0
+        for i in ordered:
+            key, offset, width, kind, scale, extra = fields[i]
+            if offset < position:
+                raise ValueError(f"Field '{key}' overlaps the previous field at offset {offset}")
+            fmt += "x" * (offset - position) + _FORMATS[width]
+            position = offset + struct.calcsize("<" + _FORMATS[width])
+
+        self.struct = struct.Struct(fmt)
+        self.keys = tuple(sys.intern(f[0]) for f in fields)
+        # Unpacked values come out in offset order; restore declaration order
+        self._reorder = itemgetter(*[ordered.index(i) for i in range(len(fields))])
+        self._converters = tuple(
+            (kind, scale, 10**extra if kind == SCALED else extra)
+            for _, _, _, kind, scale, extra in fields
+        )
+
+    def unpack(self, buffer):
+        """Return the raw integer field values in declaration order."""
+        raw = self._reorder(self.struct.unpack_from(buffer, 0))
+        if len(self.keys) == 1:
+            raw = (raw,)
+        return raw
+
+    def decode(self, buffer):
+        """Return the converted field values in declaration order."""
+        raw = self.unpack(buffer)
+        trunc = math.trunc
+        values = []
+        append = values.append
+        for value, (kind, scale, factor) in zip(raw, self._converters):
+            if kind == SCALED:
+                append(trunc(value * scale * factor) / factor)
+            elif kind == INTEGER:
+                append(value + factor)
+            else:
+                append("ON" if value else "OFF")
+        return values
+
+    def decode_into(self, buffer, target):
+        target.update(zip(self.keys, self.decode(buffer)))
+        return target
+
+
+SETTINGS_LAYOUT = FrameLayout(SETTINGS_FIELDS)
+CELL_INFO_HEAD_LAYOUT = FrameLayout(CELL_INFO_HEAD_FIELDS)
+CELL_INFO_LAYOUT = FrameLayout(CELL_INFO_FIELDS)
+
+_CELL_COUNT_STRUCT = struct.Struct("<l")
+_ALARM_STRUCT = struct.Struct("<3B")
+_cell_structs = {}
+_cell_keys = {}
+
+
+def cell_struct(cell_count):
+    s = _cell_structs.get(cell_count)
+    if s is None:
+        s = _cell_structs[cell_count] = struct.Struct(f"<{cell_count}h")
+    return s
+
+
+def cell_keys(cell_count):
+    """Interleaved (cv01, cr01, cv02, cr02, ...) state keys for a cell count."""
+    keys = _cell_keys.get(cell_count)
+    if keys is None:
+        keys = _cell_keys[cell_count] = tuple(
+            sys.intern(f"{prefix}{i+1:02d}") for i in range(cell_count) for prefix in ("cv", "cr")
+        )
+    return keys
+
+
+def frame_type(payload):
+    return payload[FRAME_TYPE_OFFSET]
+
+
+def frame_address(payload):
+    if payload[FRAME_TYPE_OFFSET] == FRAME_TYPE_SETTINGS:
+        return payload[SETTINGS_ADDRESS_OFFSET]
+    return payload[CELL_INFO_ADDRESS_OFFSET]
+
+
+def read_cell_count(payload):
+    return _CELL_COUNT_STRUCT.unpack_from(payload, CELL_COUNT_OFFSET)[0]
+
+
+def read_alarm_mask(payload):
+    """24-bit alarm mask, bit N matching ALARM_NAMES[N]."""
+    alarm1, alarm2, alarm3 = _ALARM_STRUCT.unpack_from(payload, ALARM_OFFSET)
+    return alarm1 | (alarm2 << 8) | (alarm3 << 16)
+
+
+def alarm_names(mask):
+    return list(ALARM_TABLES[0][mask & 0xFF] + ALARM_TABLES[1][(mask >> 8) & 0xFF] + ALARM_TABLES[2][mask >> 16])
+
+
+def decode_settings(payload):
+    """Decode a 0x01 settings frame into the published settings dict."""
+    return SETTINGS_LAYOUT.decode_into(memoryview(payload), {})
+
+
+def decode_cell_info(payload, cell_count):
+    """Decode a 0x02 cell info frame into the published state dict."""
+    buffer = memoryview(payload)
+    state = CELL_INFO_HEAD_LAYOUT.decode_into(buffer, {})
+    battery_voltage = state["bat_voltage"]
+    battery_current = state["bat_current"]
+    state["bat_power"] = math.trunc(battery_current * battery_voltage * 1000) / 1000
+    CELL_INFO_LAYOUT.decode_into(buffer, state)
+
+    balancing_mode = payload[BALANCING_MODE_OFFSET]
+    alarm1, alarm2, alarm3 = _ALARM_STRUCT.unpack_from(buffer, ALARM_OFFSET)
+    state["bal_enabled"] = "ON" if balancing_mode in (0x01, 0x02) else "OFF"
+    state["bal_mode"] = BALANCING_MODES.get(balancing_mode, BALANCING_MODE_DEFAULT)
+    state["alarm"] = "ON" if alarm1 or alarm2 or alarm3 else "OFF"
+
+    if cell_count > 0:
+        cells = cell_struct(cell_count)
+        voltages = cells.unpack_from(buffer, CELL_VOLTAGE_OFFSET)
+        resistances = cells.unpack_from(buffer, CELL_RESISTANCE_OFFSET)
+        trunc = math.trunc
+        state.update(zip(
+            cell_keys(cell_count),
+            [trunc(value * CELL_SCALE * _CELL_FACTOR) / _CELL_FACTOR for pair in zip(voltages, resistances) for value in pair]
+        ))
+
+    state["alarms"] = list(ALARM_TABLES[0][alarm1] + ALARM_TABLES[1][alarm2] + ALARM_TABLES[2][alarm3])
+    return state
@@ -0,0 +1,224 @@
+"""
+Lightweight Prometheus-style metrics and an optional HTTP /metrics endpoint.
+
+Instruments are plain dicts keyed by label values, so updating one on the
+hot path is a dict lookup and an add. Values that already live elsewhere
+(queue depths, reassembler counters) are read by callbacks at scrape time.
+"""
+
+import bisect
+import http.server
+import logging
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def _escape(value):
+    """Escape a label value as the text exposition format requires."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=(), formatter=None):
+        """formatter(label values) -> label strings, applied at scrape time only."""
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.formatter = formatter
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        values = self.values
+        values[label_values] = values.get(label_values, 0) + amount
+
+    def samples(self):
+        formatter = self.formatter
+        for label_values, value in list(self.values.items()):
+            if formatter is not None:
+                label_values = formatter(label_values)
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), callback=None):
+        """callback() returns {label values tuple: value}, evaluated at scrape time."""
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.callback = callback
+        self.values = {}
+
+    def set(self, value, *label_values):
+        self.values[label_values] = value
+
+    def samples(self):
+        values = self.callback() if self.callback is not None else self.values
+        for label_values, value in list(values.items()):
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class CallbackCounter(Gauge):
+    """A counter whose values are maintained elsewhere and read at scrape time."""
+    kind = "counter"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f"{self.name}_bucket", f'{{le="{bound}"}}', cumulative
+        yield f"{self.name}_bucket", '{le="+Inf"}', self.count
+        yield f"{self.name}_sum", "", self.sum
+        yield f"{self.name}_count", "", self.count
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=(), formatter=None):
+        return self.register(Counter(name, help, labels, formatter))
+
+    def gauge(self, name, help, labels=(), callback=None):
+        return self.register(Gauge(name, help, labels, callback))
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, buckets))
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        lines.append("")
+        return "\n".join(lines)
+
+
+class ProxyMetrics:
+    """The instruments of the RS485 MQTT proxy."""
+
+    FRAME_TYPES = {0x01: "settings", 0x02: "cell_info"}
+
+    def __init__(self, registry=None):
+        self.registry = registry or Registry()
+        r = self.registry
+        self.payloads_received = r.counter(
+            "jk_bms_payloads_received_total", "MQTT payloads received on topic_tx", ("source",))
+        # Labelled with the raw frame type int; formatted only when scraped
+        self.frames_decoded = r.counter(
+            "jk_bms_frames_decoded_total", "Frames decoded", ("type", "bms"),
+            formatter=lambda v: (self.frame_type_label(v[0]), v[1]))
+        self.frames_rejected = r.counter(
+            "jk_bms_frames_rejected_total", "Complete frames that were not decoded",
+            ("reason", "type", "source", "bms"),
+            formatter=lambda v: (v[0], self.frame_type_label(v[1]), v[2], v[3]))
+        self.decode_seconds = r.histogram(
+            "jk_bms_decode_seconds", "Time to decode one frame and queue its publishes")
+        self.publish_seconds = r.histogram(
+            "jk_bms_publish_seconds", "Time spent in one MQTT publish call")
+        self.publish_failures = r.counter(
+            "jk_bms_publish_failures_total", "Failed MQTT publishes")
+        self.connects = r.counter(
+            "jk_bms_mqtt_connects_total", "Successful MQTT (re)connects")
+        self.disconnects = r.counter(
+            "jk_bms_mqtt_disconnects_total", "Unexpected MQTT disconnects")
+        self.last_seen = {}
+        r.gauge("jk_bms_last_seen_age_seconds", "Seconds since the last frame from a BMS", ("bms",),
+                callback=self._last_seen_ages)
+
+    def frame_type_label(self, frame_type):
+        return self.FRAME_TYPES.get(frame_type) or f"0x{frame_type:02x}"
+
+    def _last_seen_ages(self):
+        now = time.monotonic()
+        return {(bms_id,): round(now - seen, 3) for bms_id, seen in list(self.last_seen.items())}
+
+    def watch_pipeline(self, pipeline):
+        self.registry.gauge(
+            "jk_bms_queue_depth", "Items waiting in the pipeline queues", ("queue",),
+            callback=lambda: {("inbound",): len(pipeline.inbound), ("outbound",): len(pipeline.outbound)})
+        self.registry.register(CallbackCounter(
+            "jk_bms_queue_dropped_total", "Items dropped because a queue lane was full", ("queue",),
+            callback=lambda: {("inbound",): pipeline.inbound.dropped, ("outbound",): pipeline.outbound.dropped,
+                              ("inbound_priority",): pipeline.inbound.priority_dropped,
+                              ("outbound_priority",): pipeline.outbound.priority_dropped}))
+
+    def watch_reassembler(self, reassembler):
+        self.registry.register(CallbackCounter(
+            "jk_bms_reassembler_total", "Frame reassembler counters", ("counter",),
+            callback=lambda: {(name,): value for name, value in list(reassembler.counters.items())}))
+
+
+class MetricsServer:
+    """Serves registry.render() on GET /metrics from a daemon thread."""
+
+    def __init__(self, registry, port, host="0.0.0.0"):
+        self.registry = registry
+        self.logger = logging.getLogger(__name__)
+        handler = self._make_handler()
+        self.server = http.server.ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="jk-bms-metrics", daemon=True)
+
+    def _make_handler(self):
+        registry = self.registry
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,83 @@
+"""
+Split output layout: one plain-value topic per state field, grouped by subtopic.
+
+    {topic_values}/01/pack/soc              87
+    {topic_values}/01/cells/voltage/01      3.301
+    {topic_values}/01/cells/resistance/01   0.062
+    {topic_values}/01/temperatures/mos      25.1
+    {topic_values}/01/alarms/active         OFF
+    {topic_values}/01/alarms/list           ["Cell OVP"]
+
+Home Assistant entities subscribed to these topics take the payload as is,
+instead of every entity parsing the whole state JSON and rendering its
+value_json template on every frame.
+"""
+
+import json
+import re
+
+LAYOUTS = ("json", "split", "both")
+
+_STATE_TEMPLATE = re.compile(r"\{\{ value_json\.(\w+)")
+
+
+def split_subtopic(field):
+    """Subtopic of a state field, e.g. cv01 -> cells/voltage/01."""
+    if field[:2] == "cv" and field[2:].isdigit():
+        return f"cells/voltage/{field[2:]}"
+    if field[:2] == "cr" and field[2:].isdigit():
+        return f"cells/resistance/{field[2:]}"
+    if field == "temp_mos":
+        return "temperatures/mos"
+    if field[:4] == "temp" and field[4:].isdigit():
+        return f"temperatures/{field[4:]}"
+    if field == "alarm":
+        return "alarms/active"
+    if field == "alarms":
+        return "alarms/list"
+    return f"pack/{field}"
+
+
+def format_value(value):
+    if type(value) is str:
+        return value
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return str(value)
+
+
+def template_field(value_template):
+    """The state field a discovery value_template reads, or None."""
+    match = _STATE_TEMPLATE.match(value_template)
+    return match.group(1) if match else None
+
+
+class SplitLayout:
+    """Per-BMS field -> topic maps, built once per field."""
+
+    def __init__(self, topic_values):
+        self.topic_values = topic_values
+        self._topics = {}
+
+    def topics(self, bms_id):
+        topics = self._topics.get(bms_id)
+        if topics is None:
+            topics = self._topics[bms_id] = _TopicMap(f"{self.topic_values}/{bms_id}/")
+        return topics
+
+    def messages(self, bms_id, state, fields=None):
+        """(topic, payload) pairs for the given fields of state (all fields if None)."""
+        topics = self.topics(bms_id)
+        if fields is None:
+            fields = state
+        return [(topics[field], format_value(state[field])) for field in fields]
+
+
+class _TopicMap(dict):
+    def __init__(self, prefix):
+        super().__init__()
+        self.prefix = prefix
+
+    def __missing__(self, field):
+        topic = self[field] = self.prefix + split_subtopic(field)
+        return topic
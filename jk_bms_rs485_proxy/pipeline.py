@@ -0,0 +1,237 @@
+"""
+Bounded receive -> decode -> publish pipeline running off the paho network thread.
+"""
+
+import collections
+import logging
+import threading
+import time
+
+from store_forward import stamp_payload
+
+
+class LaneQueue:
+    """Two-lane bounded queue.
+
+    Items put with priority=True (settings, retained states, alarms) are
+    served first. A priority item put with a key replaces the queued item
+    with the same key in place, so a topic whose latest value is all that
+    matters takes one slot however long the broker is away. Each lane holds
+    at most maxsize items; when a lane is full its oldest item is dropped to
+    make room for the new one (counted in dropped / priority_dropped).
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.priority_dropped = 0
+        # [key, item] entries; _keyed maps the key of a queued entry to it
+        self._priority = collections.deque()
+        self._keyed = {}
+        self._normal = collections.deque()
+        self._cond = threading.Condition()
+
+    def put(self, item, priority=False, key=None):
+        with self._cond:
+            if priority:
+                entry = self._keyed.get(key) if key is not None else None
+                if entry is not None:
+                    entry[1] = item
+                else:
+                    if len(self._priority) >= self.maxsize:
+                        self._pop_priority()
+                        self.priority_dropped += 1
+                    self._push_priority([key, item], False)
+            else:
+                if len(self._normal) >= self.maxsize:
+                    self._normal.popleft()
+                    self.dropped += 1
+                self._normal.append(item)
+            self._cond.notify()
+
+    def put_front(self, item, key=None):
+        """Return an item taken by get() to the head of the priority lane.
+
+        Dropped if a newer item with the same key was queued in the meantime.
+        """
+        with self._cond:
+            if key is not None and key in self._keyed:
+                return
+            self._push_priority([key, item], True)
+            self._cond.notify()
+
+    def _push_priority(self, entry, front):
+        if front:
+            self._priority.appendleft(entry)
+        else:
+            self._priority.append(entry)
+        if entry[0] is not None:
+            self._keyed[entry[0]] = entry
+
+    def _pop_priority(self):
+        key, item = self._priority.popleft()
+        if key is not None:
+            del self._keyed[key]
+        return item
+
+    def pop_normal(self):
+        """Take the oldest normal-lane item without waiting, or None."""
+        with self._cond:
+            return self._normal.popleft() if self._normal else None
+
+    def get(self, timeout=None):
+        """Return the next item, or None if nothing arrived within timeout."""
+        with self._cond:
+            if not self._priority and not self._normal:
+                self._cond.wait(timeout)
+            if self._priority:
+                return self._pop_priority()
+            if self._normal:
+                return self._normal.popleft()
+            return None
+
+    def __len__(self):
+        return len(self._priority) + len(self._normal)
+
+
+class Pipeline:
+    """Decode and publish workers fed by bounded queues.
+
+    decode(payload) is called on the decode worker for every received
+    payload; publish(topic, payload, qos, retain) is called on the publish
+    worker and must return True on success. The publish worker pauses while
+    the broker is disconnected, so the queues absorb short outages. Queued
+    priority messages are coalesced per topic unless enqueued with
+    coalesce=False (events, replies), keeping the outbound queue bounded.
+
+    With a spool (StoreForwardBuffer) state messages are written to disk
+    while the broker is unreachable and replayed in order at replay_rate
+    messages per second once it is back. replay_message(topic, payload,
+    timestamp) returns the (topic, payload) to replay a stored message as,
+    so it can be kept away from the live topics; by default it goes to
+    <topic>/replay with the time it was stored added to the payload.
+
+    Callbacks registered with add_periodic() run on the decode worker, so
+    they never race with decode().
+    """
+
+    def __init__(self, decode, publish, queue_size=1000, poll_interval=0.5, spool=None, replay_rate=20, replay_message=None):
+        self.decode = decode
+        self.publish = publish
+        self.poll_interval = poll_interval
+        self.spool = spool
+        self.replay_interval = 1.0 / replay_rate
+        self.replay_message = replay_message or (lambda topic, payload, timestamp: (f"{topic}/replay", stamp_payload(payload, timestamp)))
+        self.inbound = LaneQueue(queue_size)
+        self.outbound = LaneQueue(queue_size)
+        self.connected = threading.Event()
+        self.publish_failures = 0
+        self.logger = logging.getLogger(__name__)
+        self._running = threading.Event()
+        self._threads = []
+        self._periodic = []
+
+    def start(self):
+        self._running.set()
+        for name, target in (("decode", self._decode_loop), ("publish", self._publish_loop)):
+            thread = threading.Thread(target=target, name=f"jk-bms-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=2):
+        self._running.clear()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self.spool is not None:
+            self._spool_pending()
+            self.spool.close()
+
+    def add_periodic(self, interval, callback):
+        """Call callback() every interval seconds alongside decoding."""
+        self._periodic.append([interval, callback, time.monotonic() + interval])
+
+    def _run_periodic(self):
+        now = time.monotonic()
+        for task in self._periodic:
+            interval, callback, due = task
+            if now >= due:
+                task[2] = now + interval
+                try:
+                    callback()
+                except Exception as e:
+                    self.logger.error("Error in periodic task %s: %s", callback.__name__, e, exc_info=True)
+
+    def submit(self, payload, priority=False):
+        self.inbound.put(payload, priority)
+
+    def enqueue_publish(self, topic, payload, qos=0, retain=False, priority=False, coalesce=True):
+        self.outbound.put((priority, topic, payload, qos, retain), priority, topic if coalesce else None)
+
+    def _decode_loop(self):
+        while self._running.is_set():
+            payload = self.inbound.get(self.poll_interval)
+            if payload is not None:
+                try:
+                    self.decode(payload)
+                except Exception as e:
+                    self.logger.error("Error in decode worker: %s", e, exc_info=True)
+            if self._periodic:
+                self._run_periodic()
+
+    def _publish_loop(self):
+        next_replay = 0
+        while self._running.is_set():
+            if not self.connected.is_set():
+                self._spool_pending()
+                self.connected.wait(self.poll_interval)
+                continue
+
+            timeout = self.poll_interval
+            if self.spool is not None and len(self.spool):
+                now = time.monotonic()
+                if now >= next_replay:
+                    next_replay = now + self.replay_interval
+                    self._replay_one()
+                timeout = min(timeout, max(0, next_replay - time.monotonic()))
+
+            item = self.outbound.get(timeout)
+            if item is None:
+                continue
+            priority, topic, payload, qos, retain = item
+            if not self._publish(topic, payload, qos, retain):
+                if priority:
+                    # Retry after reconnect unless a newer value for the topic is queued
+                    self.outbound.put_front(item, topic)
+                elif self.spool is not None:
+                    self.spool.append(topic, payload)
+                time.sleep(self.poll_interval)
+
+    def _publish(self, topic, payload, qos, retain):
+        try:
+            published = self.publish(topic, payload, qos, retain)
+        except Exception as e:
+            self.logger.error("Error in publish worker: %s", e, exc_info=True)
+            published = False
+        if not published:
+            self.publish_failures += 1
+        return published
+
+    def _spool_pending(self):
+        """Move queued state messages to disk while the broker is unreachable."""
+        if self.spool is None:
+            return
+        spooled = 0
+        while True:
+            item = self.outbound.pop_normal()
+            if item is None:
+                break
+            self.spool.append(item[1], item[2])
+            spooled += 1
+        if spooled:
+            self.spool.flush()
+
+    def _replay_one(self):
+        topic, payload, timestamp = self.spool.peek()
+        if self._publish(*self.replay_message(topic, payload, timestamp), 0, False):
+            self.spool.pop()
@@ -0,0 +1,109 @@
+"""
+Change-only / deadband publishing for the BMS state and settings topics.
+"""
+
+import time
+
+# Option name -> state keys (or key prefixes) the deadband applies to
+DEADBAND_GROUPS = {
+    "cell_voltage": ("cv", "cell_avg_volt", "cell_volt_diff"),
+    "cell_resistance": ("cr",),
+    "voltage": ("bat_voltage",),
+    "current": ("bat_current", "bal_current"),
+    "power": ("bat_power",),
+    "temperature": ("temp",),
+    "capacity": ("cap_remaining", "cap_total"),
+}
+
+
+def expand_deadbands(groups):
+    """Turn {"cell_voltage": 0.005, ...} into a {key prefix: deadband} map."""
+    deadbands = {}
+    for group, value in groups.items():
+        for prefix in DEADBAND_GROUPS[group]:
+            deadbands[prefix] = value
+    return deadbands
+
+
+class PublishFilter:
+    """Decides whether a decoded frame differs enough from the last published one."""
+
+    def __init__(self, deadbands=None, max_interval=300, clock=time.monotonic):
+        self.deadbands = dict(deadbands or {})
+        self.max_interval = max_interval
+        self.clock = clock
+        self._published = {}
+        self._field_deadbands = {}
+
+    def _deadband(self, field):
+        deadband = self._field_deadbands.get(field)
+        if deadband is None:
+            # Longest matching prefix wins, resolved once per field
+            deadband = 0
+            matched = -1
+            for prefix, value in self.deadbands.items():
+                if field.startswith(prefix) and len(prefix) > matched:
+                    deadband, matched = value, len(prefix)
+            self._field_deadbands[field] = deadband
+        return deadband
+
+    def _expired(self, key, now):
+        last = self._published.get(key)
+        return last is None or now - last[0] >= self.max_interval
+
+    def check_state(self, key, state):
+        """Return True (and remember the state) if any field crossed its deadband."""
+        now = self.clock()
+        if not self._expired(key, now):
+            last = self._published[key][1]
+            if len(last) == len(state) and not self._state_changed(last, state):
+                return False
+        self._published[key] = (now, state)
+        return True
+
+    def _state_changed(self, last, state):
+        deadband_of = self._deadband
+        for field, value in state.items():
+            previous = last.get(field)
+            if value == previous:
+                continue
+            deadband = deadband_of(field)
+            if not deadband or previous is None or isinstance(value, (str, list)):
+                return True
+            if abs(value - previous) >= deadband:
+                return True
+        return False
+
+    def changed_fields(self, key, state):
+        """Return the fields of state that crossed their deadband since they were last published.
+
+        Every field is returned for a new key and once max_interval has passed.
+        """
+        now = self.clock()
+        if self._expired(key, now):
+            self._published[key] = (now, dict(state))
+            return list(state)
+        last = self._published[key][1]
+        deadband_of = self._deadband
+        changed = []
+        for field, value in state.items():
+            previous = last.get(field)
+            if value == previous:
+                continue
+            deadband = deadband_of(field)
+            if deadband and previous is not None and not isinstance(value, (str, list, dict)) and abs(value - previous) < deadband:
+                continue
+            changed.append(field)
+            last[field] = value
+        return changed
+
+    def check_payload(self, key, payload):
+        """Return True (and remember the payload) unless it is identical to the last one."""
+        now = self.clock()
+        if not self._expired(key, now) and self._published[key][1] == payload:
+            return False
+        self._published[key] = (now, payload)
+        return True
+
+    def forget(self, key):
+        self._published.pop(key, None)
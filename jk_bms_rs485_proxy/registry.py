@@ -0,0 +1,113 @@
+"""
+Registry of the known BMS, persisted so cell info frames decode right after a restart.
+
+Cell info frames can only be decoded once the cell count is known, which
+comes from the settings frame. Keeping the registry on disk means a restart
+no longer drops all state data until every pack has sent its settings again.
+Each entry stores the address, cell count, a hash of the discovery configs
+announced for it and the last decoded settings.
+"""
+
+import json
+import logging
+import os
+
+from jk02_decoder import MAX_CELLS
+
+VERSION = 1
+
+
+class BmsRegistry(dict):
+    """bms id -> cell count of the registered BMS, saved to path on every change.
+
+    Entries loaded from disk are listed in restored until their discovery
+    configs have been announced again in this run.
+    """
+
+    def __init__(self, path=None):
+        super().__init__()
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self.settings = {}
+        self.discovery_hashes = {}
+        self.restored = set()
+        if path:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("version") != VERSION:
+                raise ValueError(f"unsupported version {data.get('version')}")
+            entries = data["bms"].items()
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, AttributeError) as e:
+            self.logger.error("Cannot read BMS registry %s: %s", self.path, e)
+            return
+        # A damaged entry only costs that BMS its restore, not the whole registry
+        for bms_id, entry in entries:
+            try:
+                cell_count = int(entry["cell_count"])
+                if not isinstance(bms_id, str) or not 0 < cell_count <= MAX_CELLS:
+                    raise ValueError(f"cell count {cell_count}")
+                settings = entry.get("settings")
+                if settings is not None and not isinstance(settings, dict):
+                    raise ValueError("settings are not an object")
+            except (ValueError, TypeError, KeyError, AttributeError) as e:
+                self.logger.warning("Skipping BMS #%s in registry %s: %s", bms_id, self.path, e)
+                continue
+            self[bms_id] = cell_count
+            self.settings[bms_id] = settings
+            self.discovery_hashes[bms_id] = entry.get("discovery_hash")
+            self.restored.add(bms_id)
+        if self:
+            self.logger.info("Restored %d BMS from %s: %s", len(self), self.path,
+                             ", ".join(f"#{bms_id} ({cells} cells)" for bms_id, cells in sorted(self.items())))
+
+    def save(self):
+        """Write the registry atomically; a no-op without a path."""
+        if not self.path:
+            return
+        entries = {}
+        for bms_id, cell_count in self.items():
+            entries[bms_id] = {
+                "address": int(bms_id.rpartition("/")[2]),
+                "cell_count": cell_count,
+                "discovery_hash": self.discovery_hashes.get(bms_id),
+                "settings": self.settings.get(bms_id),
+            }
+        temporary = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(temporary, "w") as f:
+                json.dump({"version": VERSION, "bms": entries}, f, indent=1)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            self.logger.error("Cannot write BMS registry %s: %s", self.path, e)
+
+    def register(self, bms_id, cell_count):
+        """Add a BMS or replace an entry whose cell count changed."""
+        self[bms_id] = cell_count
+        self.settings.pop(bms_id, None)
+        self.discovery_hashes.pop(bms_id, None)
+        self.restored.discard(bms_id)
+        self.save()
+
+    def announced(self, bms_id, discovery_hash):
+        """Record the discovery configs announced for a BMS; True if they differ from the stored ones."""
+        self.restored.discard(bms_id)
+        if self.discovery_hashes.get(bms_id) == discovery_hash:
+            return False
+        self.discovery_hashes[bms_id] = discovery_hash
+        self.save()
+        return True
+
+    def update_settings(self, bms_id, settings):
+        """Remember the last settings of a BMS; True if they changed."""
+        if self.settings.get(bms_id) == settings:
+            return False
+        self.settings[bms_id] = settings
+        self.save()
+        return True
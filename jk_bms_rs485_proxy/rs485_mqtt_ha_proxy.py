@@ -7,14 +7,48 @@ https://github.com/txubelaxu/esphome-jk-bms/blob/main/components/jk_rs485_sniffe
 https://github.com/txubelaxu/esphome-jk-bms/blob/main/components/jk_rs485_bms/jk_rs485_bms.cpp
 """
 
+import asyncio
 import datetime
 import json
 import logging
-import math
 import paho.mqtt.client as mqtt
 import os
+import signal
 import sys
 import time
+import traceback
+
+import jk02_decoder
+from aggregator import StateAggregator
+from alarms import ALARM_NAMES, ALARM_SLUGS, AlarmTracker, changed_bits, event_message
+from analytics import PackAnalytics
+from async_engine import AsyncMqttLoop, AsyncPipeline
+from availability import AvailabilityTracker
+from bank import BANK_ID, BankAggregator
+from capture import CaptureWriter
+from compact_output import CompactEncoder
+from diagnostics import CrashRing, FrameTracer, parse_trace_rates
+from discovery import DiscoveryManager
+from frame_parser import FrameReassembler
+from history import HistoryStore
+from metrics import CallbackCounter, MetricsServer, ProxyMetrics
+from pipeline import Pipeline
+from registry import BmsRegistry
+from output_layout import SplitLayout, split_subtopic, template_field
+from sources import SourceMap, device_name, node_id, shared_topic
+from publish_filter import PublishFilter, expand_deadbands
+from store_forward import StoreForwardBuffer, stamp_payload
+
+class TimestampFormatter(logging.Formatter):
+    """Prefixes messages with [dd MMM, yyyy, hh:mm:ss.ffffff].
+
+    Timestamp and message are only formatted for records that pass the level
+    check, so filtered debug calls cost no more than the call itself.
+    """
+
+    def formatTime(self, record, datefmt=None):
+        return datetime.datetime.fromtimestamp(record.created).strftime("[%d %b, %Y, %H:%M:%S.%f]")
+
 
 # Configure logging for Home Assistant addon
 def setup_logging(log_level="INFO"):
@@ -22,9 +56,8 @@ def setup_logging(log_level="INFO"):
     # Convert string log level to logging constant
     numeric_level = getattr(logging, log_level.upper(), logging.INFO)
     
-    # Create simple formatter without timestamp (we'll add custom timestamps)
-    formatter = logging.Formatter(
-        fmt='%(message)s'
+    formatter = TimestampFormatter(
+        fmt='%(asctime)s %(message)s'
     )
     
     # Setup root logger
@@ -43,332 +76,600 @@ def setup_logging(log_level="INFO"):
     
     return logger
 
-def get_timestamp():
-    """Get formatted timestamp in the format: [dd MMM, yyyy, hh:mm:ss.ffffff]"""
-    now = datetime.datetime.now()
-    return now.strftime("[%d %b, %Y, %H:%M:%S.%f]")
-    
 class RS485MQTTClient:
-    def __init__(self, broker_host, broker_port, username, password, topic_tx, topic_registration, topic_values, log_file="dump.txt"):
+    def __init__(self, broker_host, broker_port, username, password, topic_tx, topic_registration, topic_values, capture=None, publish_filter=None, aggregator=None, queue_size=1000, reconnect_max_delay=120, spool=None, replay_rate=20, verify_checksum=True, metrics_port=None, engine="thread", share_group="", instance_index=0, instance_count=1, output_layout="json", compact=None, history=None, bank=None, bank_interval=5, analytics=None, analytics_interval=10, registry=None, tracer=None, crash_ring=None, alarm_tracker=None, availability=None):
         self.broker_host = broker_host
         self.broker_port = broker_port
         self.username = username
         self.password = password
         self.topic_tx = topic_tx
+        # Wildcard levels of topic_tx namespace the BMS of each gateway
+        self.sources = SourceMap(topic_tx, instance_index, instance_count)
+        self.partitioned = instance_count > 1
+        # MQTT 5 shared subscription group, "" subscribes normally
+        self.share_group = share_group
         self.topic_registration = topic_registration
         self.topic_values = topic_values
-        self.log_file = log_file
+        # "json" publishes NN/state, "split" one plain-value topic per field, "both" does both
+        self.output_json = output_layout in ("json", "both")
+        self.split_layout = SplitLayout(topic_values) if output_layout in ("split", "both") else None
+        # Optional CompactEncoder producing the machine-oriented output stream
+        self.compact = compact
+        # Optional HistoryStore, queried over MQTT on history_request_topic
+        self.history = history
+        self.history_request_topic = f"{topic_values}/history/request"
+        self.history_response_topic = f"{topic_values}/history/response"
+        # Optional AlarmTracker publishing per-alarm states and events on every alarm transition
+        self.alarm_tracker = alarm_tracker
+        # Optional AvailabilityTracker: retained online/offline per BMS, plus the proxy status topic as LWT
+        self.availability = availability
+        # Partitioned instances own disjoint BMS, so each has its own status topic
+        self.status_topic = f"{topic_values}/status/{instance_index}" if instance_count > 1 else f"{topic_values}/status"
+        # Optional BankAggregator publishing the virtual bank device every bank_interval seconds
+        self.bank = bank
+        self.bank_registered = False
+        # Optional PackAnalytics publishing NN/analytics every analytics_interval seconds
+        self.analytics = analytics
+        self.analytics_registered = set()
+        # Optional CaptureWriter recording every raw topic_tx payload
+        self.capture = capture
+        # Optional FrameTracer logging sampled frames, CrashRing dumping the last payloads on decode errors
+        self.tracer = tracer
+        self.crash_ring = crash_ring
         self.client = None
-        self.bms_registry = dict()
+        # bms id -> cell count, restored from disk when the registry is persisted
+        self.bms_registry = registry if registry is not None else BmsRegistry()
+        if availability is not None:
+            # BMS known from an earlier run go offline unless they report within the timeout
+            for bms_id in self.bms_registry:
+                availability.watch(bms_id)
+        # None publishes every frame; a PublishFilter enables change-only publishing
+        self.publish_filter = publish_filter
+        self.force_update = publish_filter is None
+        # None publishes every state frame; a StateAggregator publishes min/avg/max per window
+        self.aggregator = aggregator
+        self.discovery = DiscoveryManager(topic_registration)
+        self.subscription_mid = None
+        # on_message only enqueues; decoding and publishing run on worker threads,
+        # or as tasks on the event loop with the asyncio engine
+        self.engine = engine
+        pipeline_class = AsyncPipeline if engine == "asyncio" else Pipeline
+        self.pipeline = pipeline_class(self.process_payload, self.safe_publish, queue_size, spool=spool, replay_rate=replay_rate,
+                                       replay_message=self.replay_message)
+        if aggregator is not None:
+            self.pipeline.add_periodic(1, self.flush_aggregates)
+        if bank is not None:
+            self.pipeline.add_periodic(bank_interval, self.publish_bank)
+        if analytics is not None:
+            self.pipeline.add_periodic(analytics_interval, self.publish_analytics)
+            self.pipeline.add_periodic(60, analytics.save)
+        if availability is not None:
+            self.pipeline.add_periodic(1, self.expire_availability)
+        if capture is not None:
+            # Keeps a gzip capture readable up to the last flush if the add-on is killed
+            self.pipeline.add_periodic(10, capture.flush)
+        self.reconnect_max_delay = reconnect_max_delay
+        self.reassembler = FrameReassembler(verify_checksum, on_reject=self.reject_frame)
+        self.metrics = ProxyMetrics()
+        self.metrics.watch_pipeline(self.pipeline)
+        self.metrics.watch_reassembler(self.reassembler)
+        self.metrics.registry.gauge("jk_bms_discovery_pending", "Discovery configs waiting to be published",
+                                    callback=lambda: {(): self.discovery.pending})
+        if history is not None:
+            self.metrics.registry.gauge("jk_bms_history_bytes", "Memory held by the history ring buffers",
+                                        callback=lambda: {(): history.memory_bytes})
+            self.metrics.registry.register(CallbackCounter(
+                "jk_bms_history_rejected_total", "Samples not recorded because the history memory budget is used up",
+                callback=lambda: {(): history.rejected}))
+        if crash_ring is not None:
+            self.metrics.registry.register(CallbackCounter(
+                "jk_bms_crash_dumps_total", "Crash ring dumps written after decode errors",
+                callback=lambda: {(): crash_ring.dumps}))
+        if availability is not None:
+            self.metrics.registry.gauge("jk_bms_online", "BMS currently reported online",
+                                        callback=lambda: {(): availability.online})
+        self.metrics_port = metrics_port
+        self.metrics_server = None
         self.logger = logging.getLogger(__name__)
         
-    def on_connect(self, client, userdata, flags, rc):
+    def on_connect(self, client, userdata, flags, rc, properties=None):
         if rc == 0:
-            self.logger.info(f"{get_timestamp()} Connected successfully to MQTT broker at {self.broker_host}:{self.broker_port}")
-            client.subscribe(self.topic_tx)
-            self.logger.info(f"{get_timestamp()} Subscribed to topic: {self.topic_tx}")
+            self.logger.info("Connected successfully to MQTT broker at %s:%s", self.broker_host, self.broker_port)
+            self.metrics.connects.inc()
+            # Read back retained discovery configs before BMS frames start arriving.
+            # The broker handles subscriptions in order, so once topic_tx is
+            # acknowledged the retained configs have been delivered.
+            nodes = [node_id(bms_id) for bms_id in list(self.bms_registry)]
+            if self.bank is not None:
+                nodes.append(node_id(BANK_ID))
+            self.discovery.on_connect(client, nodes)
+            subscription = shared_topic(self.topic_tx, self.share_group)
+            self.subscription_mid = client.subscribe(subscription)[1]
+            self.logger.info("Subscribed to topic: %s", subscription)
+            if self.history is not None:
+                client.subscribe(self.history_request_topic)
+            if self.compact is not None:
+                topic, schema = self.compact.schema_message()
+                self.publish(topic, schema, retain=True, priority=True)
+            if self.availability is not None:
+                # Replaces the retained "offline" left by the last will
+                self.publish(self.status_topic, "online", retain=True, priority=True)
+            self.pipeline.connected.set()
         else:
-            self.logger.error(f"{get_timestamp()} Failed to connect to MQTT broker. Return code: {rc}")
+            self.logger.error("Failed to connect to MQTT broker. Return code: %s", rc)
             self.print_connection_error(rc)
     
-    def on_disconnect(self, client, userdata, rc):
+    def on_disconnect(self, client, userdata, rc, properties=None):
+        self.pipeline.connected.clear()
         if rc != 0:
-            self.logger.warning(f"{get_timestamp()} Unexpected disconnection from MQTT broker")
-            self.simple_reconnect()
+            self.metrics.disconnects.inc()
+            # paho's loop reconnects on its own with exponential backoff (reconnect_delay_set)
+            self.logger.warning("Unexpected disconnection from MQTT broker - reconnecting")
         else:
-            self.logger.info(f"{get_timestamp()} Disconnected from MQTT broker")
-    
-    def simple_reconnect(self):
-        """Simple reconnect with basic retry logic."""
-        for attempt in range(1, 6):  # Try 5 times
-            try:
-                self.logger.info(f"{get_timestamp()} Reconnect attempt {attempt}/5...")
-                time.sleep(5)  # Wait 5 seconds before retry
-                self.client.reconnect()
-                self.logger.info(f"{get_timestamp()} Reconnected successfully")
-                return
-            except Exception as e:
-                self.logger.error(f"{get_timestamp()} Reconnect attempt {attempt} failed: {e}")
-        
-        self.logger.error(f"{get_timestamp()} All reconnect attempts failed - exiting process")
-        sys.exit(1)
+            self.logger.info("Disconnected from MQTT broker")
     
     def safe_publish(self, topic, payload, qos=0, retain=False):
-        """Publish with result checking and reconnection on failure."""
+        """Publish with result checking; runs on the publish worker."""
         try:
+            started = time.perf_counter()
             result = self.client.publish(topic, payload, qos=qos, retain=retain)
+            self.metrics.publish_seconds.observe(time.perf_counter() - started)
             
             # Check if publish was successful
             if result.rc != mqtt.MQTT_ERR_SUCCESS:
-                self.logger.error(f"{get_timestamp()} Failed to publish to {topic}: error code {result.rc}")
-                self.logger.warning(f"{get_timestamp()} Publish failure detected - triggering reconnection")
-                self.simple_reconnect()
+                self.metrics.publish_failures.inc()
+                self.logger.error("Failed to publish to %s: error code %s", topic, result.rc)
                 return False
             else:
-                self.logger.debug(f"{get_timestamp()} Successfully published to {topic}")
+                self.logger.debug("Successfully published to %s", topic)
                 return True
                 
         except Exception as e:
-            self.logger.error(f"{get_timestamp()} Exception during publish to {topic}: {e}")
-            self.logger.warning(f"{get_timestamp()} Publish exception - triggering reconnection")
-            self.simple_reconnect()
+            self.metrics.publish_failures.inc()
+            self.logger.error("Exception during publish to %s: %s", topic, e)
             return False
+
+    def publish(self, topic, payload, qos=0, retain=False, priority=False, coalesce=True):
+        """Hand a message to the publish worker.
+
+        Priority messages are sent first; while queued, a newer one for the
+        same topic replaces the older one unless coalesce is False.
+        """
+        self.pipeline.enqueue_publish(topic, payload, qos, retain, priority, coalesce)
     
+    def replay_message(self, topic, payload, timestamp):
+        """Spooled messages are replayed below <base>/replay, away from the live topics.
+
+        rs485tx/bms/01/state -> rs485tx/bms/replay/01/state, and the same for
+        the compact stream. The payload is stamped with the time it was stored.
+        """
+        compact = self.compact
+        if compact is not None and topic.startswith(compact.topic + "/"):
+            return f"{compact.topic}/replay/{topic[len(compact.topic) + 1:]}", stamp_payload(payload, timestamp, compact.encoding != "json")
+        if topic.startswith(self.topic_values + "/"):
+            return f"{self.topic_values}/replay/{topic[len(self.topic_values) + 1:]}", stamp_payload(payload, timestamp)
+        return f"{topic}/replay", stamp_payload(payload, timestamp)
+
     def on_message(self, client, userdata, msg):
+        # Runs on the paho network thread: only enqueue, never block
+        if self.partitioned and not self.sources.owns(msg.topic):
+            return
+        # Raw payloads stay in arrival order: frames are reassembled across
+        # them per source, so settings only get priority once decoded
+        self.pipeline.submit((msg.topic, msg.payload, time.monotonic_ns()))
+
+    def on_history_request(self, client, userdata, msg):
+        # Answered on the decode worker, which owns the history buffers
+        self.pipeline.submit((msg.topic, msg.payload, time.monotonic_ns()), True)
+
+    def history_reply_topic(self, reply_to):
+        """Topic under history_response_topic for a request's reply_to suffix.
+
+        Replies stay inside that subtree so a request cannot publish over
+        state, discovery or any other retained topic.
+        """
+        if not reply_to:
+            return self.history_response_topic
+        if not isinstance(reply_to, str) or "+" in reply_to or "#" in reply_to or "" in reply_to.split("/"):
+            raise ValueError(f"Invalid reply_to {reply_to!r}, expected a topic suffix without wildcards")
+        return f"{self.history_response_topic}/{reply_to}"
+
+    def answer_history_query(self, payload):
+        """Publish the history window described by a JSON request.
+
+        {"id": "...", "bms": ["01"], "fields": ["cv*"], "tier": "1m", "since": -3600, "reply_to": "..."}
+
+        The answer goes to history_response_topic, or below it when reply_to
+        names a suffix; an invalid reply_to is answered with an error on
+        history_response_topic.
+        """
+        response = {}
+        reply_to = self.history_response_topic
         try:
-            now = datetime.datetime.now()
-            timestamp = now.strftime("[%d %b, %Y, %H:%M:%S.%f]")
-
-            if len(msg.payload) == 319:
-                msg.payload = msg.payload[11:]
-
-            if len(msg.payload) == 308 and msg.payload.startswith(b'\x55\xAA\xEB\x90'):                
-                # https://github.com/txubelaxu/esphome-jk-bms/blob/main/components/jk_rs485_sniffer/jk_rs485_sniffer.cpp l:812
-                # chsumm = msg.payload[299]
-
-                frameType = msg.payload[4]
-                frameAddress = 0
-                if frameType == 0x01:
-                    frameAddress = msg.payload[264 + 6]
-                else:
-                    frameAddress = msg.payload[300]
-                
-                truncate = lambda f, n: math.trunc(f * 10**n) / 10**n
-                read16 = lambda raw, pos: float(int.from_bytes(raw[pos:pos+2], byteorder='little', signed=True))
-                read32 = lambda raw, pos: float(int.from_bytes(raw[pos:pos+4], byteorder='little', signed=True))
-                check_bit_of_byte = lambda byte_val, bit_index: (byte_val >> bit_index) & 1
-
-                # Retrieve bms from registry
-                bms_registered = frameAddress in self.bms_registry
-
-                if frameType == 0x01: # decode_jk02_settings_
-
-                    if not bms_registered:
-                        cellCount = int(read32(msg.payload, 114))
-                        self.bms_registry[frameAddress] = cellCount
-
-                        self.logger.info(f"{get_timestamp()} New BMS #{frameAddress} registered ({cellCount} cells)")
-
-                        # main category
-                        self.sensor_registration(frameAddress, "SOC", "soc", "battery", "%", None, "state", "{{ value_json.soc | float }}", 1)
-                        self.sensor_registration(frameAddress, "SOH", "soh", "battery", "%", None, "state", "{{ value_json.soh | float }}", 1)
-                        self.sensor_registration(frameAddress, "Cycles", "cycles", None, None, None, "state", "{{ value_json.cycles | int }}", 0)
-                        self.sensor_registration(frameAddress, "Capacity Remaining", "capacity_remaining", None, "Ah", None, "state", "{{ value_json.cap_remaining | float }}", 3)
-                        self.sensor_registration(frameAddress, "Capacity Total", "capacity_total", None, "Ah", None, "state", "{{ value_json.cap_total | float }}", 3)
-                        self.sensor_registration(frameAddress, "Battery Voltage", "battery_voltage", "voltage", "V", None, "state", "{{ value_json.bat_voltage | float }}", 3)
-                        self.sensor_registration(frameAddress, "Battery Current", "battery_current", "current", "A", None, "state", "{{ value_json.bat_current | float }}", 2)
-                        self.sensor_registration(frameAddress, "Battery Power", "battery_power", "power", "W", None, "state", "{{ value_json.bat_power | float }}", 2)
-                        self.sensor_registration(frameAddress, "Temperature MOS", "temperature_mos", "temperature", "°C", None, "state", "{{ value_json.temp_mos | float }}", 1)
-                        self.sensor_registration(frameAddress, "Temperature #1", "temperature_1", "temperature", "°C", None, "state", "{{ value_json.temp1 | float }}", 1)
-                        self.sensor_registration(frameAddress, "Temperature #2", "temperature_2", "temperature", "°C", None, "state", "{{ value_json.temp2 | float }}", 1)
-                        self.sensor_registration(frameAddress, "Temperature #3", "temperature_3", "temperature", "°C", None, "state", "{{ value_json.temp3 | float }}", 1)
-                        self.sensor_registration(frameAddress, "Temperature #4", "temperature_4", "temperature", "°C", None, "state", "{{ value_json.temp4 | float }}", 1)
-                        self.sensor_registration(frameAddress, "Cells Average Voltage", "cell_average_voltage", "voltage", "V", None, "state", "{{ value_json.cell_avg_volt | float }}", 3)
-                        self.sensor_registration(frameAddress, "Cells Voltage Diff", "cell_voltage_diff", "voltage", "V", None, "state", "{{ value_json.cell_volt_diff | float }}", 3)
-                        self.sensor_registration(frameAddress, "Cells Max Index", "cell_max_index", None, None, None, "state", "{{ value_json.cell_max_index | int }}", 0)
-                        self.sensor_registration(frameAddress, "Cells Min Index", "cell_min_index", None, None, None, "state", "{{ value_json.cell_min_index | int }}", 0)
-
-                        for i in range(int(cellCount)):
-                            self.sensor_registration(
-                                frameAddress,
-                                f"Cell Voltage #{i+1:02d}",
-                                f"cell_voltage_{i+1:02d}",
-                                "voltage",
-                                "V",
-                                None,
-                                "state",
-                                f"{{{{ value_json.cv{i+1:02d} | float }}}}",
-                                3
-                            )
-                        for i in range(int(cellCount)):
-                            self.sensor_registration(
-                                frameAddress,
-                                f"Cell Resistance #{i+1:02d}",
-                                f"cell_resistance_{i+1:02d}",
-                                None,
-                                "mΩ",
-                                None,
-                                "state",
-                                f"{{{{ value_json.cr{i+1:02d} | float }}}}",
-                                3
-                            )
-                        self.sensor_registration(frameAddress, "Balancing Current", "balancing_current", "current", "A", None, "state", "{{ value_json.bal_current | float }}", 3)
-                        self.binary_sensor_registration(frameAddress, "Balancing Enabled", "balancing_enabled", None, None, None, "state", "{{ value_json.bal_enabled }}", 0)
-                        self.sensor_registration(frameAddress, "Balancing Mode", "balancing_mode", None, None, None, "state", "{{ value_json.bal_mode }}", None)
-                        self.binary_sensor_registration(frameAddress, "Alarm", "alarm", "safety", None, None, "state", "{{ value_json.alarm }}", 0)
-
-                        # diagnostic category
-                        self.sensor_registration(frameAddress, "Charge Voltage", "charge_voltage", "voltage", "V", "diagnostic", "settings", "{{ value_json.charge_voltage | float }}", 3)
-                        self.sensor_registration(frameAddress, "Float Voltage", "float_voltage", "voltage", "V", "diagnostic", "settings", "{{ value_json.float_voltage | float }}", 3)
-                        self.sensor_registration(frameAddress, "Max Charge Current", "max_charge_current", "current", "A", "diagnostic", "settings", "{{ value_json.max_charge_current | float }}", 3)
-                        self.sensor_registration(frameAddress, "Max Discharge Current", "max_discharge_current", "current", "A", "diagnostic", "settings", "{{ value_json.max_discharge_current | float }}", 3)
-                        self.sensor_registration(frameAddress, "Balance Start Voltage", "balance_start_voltage", "voltage", "V", "diagnostic", "settings", "{{ value_json.balance_start_voltage | float }}", 3)
-                        self.sensor_registration(frameAddress, "Balance Trigger Voltage", "balance_trigger_voltage", "voltage", "V", "diagnostic", "settings", "{{ value_json.balance_trigger_voltage | float }}", 5)
-                        self.sensor_registration(frameAddress, "Max Balance Current", "max_balance_current", "current", "A", "diagnostic", "settings", "{{ value_json.max_balance_current | float }}", 3)
-                        self.sensor_registration(frameAddress, "SOC 100% Voltage", "soc100_voltage", "voltage", "V", "diagnostic", "settings", "{{ value_json.soc100_voltage | float }}", 3)
-                        self.sensor_registration(frameAddress, "SOC 0% Voltage", "soc_zero_voltage", "voltage", "V", "diagnostic", "settings", "{{ value_json.soc_zero_voltage | float }}", 3)
-                        self.sensor_registration(frameAddress, "Cell UVP", "cell_uvp", "voltage", "V", "diagnostic", "settings", "{{ value_json.cell_uvp | float }}", 3)
-                        self.sensor_registration(frameAddress, "Cell OVP", "cell_ovp", "voltage", "V", "diagnostic", "settings", "{{ value_json.cell_ovp | float }}", 3)
-                        self.sensor_registration(frameAddress, "Power Off Voltage", "power_off_voltage", "voltage", "V", "diagnostic", "settings", "{{ value_json.power_off_voltage | float }}", 3)
-                        self.binary_sensor_registration(frameAddress, "Charge Enabled Switch", "charge_enabled_switch", None, None, "diagnostic", "settings", "{{ value_json.charge_enabled_switch }}")
-                        self.binary_sensor_registration(frameAddress, "Discharge Enabled Switch", "discharge_enabled_switch", None, None, "diagnostic", "settings", "{{ value_json.discharge_enabled_switch }}")
-                        self.binary_sensor_registration(frameAddress, "Balancer Switch", "balancer_switch", None, None, "diagnostic", "settings", "{{ value_json.balancer_switch }}")
-                    else:
-                        self.logger.debug(f"{get_timestamp()} Update settings for BMS #{frameAddress}")
-
-                    self.safe_publish(
-                        f"{self.topic_values}/{frameAddress:02d}/settings",
-                        json.dumps({
-                            "charge_voltage": truncate(read32(msg.payload, 38) * 0.001, 3),
-                            "float_voltage": truncate(read32(msg.payload, 42) * 0.001, 3),
-                            "max_charge_current": truncate(read32(msg.payload, 50) * 0.001, 3),
-                            "max_discharge_current": truncate(read32(msg.payload, 62) * 0.001, 3),
-                            "charge_enabled_switch": "ON" if bool(msg.payload[118]) else "OFF",
-                            "discharge_enabled_switch": "ON" if bool(msg.payload[122]) else "OFF",
-                            "balance_start_voltage": truncate(read32(msg.payload, 138) * 0.001, 3),
-                            "balance_trigger_voltage": truncate(read32(msg.payload, 26) * 0.001, 5),
-                            "max_balance_current": truncate(read32(msg.payload, 78) * 0.001, 3),
-                            "balancer_switch": "ON" if bool(msg.payload[126]) else "OFF",
-                            "soc100_voltage": truncate(read32(msg.payload, 30) * 0.001, 3),
-                            "soc_zero_voltage": truncate(read32(msg.payload, 34) * 0.001, 3),
-                            "cell_uvp": truncate(read32(msg.payload, 10) * 0.001, 3),
-                            "cell_ovp": truncate(read32(msg.payload, 18) * 0.001, 3),
-                            "power_off_voltage": truncate(read32(msg.payload, 46) * 0.001, 3)
-                        })
-                    )
-
-                elif frameType == 0x02 and bms_registered: # decode_jk02_cell_info_
-                    self.logger.debug(f"{get_timestamp()} Update Cell Info for BMS #{frameAddress}")
-                    cellCount = self.bms_registry[frameAddress]
-
-                    battery_voltage = truncate(read32(msg.payload, 118 + 16*2) * 0.001, 3)
-                    battery_current = truncate(read32(msg.payload, 126 + 16*2) * 0.001, 3)
-                    balancing_mode = msg.payload[140 + 16*2]
-                    alarm1 = msg.payload[134]
-                    alarm2 = msg.payload[135]
-                    alarm3 = msg.payload[136]
-
-                    state = {
-                            "bat_voltage": battery_voltage,
-                            "bat_current": battery_current,
-                            "bat_power": truncate(battery_current * battery_voltage, 3),
-                            "soc": msg.payload[141 + 16*2],
-                            "soh": msg.payload[158 + 16*2],
-                            "cycles": msg.payload[150 + 16*2],
-                            "cap_remaining": truncate(read32(msg.payload, 142 + 16*2) * 0.001, 3),
-                            "cap_total": truncate(read32(msg.payload, 146 + 16*2) * 0.001, 3),
-                            "temp_mos": truncate(read16(msg.payload, 112 + 16*2) * 0.1, 3),
-                            "temp1": truncate(read16(msg.payload, 130 + 16*2) * 0.1, 3),
-                            "temp2": truncate(read16(msg.payload, 132 + 16*2) * 0.1, 3),
-                            # "temperature_3": truncate(read16(msg.payload, 222 + 16*2) * 0.1, 3), # MOS?
-                            "temp3": truncate(read16(msg.payload, 224 + 16*2) * 0.1, 3),
-                            "temp4": truncate(read16(msg.payload, 226 + 16*2) * 0.1, 3),
-                            "cell_avg_volt": truncate(read16(msg.payload, 58 + 16) * 0.001, 3),
-                            "cell_volt_diff": truncate(read16(msg.payload, 60 + 16) * 0.001, 3),
-                            "cell_max_index": msg.payload[62 + 16]+1,
-                            "cell_min_index": msg.payload[63 + 16]+1,
-                            "bal_current": truncate(read16(msg.payload, 138 + 16*2) * 0.001, 3),
-                            "bal_enabled": "ON" if bool(msg.payload[140 + 16*2] in [0x01, 0x02]) else "OFF",
-                            "bal_mode": "Off" if balancing_mode == 0x00 else ("Charging balancer" if balancing_mode == 0x01 else "Discharging balancer"),
-                            "alarm": "ON" if alarm1 != 0 or alarm2 != 0 or alarm3 != 0 else "OFF",
-                        }
-
-                    for i in range(int(cellCount)):
-                        state[f"cv{i+1:02d}"] = truncate(read16(msg.payload, i*2 + 6) * 0.001, 3)
-                        state[f"cr{i+1:02d}"] = truncate(read16(msg.payload, i*2 + 64 + 16) * 0.001, 3)
-
-                    # //  # Bit 0     Wire resistance                              0000 0000 0000 0001         0x0001 
-                    # //  # Bit 1     MOS OTP                                      0000 0000 0000 0010         0x0002
-                    # //  # Bit 2     Cell quantity                                0000 0000 0000 0100         0x0004
-                    # //  # Bit 3     Current sensor error                         0000 0000 0000 1000         0x0008
-                    # //  # Bit 4     Cell OVP                                     0000 0000 0001 0000         0x0010
-                    # //  # Bit 5     Battery OVP                                  0000 0000 0010 0000         0x0020
-                    # //  # Bit 6     Charge OCP                                   0000 0000 0100 0000         0x0040
-                    # //  # Bit 7     Charge SCP                                   0000 0000 1000 0000         0x0080
-                    # //  # Bit 8     Charge OTP                                   0000 0001 0000 0000         0x0100
-                    # //  # Bit 9     Charge UTP                                   0000 0010 0000 0000         0x0200
-                    # //  # Bit 10    CPU Aux comm error                           0000 0100 0000 0000         0x0400
-                    # //  # Bit 11    Cell UVP                                     0000 1000 0000 0000         0x0800
-                    # //  # Bit 12    Batt UVP                                     0001 0000 0000 0000         0x1000
-                    # //  # Bit 13    Discharge OCP                                0010 0000 0000 0000         0x2000
-                    # //  # Bit 14    Discharge SCP                                0100 0000 0000 0000         0x4000
-                    # //  # Bit 15    Charge MOS                                   1000 0000 0000 0000         0x8000
-                    # //  # Bit 16    Discharge MOS                           0001 0000 0000 0000 0000        0x10000
-                    # //  # Bit 17    GPS Disconneted                         0010 0000 0000 0000 0000        0x20000
-                    # //  # Bit 18    Modify PWD. in time                     0100 0000 0000 0000 0000        0x40000
-                    # //  # Bit 19    Discharge On Failed                     1000 0000 0000 0000 0000        0x80000
-                    # //  # Bit 20    Battery Over Temp Alarm            0001 0000 0000 0000 0000 0000       0x100000
-                    # //  # Bit 21    Temperature sensor anomaly         0010 0000 0000 0000 0000 0000       0x200000
-                    # //  # Bit 22    PLCModule anomaly                  0100 0000 0000 0000 0000 0000       0x400000
-                    # //  # Bit 23    Reserved                           1000 0000 0000 0000 0000 0000       0x800000
-                    alarms = []
-                    if (check_bit_of_byte(alarm1, 0)):
-                        alarms.append("Wire resistance")
-                    if (check_bit_of_byte(alarm1, 1)):
-                        alarms.append("MOS OTP")
-                    if (check_bit_of_byte(alarm1, 2)):
-                        alarms.append("Cell quantity")
-                    if (check_bit_of_byte(alarm1, 3)):
-                        alarms.append("Current sensor error")
-                    if (check_bit_of_byte(alarm1, 4)):
-                        alarms.append("Cell OVP")
-                    if (check_bit_of_byte(alarm1, 5)):
-                        alarms.append("Battery OVP")
-                    if (check_bit_of_byte(alarm1, 6)):
-                        alarms.append("Charge OCP")
-                    if (check_bit_of_byte(alarm1, 7)):
-                        alarms.append("Charge SCP")
-                    if (check_bit_of_byte(alarm2, 0)):
-                        alarms.append("Charge OTP")
-                    if (check_bit_of_byte(alarm2, 1)):
-                        alarms.append("Charge UTP")
-                    if (check_bit_of_byte(alarm2, 2)):
-                        alarms.append("CPU Aux comm error")
-                    if (check_bit_of_byte(alarm2, 3)):
-                        alarms.append("Cell UVP")
-                    if (check_bit_of_byte(alarm2, 4)):
-                        alarms.append("Batt UVP")
-                    if (check_bit_of_byte(alarm2, 5)):
-                        alarms.append("Discharge OCP")
-                    if (check_bit_of_byte(alarm2, 6)):
-                        alarms.append("Discharge SCP")
-                    if (check_bit_of_byte(alarm2, 7)):
-                        alarms.append("Charge MOS")
-                    if (check_bit_of_byte(alarm3, 0)):
-                        alarms.append("Discharge MOS")
-                    if (check_bit_of_byte(alarm3, 1)):
-                        alarms.append("GPS Disconnected")
-                    if (check_bit_of_byte(alarm3, 2)):
-                        alarms.append("Modify PWD in time")
-                    if (check_bit_of_byte(alarm3, 3)):
-                        alarms.append("Discharge On Failed")
-                    if (check_bit_of_byte(alarm3, 4)):
-                        alarms.append("Battery Over Temp Alarm")
-                    if (check_bit_of_byte(alarm3, 5)):
-                        alarms.append("Temperature sensor anomaly")
-                    if (check_bit_of_byte(alarm3, 6)):
-                        alarms.append("PLC Module anomaly")
-                    if (check_bit_of_byte(alarm3, 7)):
-                        alarms.append("Reserved")
-
-                    state["alarms"] = alarms
-
-                    self.safe_publish(
-                        f"{self.topic_values}/{frameAddress:02d}/state",
-                        json.dumps(state)
-                    )
-                else:
-                    self.logger.warning(f"{get_timestamp()} Unsupported Frame Type: {frameType} from BMS #{frameAddress}")
+            request = json.loads(payload)
+            response["id"] = request.get("id")
+            reply_to = self.history_reply_topic(request.get("reply_to"))
+            bms_ids = request.get("bms", "*")
+            fields = request.get("fields") or request.get("field") or ()
+            response["tier"] = request.get("tier", "1m")
+            response["series"] = self.history.query(
+                [bms_ids] if isinstance(bms_ids, str) else bms_ids,
+                [fields] if isinstance(fields, str) else fields,
+                response["tier"], request.get("since"), request.get("until"))
+        except (ValueError, TypeError, AttributeError) as e:
+            response["error"] = str(e)
+        self.publish(reply_to, json.dumps(response, separators=(",", ":")), priority=True, coalesce=False)
 
-            else:
-                # self.logger.debug(f"Unknown payload received: '{msg.payload.hex()}' ({len(msg.payload)} bytes)")
-                pass
+    def process_payload(self, item):
+        """Reassemble one received payload and decode the frames it completes (decode worker)."""
+        source, raw_payload, received_ns = item
+        if source == self.history_request_topic:
+            self.answer_history_query(raw_payload)
+            return
+        try:
+            if self.capture is not None:
+                self.capture.write(source, raw_payload, received_ns)
+            if self.crash_ring is not None:
+                self.crash_ring.add(source, raw_payload, received_ns)
+            self.metrics.payloads_received.inc(source)
+
+            for payload in self.reassembler.feed(source, raw_payload):
+                try:
+                    started = time.perf_counter()
+                    self.process_frame(payload, source)
+                    self.metrics.decode_seconds.observe(time.perf_counter() - started)
+                except Exception as e:
+                    self.logger.error("Error decoding frame from %s: %s", source, e, exc_info=True)
+                    self.dump_crash_ring()
         
         except Exception as e:
-            self.logger.error(f"{get_timestamp()} Error processing message: {e}", exc_info=True)
+            self.logger.error("Error processing message: %s", e, exc_info=True)
+            self.dump_crash_ring()
+
+    def dump_crash_ring(self):
+        """Write the recent raw payloads and the current exception to the crash dump directory."""
+        if self.crash_ring is None:
+            return
+        path = self.crash_ring.dump(traceback.format_exc())
+        if path is not None:
+            self.logger.error("Last %d payloads written to %s", len(self.crash_ring.payloads), path)
+
+    def flush_aggregates(self):
+        """Publish aggregation windows that ended without a new frame (periodic task)."""
+        for bms_id, state in self.aggregator.flush_expired():
+            self.publish_state(bms_id, state)
+
+    def expire_availability(self):
+        """Publish offline for the BMS that went silent (periodic task)."""
+        for bms_id in self.availability.expire():
+            self.logger.warning("BMS #%s silent for %ss - offline", bms_id, self.availability.timeout)
+            self.publish_availability(bms_id, False)
+
+    def publish_availability(self, bms_id, online):
+        self.publish(f"{self.topic_values}/{bms_id}/availability", "online" if online else "offline", retain=True, priority=True)
+
+    def availability_config(self, bms_id):
+        """Discovery availability: the proxy status and, for real BMS, their own availability topic."""
+        # Any instance of a shared subscription group may take over a BMS, so one
+        # instance going offline must not make the others' entities unavailable
+        topics = [] if self.share_group else [{"topic": self.status_topic}]
+        if bms_id != BANK_ID:
+            topics.append({"topic": f"{self.topic_values}/{bms_id}/availability"})
+        if not topics:
+            return {}
+        return {"availability": topics, "availability_mode": "all"}
+
+    def publish_bank(self):
+        """Publish the bank state if a pack reported or went stale since the last run (periodic task)."""
+        for bms_id in self.bank.expire():
+            self.logger.warning("BMS #%s silent for %ss - removed from bank totals", bms_id, self.bank.stale_after)
+        if not self.bank.dirty:
+            return
+        state = self.bank.snapshot()
+        if state is None:
+            return
+        if not self.bank_registered:
+            self.bank_registered = True
+            self.register_bank()
+        self.publish_state(BANK_ID, state)
+
+    def publish_analytics(self):
+        """Publish the analytics of the packs that reported since the last run (periodic task)."""
+        for bms_id in self.analytics.take_dirty():
+            if bms_id not in self.bms_registry:
+                continue
+            if bms_id not in self.analytics_registered:
+                self.analytics_registered.add(bms_id)
+                self.register_analytics(bms_id, self.bms_registry[bms_id])
+            analytics = self.analytics.snapshot(bms_id)
+            if self.publish_filter is None or self.publish_filter.check_state((bms_id, "analytics"), analytics):
+                self.publish(f"{self.topic_values}/{bms_id}/analytics", json.dumps(analytics))
+
+    def reject_frame(self, source, frame):
+        """Count a reassembled frame from source that failed its checksum."""
+        # The address byte cannot be trusted, so the frame is not attributed to a BMS
+        self.metrics.frames_rejected.inc("bad_checksum", jk02_decoder.frame_type(frame), source, "")
+
+    def process_frame(self, payload, source):
+        """Decode one complete, checksum-verified frame received on source."""
+        frameType = jk02_decoder.frame_type(payload)
+        bms_id = self.sources.bms_id(self.sources.namespace(source), jk02_decoder.frame_address(payload))
+        if self.tracer is not None:
+            self.tracer.trace(bms_id, frameType, payload)
+
+        # Retrieve bms from registry
+        bms_registered = bms_id in self.bms_registry
+        self.metrics.last_seen[bms_id] = time.monotonic()
+        if self.availability is not None and self.availability.seen(bms_id):
+            self.publish_availability(bms_id, True)
+
+        if frameType == jk02_decoder.FRAME_TYPE_SETTINGS: # decode_jk02_settings_
+
+            cellCount = jk02_decoder.read_cell_count(payload)
+            if not 0 < cellCount <= jk02_decoder.MAX_CELLS:
+                # Cell info frames could not be decoded with such a count
+                self.metrics.frames_rejected.inc("bad_cell_count", frameType, source, bms_id)
+                self.logger.warning("Ignoring settings frame from BMS #%s reporting %s cells", bms_id, cellCount)
+                return
+            if not bms_registered:
+                self.bms_registry.register(bms_id, cellCount)
+
+                self.logger.info("New BMS #%s registered (%s cells)", bms_id, cellCount)
+                self.announce_bms(bms_id, cellCount)
+            elif cellCount != self.bms_registry[bms_id]:
+                previous = self.bms_registry[bms_id]
+                self.bms_registry.register(bms_id, cellCount)
+
+                self.logger.warning("BMS #%s now reports %s cells instead of %s - registered again", bms_id, cellCount, previous)
+                self.unregister_cells(bms_id, cellCount, previous)
+                self.announce_bms(bms_id, cellCount)
+            else:
+                if bms_id in self.bms_registry.restored:
+                    self.announce_bms(bms_id, cellCount)
+                self.logger.debug("Update settings for BMS #%s", bms_id)
+
+            if self.compact is not None:
+                self.publish(self.compact.topic_for(bms_id), self.compact.settings(payload), priority=True)
+
+            decoded = jk02_decoder.decode_settings(payload)
+            self.bms_registry.update_settings(bms_id, decoded)
+            settings = json.dumps(decoded)
+            if self.publish_filter is None or self.publish_filter.check_payload((bms_id, "settings"), settings):
+                self.publish(
+                    f"{self.topic_values}/{bms_id}/settings",
+                    settings,
+                    priority=True
+                )
+
+        elif frameType == jk02_decoder.FRAME_TYPE_CELL_INFO and bms_registered: # decode_jk02_cell_info_
+            self.logger.debug("Update Cell Info for BMS #%s", bms_id)
+            cellCount = self.bms_registry[bms_id]
+            if bms_id in self.bms_registry.restored:
+                self.announce_bms(bms_id, cellCount, restore_settings=True)
+            if self.alarm_tracker is not None:
+                self.publish_alarm_transitions(bms_id, jk02_decoder.read_alarm_mask(payload))
+            if self.compact is not None:
+                self.publish(self.compact.topic_for(bms_id), self.compact.cell_info(payload, cellCount))
+
+            state = jk02_decoder.decode_cell_info(payload, cellCount)
+            if self.history is not None:
+                self.history.add(bms_id, state)
+            if self.analytics is not None:
+                self.analytics.update(bms_id, state, cellCount)
+            if self.bank is not None:
+                self.bank.update(bms_id, state, jk02_decoder.read_alarm_mask(payload))
+            if self.aggregator is not None:
+                state = self.aggregator.add(bms_id, state)
+            if state is not None:
+                self.publish_state(bms_id, state)
+        else:
+            self.metrics.frames_rejected.inc(
+                "unregistered" if frameType == jk02_decoder.FRAME_TYPE_CELL_INFO else "unsupported_type",
+                frameType, source, bms_id)
+            self.logger.warning("Unsupported Frame Type: %s from BMS #%s", frameType, bms_id)
+            return
+
+        self.metrics.frames_decoded.inc(frameType, bms_id)
+
+    def publish_alarm_transitions(self, bms_id, mask):
+        """Publish the alarms that were raised or cleared since the previous frame of a BMS.
+
+        Runs before any deadband or aggregation and uses the priority lane, so
+        alarms are never delayed or dropped. A BMS seen for the first time
+        gets all alarm states, but events only for its active alarms.
+        """
+        first = bms_id not in self.alarm_tracker.masks
+        changed = self.alarm_tracker.update(bms_id, mask)
+        if not changed:
+            return
+        now = time.time()
+        for bit in changed_bits(changed):
+            active = bool(mask >> bit & 1)
+            self.publish(f"{self.topic_values}/{bms_id}/alarms/{ALARM_SLUGS[bit]}", "ON" if active else "OFF", retain=True, priority=True)
+            if active or not first:
+                event = event_message(bms_id, bit, active, now)
+                self.logger.info("BMS #%s alarm %s %s", bms_id, event["alarm"], event["event"])
+                self.publish(f"{self.topic_values}/{bms_id}/alarm_event", json.dumps(event), priority=True, coalesce=False)
+
+    def publish_state(self, bms_id, state):
+        if self.output_json and (self.publish_filter is None or self.publish_filter.check_state((bms_id, "state"), state)):
+            self.publish(
+                f"{self.topic_values}/{bms_id}/state",
+                json.dumps(state)
+            )
+        if self.split_layout is not None:
+            fields = None if self.publish_filter is None else self.publish_filter.changed_fields((bms_id, "split"), state)
+            for topic, payload in self.split_layout.messages(bms_id, state, fields):
+                self.publish(topic, payload)
+
+    def state_source(self, value_topic, value_template):
+        """Topic suffix and template of an entity, moved to its plain-value topic with the split layout."""
+        if self.split_layout is not None and value_topic == "state":
+            field = template_field(value_template)
+            if field is not None:
+                return split_subtopic(field), None
+        return value_topic, value_template
+
+    def announce_bms(self, bms_id, cellCount, restore_settings=False):
+        """Register a BMS with Home Assistant and record its discovery set in the registry.
+
+        BMS restored from the registry are announced on their first frame of
+        the run (unchanged configs are not republished); restore_settings
+        also republishes their last known settings.
+        """
+        restored_settings = None
+        if restore_settings and bms_id in self.bms_registry.restored:
+            restored_settings = self.bms_registry.settings.get(bms_id)
+        self.register_bms(bms_id, cellCount)
+        if self.bms_registry.announced(bms_id, self.discovery.digest(node_id(bms_id))):
+            self.logger.info("Discovery configs of BMS #%s updated", bms_id)
+        if restored_settings is not None:
+            self.publish(f"{self.topic_values}/{bms_id}/settings", json.dumps(restored_settings), priority=True)
+
+    def unregister_cells(self, bms_id, first, last):
+        """Handle a cell count change: delete the entities of cells first+1 .. last and reset the publish filter."""
+        prefix = f"{self.topic_registration}/sensor/{node_id(bms_id)}"
+        for i in range(first, last):
+            for id in ("cell_voltage", "cell_resistance", "cell_deviation", "cell_resistance_trend"):
+                self.discovery.remove(f"{prefix}/{id}_{i+1:02d}/config")
+        # Analytics sensors are registered again with the new cell count
+        self.analytics_registered.discard(bms_id)
+        if self.publish_filter is not None:
+            # The next frames have a different layout, publish them in full
+            for kind in ("state", "split", "analytics", "settings"):
+                self.publish_filter.forget((bms_id, kind))
+
+    def register_bms(self, bms_id, cellCount):
+        """Publish Home Assistant discovery configs for a newly seen BMS."""
+        # main category
+        self.sensor_registration(bms_id, "SOC", "soc", "battery", "%", None, "state", "{{ value_json.soc | float }}", 1)
+        self.sensor_registration(bms_id, "SOH", "soh", "battery", "%", None, "state", "{{ value_json.soh | float }}", 1)
+        self.sensor_registration(bms_id, "Cycles", "cycles", None, None, None, "state", "{{ value_json.cycles | int }}", 0)
+        self.sensor_registration(bms_id, "Capacity Remaining", "capacity_remaining", None, "Ah", None, "state", "{{ value_json.cap_remaining | float }}", 3)
+        self.sensor_registration(bms_id, "Capacity Total", "capacity_total", None, "Ah", None, "state", "{{ value_json.cap_total | float }}", 3)
+        self.sensor_registration(bms_id, "Battery Voltage", "battery_voltage", "voltage", "V", None, "state", "{{ value_json.bat_voltage | float }}", 3)
+        self.sensor_registration(bms_id, "Battery Current", "battery_current", "current", "A", None, "state", "{{ value_json.bat_current | float }}", 2)
+        self.sensor_registration(bms_id, "Battery Power", "battery_power", "power", "W", None, "state", "{{ value_json.bat_power | float }}", 2)
+        self.sensor_registration(bms_id, "Temperature MOS", "temperature_mos", "temperature", "°C", None, "state", "{{ value_json.temp_mos | float }}", 1)
+        self.sensor_registration(bms_id, "Temperature #1", "temperature_1", "temperature", "°C", None, "state", "{{ value_json.temp1 | float }}", 1)
+        self.sensor_registration(bms_id, "Temperature #2", "temperature_2", "temperature", "°C", None, "state", "{{ value_json.temp2 | float }}", 1)
+        self.sensor_registration(bms_id, "Temperature #3", "temperature_3", "temperature", "°C", None, "state", "{{ value_json.temp3 | float }}", 1)
+        self.sensor_registration(bms_id, "Temperature #4", "temperature_4", "temperature", "°C", None, "state", "{{ value_json.temp4 | float }}", 1)
+        self.sensor_registration(bms_id, "Cells Average Voltage", "cell_average_voltage", "voltage", "V", None, "state", "{{ value_json.cell_avg_volt | float }}", 3)
+        self.sensor_registration(bms_id, "Cells Voltage Diff", "cell_voltage_diff", "voltage", "V", None, "state", "{{ value_json.cell_volt_diff | float }}", 3)
+        self.sensor_registration(bms_id, "Cells Max Index", "cell_max_index", None, None, None, "state", "{{ value_json.cell_max_index | int }}", 0)
+        self.sensor_registration(bms_id, "Cells Min Index", "cell_min_index", None, None, None, "state", "{{ value_json.cell_min_index | int }}", 0)
+
+        for i in range(int(cellCount)):
+            self.sensor_registration(
+                bms_id,
+                f"Cell Voltage #{i+1:02d}",
+                f"cell_voltage_{i+1:02d}",
+                "voltage",
+                "V",
+                None,
+                "state",
+                f"{{{{ value_json.cv{i+1:02d} | float }}}}",
+                3
+            )
+        for i in range(int(cellCount)):
+            self.sensor_registration(
+                bms_id,
+                f"Cell Resistance #{i+1:02d}",
+                f"cell_resistance_{i+1:02d}",
+                None,
+                "mΩ",
+                None,
+                "state",
+                f"{{{{ value_json.cr{i+1:02d} | float }}}}",
+                3
+            )
+        self.sensor_registration(bms_id, "Balancing Current", "balancing_current", "current", "A", None, "state", "{{ value_json.bal_current | float }}", 3)
+        self.binary_sensor_registration(bms_id, "Balancing Enabled", "balancing_enabled", None, None, None, "state", "{{ value_json.bal_enabled }}", 0)
+        self.sensor_registration(bms_id, "Balancing Mode", "balancing_mode", None, None, None, "state", "{{ value_json.bal_mode }}", None)
+        self.binary_sensor_registration(bms_id, "Alarm", "alarm", "safety", None, None, "state", "{{ value_json.alarm }}", 0)
+        if self.alarm_tracker is not None:
+            for name, slug in zip(ALARM_NAMES, ALARM_SLUGS):
+                if name != "Reserved":
+                    self.binary_sensor_registration(bms_id, f"Alarm {name}", f"alarm_{slug}", "problem", None, None, f"alarms/{slug}", None, 0)
+
+        # diagnostic category
+        self.sensor_registration(bms_id, "Charge Voltage", "charge_voltage", "voltage", "V", "diagnostic", "settings", "{{ value_json.charge_voltage | float }}", 3)
+        self.sensor_registration(bms_id, "Float Voltage", "float_voltage", "voltage", "V", "diagnostic", "settings", "{{ value_json.float_voltage | float }}", 3)
+        self.sensor_registration(bms_id, "Max Charge Current", "max_charge_current", "current", "A", "diagnostic", "settings", "{{ value_json.max_charge_current | float }}", 3)
+        self.sensor_registration(bms_id, "Max Discharge Current", "max_discharge_current", "current", "A", "diagnostic", "settings", "{{ value_json.max_discharge_current | float }}", 3)
+        self.sensor_registration(bms_id, "Balance Start Voltage", "balance_start_voltage", "voltage", "V", "diagnostic", "settings", "{{ value_json.balance_start_voltage | float }}", 3)
+        self.sensor_registration(bms_id, "Balance Trigger Voltage", "balance_trigger_voltage", "voltage", "V", "diagnostic", "settings", "{{ value_json.balance_trigger_voltage | float }}", 5)
+        self.sensor_registration(bms_id, "Max Balance Current", "max_balance_current", "current", "A", "diagnostic", "settings", "{{ value_json.max_balance_current | float }}", 3)
+        self.sensor_registration(bms_id, "SOC 100% Voltage", "soc100_voltage", "voltage", "V", "diagnostic", "settings", "{{ value_json.soc100_voltage | float }}", 3)
+        self.sensor_registration(bms_id, "SOC 0% Voltage", "soc_zero_voltage", "voltage", "V", "diagnostic", "settings", "{{ value_json.soc_zero_voltage | float }}", 3)
+        self.sensor_registration(bms_id, "Cell UVP", "cell_uvp", "voltage", "V", "diagnostic", "settings", "{{ value_json.cell_uvp | float }}", 3)
+        self.sensor_registration(bms_id, "Cell OVP", "cell_ovp", "voltage", "V", "diagnostic", "settings", "{{ value_json.cell_ovp | float }}", 3)
+        self.sensor_registration(bms_id, "Power Off Voltage", "power_off_voltage", "voltage", "V", "diagnostic", "settings", "{{ value_json.power_off_voltage | float }}", 3)
+        self.binary_sensor_registration(bms_id, "Charge Enabled Switch", "charge_enabled_switch", None, None, "diagnostic", "settings", "{{ value_json.charge_enabled_switch }}")
+        self.binary_sensor_registration(bms_id, "Discharge Enabled Switch", "discharge_enabled_switch", None, None, "diagnostic", "settings", "{{ value_json.discharge_enabled_switch }}")
+        self.binary_sensor_registration(bms_id, "Balancer Switch", "balancer_switch", None, None, "diagnostic", "settings", "{{ value_json.balancer_switch }}")
     
-    def on_subscribe(self, client, userdata, mid, granted_qos):
-        self.logger.info(f"{get_timestamp()} Subscription confirmed with QoS: {granted_qos}")
+    def register_bank(self):
+        """Publish Home Assistant discovery configs for the virtual bank device."""
+        self.sensor_registration(BANK_ID, "SOC", "soc", "battery", "%", None, "state", "{{ value_json.soc | float }}", 1)
+        self.sensor_registration(BANK_ID, "Capacity Remaining", "capacity_remaining", None, "Ah", None, "state", "{{ value_json.cap_remaining | float }}", 3)
+        self.sensor_registration(BANK_ID, "Capacity Total", "capacity_total", None, "Ah", None, "state", "{{ value_json.cap_total | float }}", 3)
+        self.sensor_registration(BANK_ID, "Battery Voltage", "battery_voltage", "voltage", "V", None, "state", "{{ value_json.bat_voltage | float }}", 3)
+        self.sensor_registration(BANK_ID, "Battery Current", "battery_current", "current", "A", None, "state", "{{ value_json.bat_current | float }}", 2)
+        self.sensor_registration(BANK_ID, "Battery Power", "battery_power", "power", "W", None, "state", "{{ value_json.bat_power | float }}", 2)
+        self.sensor_registration(BANK_ID, "Cell Min Voltage", "cell_min_voltage", "voltage", "V", None, "state", "{{ value_json.cell_min_volt | float }}", 3)
+        self.sensor_registration(BANK_ID, "Cell Min BMS", "cell_min_bms", None, None, None, "state", "{{ value_json.cell_min_bms }}", None)
+        self.sensor_registration(BANK_ID, "Cell Min Index", "cell_min_index", None, None, None, "state", "{{ value_json.cell_min_index | int }}", 0)
+        self.sensor_registration(BANK_ID, "Cell Max Voltage", "cell_max_voltage", "voltage", "V", None, "state", "{{ value_json.cell_max_volt | float }}", 3)
+        self.sensor_registration(BANK_ID, "Cell Max BMS", "cell_max_bms", None, None, None, "state", "{{ value_json.cell_max_bms }}", None)
+        self.sensor_registration(BANK_ID, "Cell Max Index", "cell_max_index", None, None, None, "state", "{{ value_json.cell_max_index | int }}", 0)
+        self.sensor_registration(BANK_ID, "Temperature Max", "temperature_max", "temperature", "°C", None, "state", "{{ value_json.temp_max | float }}", 1)
+        self.sensor_registration(BANK_ID, "Temperature Max BMS", "temperature_max_bms", None, None, None, "state", "{{ value_json.temp_max_bms }}", None)
+        self.sensor_registration(BANK_ID, "Packs Online", "packs_online", None, None, None, "state", "{{ value_json.packs_online | int }}", 0)
+        self.sensor_registration(BANK_ID, "Packs Stale", "packs_stale", None, None, "diagnostic", "state", "{{ value_json.packs_stale | int }}", 0)
+        self.binary_sensor_registration(BANK_ID, "Alarm", "alarm", "safety", None, None, "state", "{{ value_json.alarm }}", 0)
+
+    def register_analytics(self, bms_id, cellCount):
+        """Publish Home Assistant discovery configs for the analytics of a BMS."""
+        self.sensor_registration(bms_id, "Charge Energy", "charge_energy", "energy", "kWh", None, "analytics", "{{ value_json.charge_energy | float }}", 3, state_class="total_increasing")
+        self.sensor_registration(bms_id, "Discharge Energy", "discharge_energy", "energy", "kWh", None, "analytics", "{{ value_json.discharge_energy | float }}", 3, state_class="total_increasing")
+        self.sensor_registration(bms_id, "Charge Ah", "charge_ah", None, "Ah", None, "analytics", "{{ value_json.charge_ah | float }}", 3, state_class="total_increasing")
+        self.sensor_registration(bms_id, "Discharge Ah", "discharge_ah", None, "Ah", None, "analytics", "{{ value_json.discharge_ah | float }}", 3, state_class="total_increasing")
+        self.sensor_registration(bms_id, "Cells Max Deviation", "cell_deviation_max", "voltage", "mV", None, "analytics", "{{ value_json.cell_dev_max | float }}", 1, state_class="measurement")
+        self.sensor_registration(bms_id, "Cells Max Deviation Index", "cell_deviation_max_index", None, None, None, "analytics", "{{ value_json.cell_dev_max_index | int }}", 0)
+
+        for i in range(int(cellCount)):
+            self.sensor_registration(
+                bms_id,
+                f"Cell Deviation #{i+1:02d}",
+                f"cell_deviation_{i+1:02d}",
+                "voltage",
+                "mV",
+                "diagnostic",
+                "analytics",
+                f"{{{{ value_json.cd{i+1:02d} | float }}}}",
+                1,
+                state_class="measurement"
+            )
+        for i in range(int(cellCount)):
+            self.sensor_registration(
+                bms_id,
+                f"Cell Resistance Trend #{i+1:02d}",
+                f"cell_resistance_trend_{i+1:02d}",
+                None,
+                "mΩ",
+                "diagnostic",
+                "analytics",
+                f"{{{{ value_json.rt{i+1:02d} | float }}}}",
+                3,
+                state_class="measurement"
+            )
+
+    def on_subscribe(self, client, userdata, mid, granted_qos, properties=None):
+        self.logger.info("Subscription confirmed with QoS: %s", granted_qos)
+        if mid == self.subscription_mid:
+            self.discovery.finish_readback(client)
     
     def print_connection_error(self, rc):
         error_messages = {
@@ -378,27 +679,27 @@ class RS485MQTTClient:
             4: "Connection refused - bad username or password",
             5: "Connection refused - not authorised"
         }
-        if rc in error_messages:
-            self.logger.error(f"{get_timestamp()} MQTT Error: {error_messages[rc]}")
+        if isinstance(rc, int) and rc in error_messages:
+            self.logger.error("MQTT Error: %s", error_messages[rc])
         else:
-            self.logger.error(f"{get_timestamp()} Unknown MQTT connection error: {rc}")
+            self.logger.error("Unknown MQTT connection error: %s", rc)
 
-    def build_sensor_registration(self, address, name, id, device_class, unit_of_measurement, entity_category, value_template = "{{ value }}", precision = 3):
+    def build_sensor_registration(self, bms_id, name, id, device_class, unit_of_measurement, entity_category, value_template = "{{ value }}", precision = 3):
         r = {
                 "name": name,
-                "unique_id": f"jk_bms_{address:02d}_{id}",
-                "state_topic": f"{self.topic_values}/{address:02d}/{id}",
+                "unique_id": f"{node_id(bms_id)}_{id}",
+                "state_topic": f"{self.topic_values}/{bms_id}/{id}",
                 "value_template": value_template,
                 "device_class": device_class,
                 "unit_of_measurement": unit_of_measurement,
                 "suggested_display_precision": precision,
-                "force_update": True,
+                "force_update": self.force_update,
                 "device": {
-                    "name": f'JK BMS #{address:02d}',
+                    "name": device_name(bms_id),
                     "manufacturer": "JK Battery",
                     "model": "JK Inverter BMS",
                     "identifiers": [
-                        f"jk_bms_{address:02d}"
+                        node_id(bms_id)
                     ]
                 }
             }
@@ -406,25 +707,26 @@ class RS485MQTTClient:
             r["entity_category"] = entity_category
         return json.dumps(r, indent=4)
     
-    def sensor_registration(self, address, name, id, device_class, unit_of_measurement, entity_category, value_topic, value_template = "{{ value }}", precision = 3):
+    def sensor_registration(self, bms_id, name, id, device_class, unit_of_measurement, entity_category, value_topic, value_template = "{{ value }}", precision = 3, state_class = None):
+        value_topic, value_template = self.state_source(value_topic, value_template)
         r = {
                 "name": name,
-                "unique_id": f"jk_bms_{address:02d}_{id}",
-                "state_topic": f"{self.topic_values}/{address:02d}/{value_topic}",
+                "unique_id": f"{node_id(bms_id)}_{id}",
+                "state_topic": f"{self.topic_values}/{bms_id}/{value_topic}",
                 "value_template": value_template,
                 "suggested_display_precision": precision,
-                "force_update": True,
+                "force_update": self.force_update,
                 "device": {
-                    "name": f'JK BMS #{address:02d}',
+                    "name": device_name(bms_id),
                     "manufacturer": "JK Battery",
                     "model": "JK Inverter BMS",
                     "identifiers": [
-                        f"jk_bms_{address:02d}"
+                        node_id(bms_id)
                     ]
                 }
             }
         
-        if device_class is not None:
+        if unit_of_measurement is not None:
             r["unit_of_measurement"] = unit_of_measurement
 
         if device_class is not None:
@@ -433,92 +735,176 @@ class RS485MQTTClient:
         if entity_category is not None:
             r["entity_category"] = entity_category
 
+        if state_class is not None:
+            r["state_class"] = state_class
+
+        if value_template is None:
+            r.pop("value_template")
+
+        if self.availability is not None:
+            r.update(self.availability_config(bms_id))
+
         if precision is None:
             r.pop("suggested_display_precision", None)
 
-        self.safe_publish(
-            f'{self.topic_registration}/sensor/jk_bms_{address:02d}/{id}/config',
-            json.dumps(r, indent=4)
+        self.discovery.publish(
+            f'{self.topic_registration}/sensor/{node_id(bms_id)}/{id}/config',
+            r
         )
 
-    def binary_sensor_registration(self, address, name, id, device_class, unit_of_measurement, entity_category, value_topic, value_template = "{{ value }}", precision = 3):
+    def binary_sensor_registration(self, bms_id, name, id, device_class, unit_of_measurement, entity_category, value_topic, value_template = "{{ value }}", precision = 3):
+        value_topic, value_template = self.state_source(value_topic, value_template)
         r = {
                 "name": name,
-                "unique_id": f"jk_bms_{address:02d}_{id}",
-                "state_topic": f"{self.topic_values}/{address:02d}/{value_topic}",
+                "unique_id": f"{node_id(bms_id)}_{id}",
+                "state_topic": f"{self.topic_values}/{bms_id}/{value_topic}",
                 "value_template": value_template,
                 "device_class": device_class,
                 "unit_of_measurement": unit_of_measurement,
                 "suggested_display_precision": precision,
-                "force_update": True,
+                "force_update": self.force_update,
                 "device": {
-                    "name": f'JK BMS #{address:02d}',
+                    "name": device_name(bms_id),
                     "manufacturer": "JK Battery",
                     "model": "JK Inverter BMS",
                     "identifiers": [
-                        f"jk_bms_{address:02d}"
+                        node_id(bms_id)
                     ]
                 }
             }
         if entity_category is not None:
             r["entity_category"] = entity_category
 
-        self.safe_publish(
-            f'{self.topic_registration}/binary_sensor/jk_bms_{address:02d}/{id}/config',
-            json.dumps(r, indent=4)
+        if value_template is None:
+            r.pop("value_template")
+
+        if self.availability is not None:
+            r.update(self.availability_config(bms_id))
+
+        self.discovery.publish(
+            f'{self.topic_registration}/binary_sensor/{node_id(bms_id)}/{id}/config',
+            r
         )
 
+    def create_client(self):
+        """Create the paho client with all callbacks set."""
+        # Shared subscriptions need MQTT 5
+        self.client = mqtt.Client(protocol=mqtt.MQTTv5 if self.share_group else mqtt.MQTTv311)
+        
+        # Set callbacks
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_subscribe = self.on_subscribe
+        self.client.on_publish = self.discovery.on_publish
+        self.discovery.attach(self.client)
+        if self.availability is not None:
+            # The broker marks every entity unavailable if the proxy drops off
+            self.client.will_set(self.status_topic, "offline", qos=1, retain=True)
+        if self.history is not None:
+            self.client.message_callback_add(self.history_request_topic, self.on_history_request)
+        
+        # Set username and password
+        self.client.username_pw_set(self.username, self.password)
+
+    def publish_offline(self):
+        """Mark the proxy offline before a clean disconnect, which does not trigger the last will."""
+        if self.availability is not None and self.client.is_connected():
+            self.client.publish(self.status_topic, "offline", qos=1, retain=True)
+
+    def start_metrics_server(self):
+        if self.metrics_port:
+            self.metrics_server = MetricsServer(self.metrics.registry, self.metrics_port)
+            self.metrics_server.start()
+            self.logger.info("Serving metrics on port %s at /metrics", self.metrics_port)
+
+    def on_sigterm(self, signum, frame):
+        # A stopped add-on gets SIGTERM: shut down exactly as on Ctrl+C so the
+        # offline status, analytics totals and capture file are written
+        raise KeyboardInterrupt
+
+    def shutdown(self):
+        self.pipeline.stop()
+        if self.analytics is not None:
+            self.analytics.save()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.capture is not None:
+            self.capture.close()
+
     def connect_and_listen(self):
+        if self.engine == "asyncio":
+            try:
+                return asyncio.run(self.listen_async())
+            except KeyboardInterrupt:
+                self.logger.info("Shutting down...")
+                return True
+
         try:
-            # Initialize log file
-            self.logger.info(f"{get_timestamp()} Logging data to: {os.path.abspath(self.log_file)}")
+            if self.capture is not None:
+                self.logger.info("Capturing raw frames to: %s", os.path.abspath(self.capture.path))
             
             # Create MQTT client
-            self.client = mqtt.Client()
-            
-            # Set callbacks
-            self.client.on_connect = self.on_connect
-            self.client.on_message = self.on_message
-            self.client.on_disconnect = self.on_disconnect
-            self.client.on_subscribe = self.on_subscribe
-            
-            # Set username and password
-            self.client.username_pw_set(self.username, self.password)
-            
-            self.logger.info(f"{get_timestamp()} Connecting to MQTT broker at {self.broker_host}:{self.broker_port}...")
-            
-            # Initial connection with retry
-            connected = False
-            for attempt in range(1, 6):  # Try 5 times
-                try:
-                    self.logger.info(f"{get_timestamp()} Initial connection attempt {attempt}/5...")
-                    self.client.connect(self.broker_host, self.broker_port, 60)
-                    connected = True
-                    break
-                except Exception as e:
-                    self.logger.error(f"{get_timestamp()} Initial connection attempt {attempt} failed: {e}")
-                    if attempt < 5:
-                        time.sleep(5)  # Wait 5 seconds before retry
+            self.create_client()
+
+            # Reconnects are driven by paho's loop with exponential backoff
+            self.client.reconnect_delay_set(min_delay=1, max_delay=self.reconnect_max_delay)
             
-            if not connected:
-                self.logger.error(f"{get_timestamp()} Failed to establish initial connection after 5 attempts - exiting")
-                sys.exit(1)
+            self.logger.info("Connecting to MQTT broker at %s:%s...", self.broker_host, self.broker_port)
+            self.client.connect_async(self.broker_host, self.broker_port, 60)
+
+            self.start_metrics_server()
+            self.pipeline.start()
+            signal.signal(signal.SIGTERM, self.on_sigterm)
             
             # Start the loop
-            self.logger.info(f"{get_timestamp()} Starting MQTT client loop...")
-            self.logger.info(f"{get_timestamp()} Waiting for RS485 data... (Press Ctrl+C to exit)")
-            self.client.loop_forever()
+            self.logger.info("Starting MQTT client loop...")
+            self.logger.info("Waiting for RS485 data... (Press Ctrl+C to exit)")
+            self.client.loop_forever(retry_first_connection=True)
             
         except KeyboardInterrupt:
-            self.logger.info(f"{get_timestamp()} Shutting down...")
+            self.logger.info("Shutting down...")
             if self.client:
+                self.publish_offline()
                 self.client.disconnect()
         except Exception as e:
-            self.logger.error(f"{get_timestamp()} Error: {e}", exc_info=True)
+            self.logger.error("Error: %s", e, exc_info=True)
             return False
+        finally:
+            self.shutdown()
         
         return True
 
+    async def listen_async(self):
+        """asyncio engine: paho, decoding, publishing and periodic tasks share one event loop."""
+        try:
+            if self.capture is not None:
+                self.logger.info("Capturing raw frames to: %s", os.path.abspath(self.capture.path))
+
+            self.create_client()
+            mqtt_loop = AsyncMqttLoop(self.client, self.reconnect_max_delay)
+            # SIGTERM cancels this task, like Ctrl+C does under asyncio.run()
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+            self.start_metrics_server()
+            self.pipeline.start()
+
+            self.logger.info("Connecting to MQTT broker at %s:%s (asyncio engine)...", self.broker_host, self.broker_port)
+            self.logger.info("Waiting for RS485 data... (Press Ctrl+C to exit)")
+            await mqtt_loop.run(self.broker_host, self.broker_port, 60)
+
+        except asyncio.CancelledError:
+            self.logger.info("Shutting down...")
+            if self.client:
+                self.publish_offline()
+                self.client.disconnect()
+        except Exception as e:
+            self.logger.error("Error: %s", e, exc_info=True)
+            return False
+        finally:
+            self.shutdown()
+
+        return True
 
 def main():
     """Main function to start the RS485 MQTT client."""
@@ -531,22 +917,182 @@ def main():
     TOPIC_VALUES = os.getenv("TOPIC_VALUES", "rs485tx/bms")
     TOPIC_REGISTRATION = os.getenv("TOPIC_REGISTRATION", "homeassistant")
     LOG_LEVEL = os.getenv("LOG_LEVEL", "info")
+    ENGINE = os.getenv("ENGINE", "thread")
+    OUTPUT_LAYOUT = os.getenv("OUTPUT_LAYOUT", "json")
+    ANALYTICS = os.getenv("ANALYTICS", "false") == "true"
+    ANALYTICS_PATH = os.getenv("ANALYTICS_PATH", "/share/jk_bms_rs485_proxy/analytics.json")
+    ANALYTICS_INTERVAL = int(os.getenv("ANALYTICS_INTERVAL", "10"))
+    BANK = os.getenv("BANK", "false") == "true"
+    BANK_INTERVAL = int(os.getenv("BANK_INTERVAL", "5"))
+    BANK_STALE_AFTER = int(os.getenv("BANK_STALE_AFTER", "60"))
+    TRACE_FRAMES = os.getenv("TRACE_FRAMES", "")
+    CRASH_RING_SIZE = int(os.getenv("CRASH_RING_SIZE", "200"))
+    CRASH_DUMP_PATH = os.getenv("CRASH_DUMP_PATH", "/share/jk_bms_rs485_proxy/crash")
+    ALARM_EVENTS = os.getenv("ALARM_EVENTS", "false") == "true"
+    AVAILABILITY_TIMEOUT = int(os.getenv("AVAILABILITY_TIMEOUT", "0"))
+    REGISTRY_PATH = os.getenv("REGISTRY_PATH", "/share/jk_bms_rs485_proxy/registry.json")
+    HISTORY = os.getenv("HISTORY", "false") == "true"
+    HISTORY_FIELDS = os.getenv("HISTORY_FIELDS", "bat_voltage,bat_current,bat_power,soc,temp,cell_volt_diff,cv")
+    HISTORY_MEMORY_MB = int(os.getenv("HISTORY_MEMORY_MB", "32"))
+    COMPACT_FORMAT = os.getenv("COMPACT_FORMAT", "off")
+    COMPACT_TOPIC = os.getenv("COMPACT_TOPIC", "rs485tx/compact")
+    SHARE_GROUP = os.getenv("SHARE_GROUP", "")
+    INSTANCE_INDEX = int(os.getenv("INSTANCE_INDEX", "0"))
+    INSTANCE_COUNT = int(os.getenv("INSTANCE_COUNT", "1"))
+    VERIFY_CHECKSUM = os.getenv("VERIFY_CHECKSUM", "true") == "true"
+    METRICS = os.getenv("METRICS", "false") == "true"
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "9105"))
+    QUEUE_SIZE = int(os.getenv("QUEUE_SIZE", "1000"))
+    RECONNECT_MAX_DELAY = int(os.getenv("RECONNECT_MAX_DELAY", "120"))
+    STORE_FORWARD = os.getenv("STORE_FORWARD", "false") == "true"
+    STORE_FORWARD_PATH = os.getenv("STORE_FORWARD_PATH", "/share/jk_bms_rs485_proxy/store_forward.bin")
+    STORE_FORWARD_SIZE_MB = int(os.getenv("STORE_FORWARD_SIZE_MB", "16"))
+    REPLAY_RATE = float(os.getenv("REPLAY_RATE", "20"))
+    CAPTURE = os.getenv("CAPTURE", "false") == "true"
+    CAPTURE_PATH = os.getenv("CAPTURE_PATH", "/share/jk_bms_rs485_proxy/capture.jkcap")
+    CAPTURE_MAX_MB = int(os.getenv("CAPTURE_MAX_MB", "50"))
+    CAPTURE_BACKUPS = int(os.getenv("CAPTURE_BACKUPS", "5"))
+    CAPTURE_COMPRESS = os.getenv("CAPTURE_COMPRESS", "true") == "true"
+    PUBLISH_MODE = os.getenv("PUBLISH_MODE", "all")
+    AGGREGATE_WINDOW = float(os.getenv("AGGREGATE_WINDOW", "10"))
+    PUBLISH_MAX_INTERVAL = int(os.getenv("PUBLISH_MAX_INTERVAL", "300"))
+    DEADBANDS = {
+        "cell_voltage": float(os.getenv("DEADBAND_CELL_VOLTAGE", "0.005")),
+        "cell_resistance": float(os.getenv("DEADBAND_CELL_RESISTANCE", "0.005")),
+        "voltage": float(os.getenv("DEADBAND_VOLTAGE", "0.05")),
+        "current": float(os.getenv("DEADBAND_CURRENT", "0.1")),
+        "power": float(os.getenv("DEADBAND_POWER", "5")),
+        "temperature": float(os.getenv("DEADBAND_TEMPERATURE", "0.1")),
+        "capacity": float(os.getenv("DEADBAND_CAPACITY", "0.1")),
+    }
     
     # Setup logging
     logger = setup_logging(LOG_LEVEL)
     
     logger.info("RS485 MQTT Client for JK-BMS Data")
     logger.info("=" * 40)
-    logger.info(f"Broker: {BROKER_HOST}:{BROKER_PORT}")
-    logger.info(f"Topic-TX: {TOPIC_TX}")
-    logger.info(f"Topic-HA-values: {TOPIC_VALUES}")
-    logger.info(f"Topic-HA-registration: {TOPIC_REGISTRATION}")
-    logger.info(f"User: {USERNAME}")
-    logger.info(f"Log Level: {LOG_LEVEL}")
+    logger.info("Broker: %s:%s", BROKER_HOST, BROKER_PORT)
+    logger.info("Topic-TX: %s", TOPIC_TX)
+    logger.info("Topic-HA-values: %s", TOPIC_VALUES)
+    logger.info("Topic-HA-registration: %s", TOPIC_REGISTRATION)
+    logger.info("User: %s", USERNAME)
+    logger.info("Log Level: %s", LOG_LEVEL)
+    logger.info("Publish Mode: %s", PUBLISH_MODE)
+    logger.info("Output Layout: %s", OUTPUT_LAYOUT)
+    logger.info("Engine: %s", ENGINE)
+    if INSTANCE_COUNT > 1:
+        logger.info("Instance: %s of %s", INSTANCE_INDEX + 1, INSTANCE_COUNT)
     logger.info("=" * 40)
+
+    if not 0 <= INSTANCE_INDEX < INSTANCE_COUNT:
+        # Such an instance would own no gateway and silently decode nothing
+        logger.error("instance_index %s is out of range for instance_count %s (0 to %s)",
+                     INSTANCE_INDEX, INSTANCE_COUNT, INSTANCE_COUNT - 1)
+        sys.exit(1)
+
+    if SHARE_GROUP and INSTANCE_COUNT > 1:
+        # Each instance would get only its share of the payloads and then drop
+        # every one it does not own, losing most frames
+        logger.error("share_group cannot be combined with instance_count > 1 - ignoring share_group %s, "
+                     "instance_count splits the gateways on any broker", SHARE_GROUP)
+        SHARE_GROUP = ""
+    elif SHARE_GROUP:
+        logger.warning("!" * 40)
+        logger.warning("share_group %s: the broker hands each payload to one instance, but frames are reassembled "
+                       "and BMS registered per instance. This only works if the broker keeps every topic on the same "
+                       "subscriber (e.g. EMQX's hash_topic strategy). With round-robin brokers such as Mosquitto frames "
+                       "split across payloads are lost and BMS stay unregistered - use instance_count instead.", SHARE_GROUP)
+        logger.warning("!" * 40)
     
+    publish_filter = None
+    if PUBLISH_MODE == "change":
+        publish_filter = PublishFilter(expand_deadbands(DEADBANDS), PUBLISH_MAX_INTERVAL)
+        logger.info("Deadbands: %s, heartbeat every %ss", DEADBANDS, PUBLISH_MAX_INTERVAL)
+
+    aggregator = None
+    if PUBLISH_MODE == "aggregate":
+        aggregator = StateAggregator(AGGREGATE_WINDOW)
+        logger.info("Aggregation window: %ss", AGGREGATE_WINDOW)
+
+    spool = None
+    if STORE_FORWARD:
+        spool = StoreForwardBuffer(STORE_FORWARD_PATH, STORE_FORWARD_SIZE_MB * 1024 * 1024)
+        logger.info("Store-and-forward buffer: %s (%s MB, replay %s msg/s)", STORE_FORWARD_PATH, STORE_FORWARD_SIZE_MB, REPLAY_RATE)
+
+    compact = None
+    # An unquoted `off` in YAML 1.1 is the boolean false
+    if COMPACT_FORMAT.strip().lower() not in ("off", "false", "null", ""):
+        try:
+            compact = CompactEncoder(COMPACT_TOPIC, COMPACT_FORMAT.strip().lower())
+            logger.info("Compact output: %s on %s", compact.encoding, COMPACT_TOPIC)
+        except ValueError as e:
+            logger.error("Compact output disabled: %s", e)
+
+    # Typical topics the proxy publishes; a topic_tx matching any of them
+    # (e.g. rs485tx/#) would make the proxy decode its own output
+    outputs = [f"{TOPIC_VALUES}/status", f"{TOPIC_VALUES}/01/state", f"{TOPIC_VALUES}/01/pack/soc",
+               f"{TOPIC_VALUES}/history/request", f"{TOPIC_REGISTRATION}/sensor/jk_bms_01/soc/config"]
+    if compact is not None:
+        outputs += [f"{compact.topic}/01", f"{compact.topic}/schema"]
+    sources = SourceMap(TOPIC_TX)
+    overlapping = [topic for topic in outputs if sources.matches(topic)]
+    if overlapping:
+        logger.error("topic_tx %s also matches the proxy's own output (%s) - use a topic_tx outside "
+                     "topic_values, topic_registration and compact_topic", TOPIC_TX, ", ".join(overlapping))
+        sys.exit(1)
+
+    history = None
+    if HISTORY:
+        fields = [field.strip() for field in HISTORY_FIELDS.split(",") if field.strip()]
+        history = HistoryStore(fields, HISTORY_MEMORY_MB * 1024 * 1024)
+        logger.info("History: %s within %s MB (%s series)", fields, HISTORY_MEMORY_MB, history.max_series)
+
+    bank = None
+    if BANK:
+        bank = BankAggregator(BANK_STALE_AFTER)
+        logger.info("Bank device: every %ss, packs stale after %ss", BANK_INTERVAL, BANK_STALE_AFTER)
+
+    analytics = None
+    if ANALYTICS:
+        analytics = PackAnalytics(ANALYTICS_PATH)
+        logger.info("Analytics: every %ss, totals in %s", ANALYTICS_INTERVAL, ANALYTICS_PATH)
+
+    # bashio reports an option removed from the configuration as "null"
+    registry = BmsRegistry("" if REGISTRY_PATH == "null" else REGISTRY_PATH)
+
+    availability = None
+    if AVAILABILITY_TIMEOUT > 0:
+        availability = AvailabilityTracker(AVAILABILITY_TIMEOUT)
+        logger.info("Availability: BMS offline after %ss without frames", AVAILABILITY_TIMEOUT)
+
+    tracer = None
+    try:
+        # bashio reports an unset optional option as "null"
+        trace_rates = parse_trace_rates("" if TRACE_FRAMES == "null" else TRACE_FRAMES)
+    except ValueError as e:
+        logger.error("Frame tracing disabled, cannot parse trace_frames '%s': %s", TRACE_FRAMES, e)
+        trace_rates = {}
+    if trace_rates:
+        tracer = FrameTracer(trace_rates)
+        logger.info("Tracing frames: %s", trace_rates)
+
+    crash_ring = None
+    if CRASH_RING_SIZE > 0:
+        crash_ring = CrashRing(CRASH_RING_SIZE, CRASH_DUMP_PATH)
+
+    capture = None
+    if CAPTURE:
+        capture = CaptureWriter(CAPTURE_PATH, CAPTURE_MAX_MB * 1024 * 1024, CAPTURE_BACKUPS, CAPTURE_COMPRESS)
+
     # Create and start the client
-    client = RS485MQTTClient(BROKER_HOST, BROKER_PORT, USERNAME, PASSWORD, TOPIC_TX, TOPIC_REGISTRATION, TOPIC_VALUES)
+    client = RS485MQTTClient(BROKER_HOST, BROKER_PORT, USERNAME, PASSWORD, TOPIC_TX, TOPIC_REGISTRATION, TOPIC_VALUES, capture=capture, publish_filter=publish_filter, aggregator=aggregator,
+                            queue_size=QUEUE_SIZE, reconnect_max_delay=RECONNECT_MAX_DELAY, spool=spool, replay_rate=REPLAY_RATE,
+                            verify_checksum=VERIFY_CHECKSUM, metrics_port=METRICS_PORT if METRICS else None,
+                            engine=ENGINE, share_group=SHARE_GROUP, instance_index=INSTANCE_INDEX, instance_count=INSTANCE_COUNT,
+                            output_layout=OUTPUT_LAYOUT, compact=compact, history=history, bank=bank, bank_interval=BANK_INTERVAL,
+                            analytics=analytics, analytics_interval=ANALYTICS_INTERVAL, registry=registry,
+                            tracer=tracer, crash_ring=crash_ring, alarm_tracker=AlarmTracker() if ALARM_EVENTS else None,
+                            availability=availability)
     client.connect_and_listen()
 
 
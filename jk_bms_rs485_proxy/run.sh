@@ -12,7 +12,52 @@ declare topic_tx
 declare topic_values
 declare topic_registration
 declare log_level
+declare publish_mode
+declare publish_max_interval
+declare deadband_cell_voltage
+declare deadband_cell_resistance
+declare deadband_voltage
+declare deadband_current
+declare deadband_power
+declare deadband_temperature
+declare deadband_capacity
 
+declare aggregate_window
+declare queue_size
+declare reconnect_max_delay
+declare store_forward
+declare store_forward_path
+declare store_forward_size_mb
+declare replay_rate
+declare verify_checksum
+declare capture
+declare capture_path
+declare capture_max_mb
+declare capture_backups
+declare capture_compress
+declare metrics
+declare engine
+declare share_group
+declare instance_index
+declare instance_count
+declare output_layout
+declare compact_format
+declare compact_topic
+declare history
+declare history_fields
+declare history_memory_mb
+declare bank
+declare bank_interval
+declare bank_stale_after
+declare analytics
+declare analytics_path
+declare analytics_interval
+declare registry_path
+declare trace_frames
+declare crash_ring_size
+declare crash_dump_path
+declare alarm_events
+declare availability_timeout
 # Get configuration from options
 mqtt_broker_host=$(bashio::config 'mqtt_broker_host')
 mqtt_broker_port=$(bashio::config 'mqtt_broker_port')
@@ -22,6 +67,51 @@ topic_tx=$(bashio::config 'topic_tx')
 topic_values=$(bashio::config 'topic_values')
 topic_registration=$(bashio::config 'topic_registration')
 log_level=$(bashio::config 'log_level')
+publish_mode=$(bashio::config 'publish_mode')
+publish_max_interval=$(bashio::config 'publish_max_interval')
+deadband_cell_voltage=$(bashio::config 'deadband_cell_voltage')
+deadband_cell_resistance=$(bashio::config 'deadband_cell_resistance')
+deadband_voltage=$(bashio::config 'deadband_voltage')
+deadband_current=$(bashio::config 'deadband_current')
+deadband_power=$(bashio::config 'deadband_power')
+deadband_temperature=$(bashio::config 'deadband_temperature')
+deadband_capacity=$(bashio::config 'deadband_capacity')
+aggregate_window=$(bashio::config 'aggregate_window')
+queue_size=$(bashio::config 'queue_size')
+reconnect_max_delay=$(bashio::config 'reconnect_max_delay')
+store_forward=$(bashio::config 'store_forward')
+store_forward_path=$(bashio::config 'store_forward_path')
+store_forward_size_mb=$(bashio::config 'store_forward_size_mb')
+replay_rate=$(bashio::config 'replay_rate')
+verify_checksum=$(bashio::config 'verify_checksum')
+capture=$(bashio::config 'capture')
+capture_path=$(bashio::config 'capture_path')
+capture_max_mb=$(bashio::config 'capture_max_mb')
+capture_backups=$(bashio::config 'capture_backups')
+capture_compress=$(bashio::config 'capture_compress')
+metrics=$(bashio::config 'metrics')
+engine=$(bashio::config 'engine')
+share_group=$(bashio::config 'share_group')
+instance_index=$(bashio::config 'instance_index')
+instance_count=$(bashio::config 'instance_count')
+output_layout=$(bashio::config 'output_layout')
+compact_format=$(bashio::config 'compact_format')
+compact_topic=$(bashio::config 'compact_topic')
+history=$(bashio::config 'history')
+history_fields=$(bashio::config 'history_fields')
+history_memory_mb=$(bashio::config 'history_memory_mb')
+bank=$(bashio::config 'bank')
+bank_interval=$(bashio::config 'bank_interval')
+bank_stale_after=$(bashio::config 'bank_stale_after')
+analytics=$(bashio::config 'analytics')
+analytics_path=$(bashio::config 'analytics_path')
+analytics_interval=$(bashio::config 'analytics_interval')
+registry_path=$(bashio::config 'registry_path')
+trace_frames=$(bashio::config 'trace_frames')
+crash_ring_size=$(bashio::config 'crash_ring_size')
+crash_dump_path=$(bashio::config 'crash_dump_path')
+alarm_events=$(bashio::config 'alarm_events')
+availability_timeout=$(bashio::config 'availability_timeout')
 
 # Set log level
 bashio::log.level "${log_level}"
@@ -31,6 +121,7 @@ bashio::log.info "MQTT Broker: ${mqtt_broker_host}:${mqtt_broker_port}"
 bashio::log.info "TX Topic: ${topic_tx}"
 bashio::log.info "Values Topic: ${topic_values}"
 bashio::log.info "Registration Topic: ${topic_registration}"
+bashio::log.info "Publish Mode: ${publish_mode}"
 
 # Wait for MQTT service if needed
 if bashio::services.available "mqtt"; then
@@ -52,15 +143,71 @@ export TOPIC_TX="${topic_tx}"
 export TOPIC_VALUES="${topic_values}"
 export TOPIC_REGISTRATION="${topic_registration}"
 export LOG_LEVEL="${log_level}"
+export PUBLISH_MODE="${publish_mode}"
+export PUBLISH_MAX_INTERVAL="${publish_max_interval}"
+export DEADBAND_CELL_VOLTAGE="${deadband_cell_voltage}"
+export DEADBAND_CELL_RESISTANCE="${deadband_cell_resistance}"
+export DEADBAND_VOLTAGE="${deadband_voltage}"
+export DEADBAND_CURRENT="${deadband_current}"
+export DEADBAND_POWER="${deadband_power}"
+export DEADBAND_TEMPERATURE="${deadband_temperature}"
+export DEADBAND_CAPACITY="${deadband_capacity}"
+export AGGREGATE_WINDOW="${aggregate_window}"
+export QUEUE_SIZE="${queue_size}"
+export RECONNECT_MAX_DELAY="${reconnect_max_delay}"
+export STORE_FORWARD="${store_forward}"
+export STORE_FORWARD_PATH="${store_forward_path}"
+export STORE_FORWARD_SIZE_MB="${store_forward_size_mb}"
+export REPLAY_RATE="${replay_rate}"
+export VERIFY_CHECKSUM="${verify_checksum}"
+export CAPTURE="${capture}"
+export CAPTURE_PATH="${capture_path}"
+export CAPTURE_MAX_MB="${capture_max_mb}"
+export CAPTURE_BACKUPS="${capture_backups}"
+export CAPTURE_COMPRESS="${capture_compress}"
+export METRICS="${metrics}"
+export ENGINE="${engine}"
+export SHARE_GROUP="${share_group}"
+export INSTANCE_INDEX="${instance_index}"
+export INSTANCE_COUNT="${instance_count}"
+export OUTPUT_LAYOUT="${output_layout}"
+export COMPACT_FORMAT="${compact_format}"
+export COMPACT_TOPIC="${compact_topic}"
+export HISTORY="${history}"
+export HISTORY_FIELDS="${history_fields}"
+export HISTORY_MEMORY_MB="${history_memory_mb}"
+export BANK="${bank}"
+export BANK_INTERVAL="${bank_interval}"
+export BANK_STALE_AFTER="${bank_stale_after}"
+export ANALYTICS="${analytics}"
+export ANALYTICS_PATH="${analytics_path}"
+export ANALYTICS_INTERVAL="${analytics_interval}"
+export REGISTRY_PATH="${registry_path}"
+export TRACE_FRAMES="${trace_frames}"
+export CRASH_RING_SIZE="${crash_ring_size}"
+export CRASH_DUMP_PATH="${crash_dump_path}"
+export ALARM_EVENTS="${alarm_events}"
+export AVAILABILITY_TIMEOUT="${availability_timeout}"
+
+# Pass SIGTERM on to the application so it can shut down cleanly
+stopping=false
+trap 'stopping=true; kill -TERM "${child}" 2>/dev/null' TERM INT
 
 # Start the Python application with restart loop
 cd /app
 while true; do
     bashio::log.info "Starting JK-BMS RS485 MQTT Proxy application..."
-    python3 rs485_mqtt_ha_proxy.py
+    python3 rs485_mqtt_ha_proxy.py &
+    child=$!
+    wait "${child}"
     exit_code=$?
     
-    if [ $exit_code -eq 0 ]; then
+    if [ "${stopping}" = true ]; then
+        # wait returns as soon as the trap runs; let the application finish
+        wait "${child}"
+        bashio::log.info "Application stopped"
+        break
+    elif [ $exit_code -eq 0 ]; then
         bashio::log.info "Application exited normally"
         break
     else
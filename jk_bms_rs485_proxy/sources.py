@@ -0,0 +1,107 @@
+"""
+Multi-gateway ingestion: per-source namespaces and instance partitioning.
+
+With a wildcard topic_tx such as "rs485tx/+/tx" every gateway publishes on
+its own topic, and the levels matched by the wildcards ("roomA" for
+"rs485tx/roomA/tx") namespace that gateway's BMS ids, value topics and
+discovery unique ids, so two buses that both contain a BMS #01 do not collide.
+A topic_tx without wildcards keeps the plain "01" ids.
+"""
+
+import hashlib
+import re
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9_-]+")
+
+
+def shared_topic(topic, group):
+    """MQTT 5 shared subscription for topic, or topic itself if group is empty."""
+    return f"$share/{group}/{topic}" if group else topic
+
+
+def node_id(bms_id):
+    """Discovery node id / unique id prefix for a BMS id."""
+    return "jk_bms_" + bms_id.replace("/", "_")
+
+
+def device_name(bms_id):
+    """'JK BMS #01', or 'JK BMS roomA #01' for a namespaced BMS id; 'JK BMS Bank' for the bank."""
+    namespace, _, address = bms_id.rpartition("/")
+    if not address.isdigit():
+        return f"JK BMS {address.capitalize()}"
+    return f"JK BMS {namespace} #{address}" if namespace else f"JK BMS #{address}"
+
+
+def _weight(instance, namespace):
+    digest = hashlib.blake2b(f"{instance}/{namespace}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class SourceMap:
+    """Resolves source topics to namespaces, BMS ids and instance ownership.
+
+    All lookups are cached per topic, so the per-payload cost is a dict hit.
+
+    With instance_count > 1 several proxy instances subscribe to the same
+    topic_tx and each one only decodes the namespaces it owns, chosen by
+    rendezvous hashing: every gateway is always handled by the same
+    instance, and changing the instance count only moves the gateways of
+    the added or removed instance.
+    """
+
+    def __init__(self, topic_filter, instance_index=0, instance_count=1):
+        self.levels = topic_filter.split("/")
+        self.instance_index = instance_index
+        self.instance_count = max(1, instance_count)
+        self._namespaces = {}
+        self._owned = {}
+        self._bms_ids = {}
+
+    def namespace(self, topic):
+        """The wildcard levels of topic, '' if topic_tx has none or topic does not match."""
+        namespace = self._namespaces.get(topic)
+        if namespace is None:
+            namespace = self._namespaces[topic] = self._match(topic) or ""
+        return namespace
+
+    def matches(self, topic):
+        """True if topic matches the topic_tx filter."""
+        return self._match(topic) is not None
+
+    def _match(self, topic):
+        parts = topic.split("/")
+        matched = []
+        for i, level in enumerate(self.levels):
+            if level == "#":
+                matched.extend(parts[i:])
+                break
+            if i >= len(parts):
+                return None
+            if level == "+":
+                matched.append(parts[i])
+            elif level != parts[i]:
+                return None
+        else:
+            if len(parts) != len(self.levels):
+                return None
+        return "/".join(_UNSAFE.sub("_", part) for part in matched if part)
+
+    def owns(self, topic):
+        """True if this instance decodes payloads from topic."""
+        owned = self._owned.get(topic)
+        if owned is None:
+            owned = self._owned[topic] = self._owner(self.namespace(topic)) == self.instance_index
+        return owned
+
+    def _owner(self, namespace):
+        if self.instance_count == 1:
+            return 0
+        return max(range(self.instance_count), key=lambda i: _weight(i, namespace))
+
+    def bms_id(self, namespace, address):
+        """'01' for the default namespace, 'roomA/01' for gateway roomA."""
+        key = (namespace, address)
+        bms_id = self._bms_ids.get(key)
+        if bms_id is None:
+            bms_id = self._bms_ids[key] = f"{namespace}/{address:02d}" if namespace else f"{address:02d}"
+        return bms_id
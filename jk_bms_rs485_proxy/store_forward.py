@@ -0,0 +1,170 @@
+"""
+Disk-backed store-and-forward ring buffer for messages that could not be published.
+
+The buffer is a fixed-size memory-mapped file. Records are appended at the
+head in O(1); when the file is full the oldest records are overwritten.
+Replay reads records back from the tail in the order they were stored.
+Every record carries the time it was stored, which stamp_payload() adds
+to the replayed message.
+"""
+
+import datetime
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+
+MAGIC = b"JKSF"
+VERSION = 2
+
+# magic, version, data size, head, tail, used bytes, record count
+_HEADER = struct.Struct("<4sHxxQQQQQ")
+# payload length, topic length, time stored (Unix seconds)
+_RECORD = struct.Struct("<IHd")
+_WRAP_MARKER = 0xFFFFFFFF
+
+
+class StoreForwardBuffer:
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.logger = logging.getLogger(__name__)
+        self.dropped = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        total = _HEADER.size + size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fresh = os.fstat(fd).st_size != total
+            if fresh:
+                os.ftruncate(fd, total)
+            self._map = mmap.mmap(fd, total)
+        finally:
+            os.close(fd)
+
+        if not fresh:
+            magic, version, data_size, self.head, self.tail, self.used, self.count = _HEADER.unpack_from(self._map, 0)
+            fresh = magic != MAGIC or version != VERSION or data_size != size
+            if fresh and magic == MAGIC:
+                self.logger.warning("Store-and-forward buffer %s has an old format or size - starting empty", path)
+            if not fresh and self.count:
+                self.logger.info("Store-and-forward buffer %s holds %d messages", path, self.count)
+        if fresh:
+            self.head = self.tail = self.used = self.count = 0
+            self._write_header()
+
+    def _write_header(self):
+        _HEADER.pack_into(self._map, 0, MAGIC, VERSION, self.size, self.head, self.tail, self.used, self.count)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, topic, payload, timestamp=None):
+        """Store a message, overwriting the oldest ones if the buffer is full."""
+        if isinstance(topic, str):
+            topic = topic.encode()
+        if isinstance(payload, str):
+            payload = payload.encode()
+        length = _RECORD.size + len(topic) + len(payload)
+        if length > self.size:
+            self.dropped += 1
+            return False
+
+        while True:
+            if self.used and self.head == self.tail:
+                # Full
+                self._drop_oldest()
+            elif self.head >= self.tail or not self.used:
+                if self.size - self.head >= length:
+                    break
+                # Not enough room before the end of the file: wrap around
+                if self.size - self.head >= 4:
+                    struct.pack_into("<I", self._map, _HEADER.size + self.head, _WRAP_MARKER)
+                self.used += self.size - self.head
+                self.head = 0
+            elif self.tail - self.head >= length:
+                break
+            else:
+                self._drop_oldest()
+
+        position = _HEADER.size + self.head
+        _RECORD.pack_into(self._map, position, len(payload), len(topic), time.time() if timestamp is None else timestamp)
+        position += _RECORD.size
+        self._map[position:position + len(topic)] = topic
+        position += len(topic)
+        self._map[position:position + len(payload)] = payload
+        self.head += length
+        self.used += length
+        self.count += 1
+        self._write_header()
+        return True
+
+    def _record_at_tail(self):
+        """Return (record length, topic, payload, timestamp) at the tail, skipping a wrap."""
+        if self.size - self.tail < _RECORD.size or \
+                struct.unpack_from("<I", self._map, _HEADER.size + self.tail)[0] == _WRAP_MARKER:
+            self.used -= self.size - self.tail
+            self.tail = 0
+        position = _HEADER.size + self.tail
+        payload_length, topic_length, timestamp = _RECORD.unpack_from(self._map, position)
+        position += _RECORD.size
+        topic = self._map[position:position + topic_length]
+        payload = self._map[position + topic_length:position + topic_length + payload_length]
+        return _RECORD.size + topic_length + payload_length, topic, payload, timestamp
+
+    def _drop_oldest(self):
+        self._consume(self._record_at_tail()[0])
+        self.dropped += 1
+
+    def _consume(self, length):
+        self.tail += length
+        self.used -= length
+        self.count -= 1
+        if not self.count:
+            self.head = self.tail = self.used = 0
+
+    def peek(self):
+        """Return the oldest (topic, payload, timestamp) without removing it, or None."""
+        if not self.count:
+            return None
+        _, topic, payload, timestamp = self._record_at_tail()
+        return topic.decode(), payload, timestamp
+
+    def pop(self):
+        """Remove the oldest message after it was replayed successfully."""
+        if self.count:
+            self._consume(self._record_at_tail()[0])
+            self._write_header()
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        self._write_header()
+        self._map.flush()
+        self._map.close()
+
+
+def stamp_payload(payload, timestamp, binary=False):
+    """Add the time a message was stored to its payload.
+
+    JSON objects get a leading "time" key, JSON arrays are wrapped as
+    {"time": ..., "value": [...]} and other text as {"time": ..., "value":
+    "<payload>"}. Binary payloads are returned unchanged.
+    """
+    stamp = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat(timespec="milliseconds")
+    payload = bytes(payload)
+    if binary:
+        return payload
+    if payload.startswith(b"{"):
+        rest = payload[1:].lstrip()
+        return b'{"time":"' + stamp.encode() + (b'"' if rest.startswith(b"}") else b'",') + rest
+    if payload.startswith(b"["):
+        return b'{"time":"' + stamp.encode() + b'","value":' + payload + b"}"
+    try:
+        value = payload.decode()
+    except UnicodeDecodeError:
+        return payload
+    return json.dumps({"time": stamp, "value": value}, separators=(",", ":"))
@@ -0,0 +1,65 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The add-on modules import each other by their flat names, as in /app
+sys.path.insert(0, os.path.join(ROOT, "jk_bms_rs485_proxy"))
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+import pytest  # noqa: E402
+
+from capture import NullMQTTClient  # noqa: E402
+
+
+class RecordingClient(NullMQTTClient):
+    """Keeps every publish as (topic, payload, retain)."""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.messages.append((topic, payload, retain))
+        return super().publish(topic, payload, qos, retain)
+
+    def topics(self):
+        return [topic for topic, _, _ in self.messages]
+
+
+class ProxyHarness:
+    """Runs the proxy's decode and publish stages synchronously."""
+
+    def __init__(self, proxy):
+        self.proxy = proxy
+        self.client = proxy.client
+
+    def feed(self, *payloads, topic=None):
+        for payload in payloads:
+            self.proxy.process_payload((topic or self.proxy.topic_tx, payload, 0))
+        self.drain()
+
+    def drain(self):
+        pipeline = self.proxy.pipeline
+        while (item := pipeline.inbound.get(0)) is not None:
+            self.proxy.process_payload(item)
+        while (item := pipeline.outbound.get(0)) is not None:
+            _, topic, payload, qos, retain = item
+            self.proxy.safe_publish(topic, payload, qos, retain)
+
+
+@pytest.fixture
+def make_proxy():
+    """Factory for a proxy publishing to a RecordingClient; skipped without paho."""
+    pytest.importorskip("paho.mqtt.client")
+    from rs485_mqtt_ha_proxy import RS485MQTTClient
+
+    def make(topic_tx="rs485tx/tx", **kwargs):
+        proxy = RS485MQTTClient("test", 0, "", "", topic_tx, "homeassistant", "rs485tx/bms", **kwargs)
+        proxy.client = RecordingClient()
+        proxy.discovery.attach(proxy.client)
+        # Nothing acknowledges publishes here
+        proxy.discovery.qos = 0
+        return ProxyHarness(proxy)
+
+    return make
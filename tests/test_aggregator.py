@@ -0,0 +1,45 @@
+from aggregator import StateAggregator
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_window_emitted_after_its_length():
+    clock = Clock()
+    aggregator = StateAggregator(10, clock=clock)
+    assert aggregator.add("01", {"v": 1.0, "alarms": []}) is None
+    clock.now = 10
+    state = aggregator.add("01", {"v": 3.0, "alarms": []})
+    assert state["v"] == 2.0
+    assert state["min"] == {"v": 1.0}
+    assert state["max"] == {"v": 3.0}
+    assert state["samples"] == 2
+
+
+def test_alarm_change_emits_immediately():
+    aggregator = StateAggregator(10, clock=Clock())
+    aggregator.add("01", {"v": 1.0, "alarms": []})
+    state = aggregator.add("01", {"v": 2.0, "alarms": ["Cell OVP"]})
+    assert state["samples"] == 2
+    assert state["alarms"] == ["Cell OVP"]
+
+
+def test_layout_change_emits_pending_window():
+    clock = Clock()
+    aggregator = StateAggregator(10, clock=clock)
+    aggregator.add("01", {"v": 1.0, "cv01": 3.0})
+    aggregator.add("01", {"v": 2.0, "cv01": 3.1})
+    closed = aggregator.add("01", {"v": 5.0, "cv01": 3.0, "cv02": 3.2})
+    assert closed["samples"] == 2
+    assert closed["v"] == 1.5
+    assert "cv02" not in closed
+    clock.now = 10
+    [(key, state)] = aggregator.flush_expired()
+    assert key == "01"
+    assert state["samples"] == 1
+    assert state["cv02"] == 3.2
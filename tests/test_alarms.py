@@ -0,0 +1,81 @@
+import json
+
+import jk02_decoder
+from alarms import ALL_ALARMS, AlarmTracker, changed_bits, event_message
+from frame_parser import CHECKSUM_OFFSET
+from test_jk02_decoder import CELL_INFO_FRAME, SETTINGS_FRAME
+
+# The golden cell info frame reports Cell OVP (bit 4) and GPS Disconnected (bit 17)
+FRAME_MASK = 1 << 4 | 1 << 17
+
+
+def with_alarm_mask(frame, mask):
+    frame = bytearray(frame)
+    frame[jk02_decoder.ALARM_OFFSET:jk02_decoder.ALARM_OFFSET + 3] = mask.to_bytes(3, "little")
+    frame[CHECKSUM_OFFSET] = sum(frame[:CHECKSUM_OFFSET]) & 0xFF
+    return bytes(frame)
+
+
+def test_changed_bits_lowest_first():
+    assert list(changed_bits(0)) == []
+    assert list(changed_bits(0b1011)) == [0, 1, 3]
+    assert list(changed_bits(1 << 23 | 1 << 5)) == [5, 23]
+    assert len(list(changed_bits(ALL_ALARMS))) == len(jk02_decoder.ALARM_NAMES)
+
+
+def test_tracker_reports_transitions_per_bms():
+    tracker = AlarmTracker()
+    assert tracker.update("01", 0) == ALL_ALARMS
+    assert tracker.update("01", 0) == 0
+    assert tracker.update("02", 0b100) == ALL_ALARMS
+    assert tracker.update("01", 0b110) == 0b110
+    assert tracker.update("01", 0b010) == 0b100
+    assert tracker.update("02", 0b100) == 0
+    assert tracker.masks == {"01": 0b010, "02": 0b100}
+
+
+def test_event_message():
+    assert event_message("roomA/01", 4, True, 0.5) == {
+        "bms": "roomA/01", "alarm": "Cell OVP", "bit": 4, "event": "raised",
+        "time": "1970-01-01T00:00:00.500+00:00",
+    }
+    assert event_message("01", 0, False, 0)["event"] == "cleared"
+
+
+def alarm_messages(harness):
+    states = {topic.rsplit("/", 1)[1]: payload for topic, payload, retain in harness.client.messages
+              if "/alarms/" in topic and retain}
+    events = [json.loads(payload) for topic, payload, _ in harness.client.messages if topic.endswith("/alarm_event")]
+    harness.client.messages.clear()
+    return states, [(event["alarm"], event["event"]) for event in events]
+
+
+def test_first_frame_publishes_all_states_but_only_active_events(make_proxy):
+    harness = make_proxy(alarm_tracker=AlarmTracker())
+    harness.feed(SETTINGS_FRAME, CELL_INFO_FRAME)
+    states, events = alarm_messages(harness)
+    assert len(states) == len(jk02_decoder.ALARM_NAMES)
+    assert states["cell_ovp"] == "ON"
+    assert states["gps_disconnected"] == "ON"
+    assert states["charge_otp"] == "OFF"
+    assert events == [("Cell OVP", "raised"), ("GPS Disconnected", "raised")]
+
+    harness.feed(CELL_INFO_FRAME)
+    assert alarm_messages(harness) == ({}, [])
+
+
+def test_transitions_publish_only_the_changed_alarms(make_proxy):
+    harness = make_proxy(alarm_tracker=AlarmTracker())
+    harness.feed(SETTINGS_FRAME, CELL_INFO_FRAME)
+    alarm_messages(harness)
+
+    harness.feed(with_alarm_mask(CELL_INFO_FRAME, 1 << 4 | 1 << 8))
+    assert alarm_messages(harness) == (
+        {"charge_otp": "ON", "gps_disconnected": "OFF"},
+        [("Charge OTP", "raised"), ("GPS Disconnected", "cleared")],
+    )
+    harness.feed(with_alarm_mask(CELL_INFO_FRAME, 0))
+    assert alarm_messages(harness) == (
+        {"cell_ovp": "OFF", "charge_otp": "OFF"},
+        [("Cell OVP", "cleared"), ("Charge OTP", "cleared")],
+    )
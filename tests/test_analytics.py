@@ -0,0 +1,118 @@
+import json
+
+import pytest
+
+from analytics import PackAnalytics
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def sample(power, current, cells=()):
+    state = {"bat_power": power, "bat_current": current}
+    for i, (voltage, resistance) in enumerate(cells):
+        state[f"cv{i+1:02d}"] = voltage
+        state[f"cr{i+1:02d}"] = resistance
+    return state
+
+
+def feed(analytics, clock, bms_id, samples, step):
+    for power, current in samples:
+        analytics.update(bms_id, sample(power, current), 0)
+        clock.now += step
+
+
+def test_energy_is_integrated_with_the_trapezoidal_rule():
+    clock = Clock()
+    analytics = PackAnalytics(clock=clock)
+    # 36 s steps are 1/100 h
+    feed(analytics, clock, "01", [(100.0, 2.0), (300.0, 6.0), (-200.0, -4.0), (-400.0, -8.0)], 36)
+    pack = analytics.packs["01"]
+    assert pack.charge_wh == pytest.approx(2.0 + 0.5)
+    assert pack.discharge_wh == pytest.approx(3.0)
+    assert pack.charge_ah == pytest.approx(0.04 + 0.01)
+    assert pack.discharge_ah == pytest.approx(0.06)
+    snapshot = analytics.snapshot("01")
+    assert snapshot["charge_energy"] == 0.0025
+    assert snapshot["discharge_energy"] == 0.003
+    assert "cell_dev_max" not in snapshot
+
+
+def test_gaps_longer_than_max_gap_are_not_integrated():
+    clock = Clock()
+    analytics = PackAnalytics(max_gap=60, clock=clock)
+    analytics.update("01", sample(1000.0, 20.0), 0)
+    clock.now += 61
+    analytics.update("01", sample(1000.0, 20.0), 0)
+    assert analytics.packs["01"].charge_wh == 0.0
+    clock.now += 36
+    analytics.update("01", sample(1000.0, 20.0), 0)
+    assert analytics.packs["01"].charge_wh == pytest.approx(10.0)
+
+
+def test_cell_deviation_and_resistance_are_smoothed():
+    clock = Clock()
+    analytics = PackAnalytics(deviation_tau=600, resistance_tau=3600, clock=clock)
+    analytics.update("01", sample(0.0, 0.0, [(3.300, 0.05), (3.300, 0.05), (3.330, 0.07)]), 3)
+    assert analytics.packs["01"].deviation == pytest.approx([-0.01, -0.01, 0.02])
+    for _ in range(100):
+        clock.now += 60
+        analytics.update("01", sample(0.0, 0.0, [(3.300, 0.05), (3.300, 0.05), (3.360, 0.09)]), 3)
+    snapshot = analytics.snapshot("01")
+    assert snapshot["cell_dev_max_index"] == 3
+    assert snapshot["cell_dev_max"] == pytest.approx(40.0, abs=0.01)
+    assert snapshot["cd01"] == pytest.approx(-20.0, abs=0.01)
+    assert 0.07 < snapshot["rt03"] < 0.09
+    # A rebuilt pack with another cell count starts over
+    analytics.update("01", sample(0.0, 0.0, [(3.300, 0.05)] * 2), 2)
+    assert analytics.snapshot("01")["cell_dev_max"] == 0.0
+
+
+def test_take_dirty_returns_each_updated_pack_once():
+    analytics = PackAnalytics(clock=Clock())
+    analytics.update("01", sample(0.0, 0.0), 0)
+    analytics.update("02", sample(0.0, 0.0), 0)
+    assert analytics.take_dirty() == ["01", "02"]
+    assert analytics.take_dirty() == []
+
+
+def test_totals_survive_a_restart(tmp_path):
+    path = tmp_path / "analytics" / "totals.json"
+    clock = Clock()
+    analytics = PackAnalytics(str(path), clock=clock)
+    analytics.save()
+    assert not path.exists()
+
+    feed(analytics, clock, "01", [(500.0, 10.0), (500.0, 10.0)], 36)
+    analytics.update("01", sample(0.0, 0.0, [(3.3, 0.05), (3.4, 0.06)]), 2)
+    analytics.save()
+    saved = json.loads(path.read_text())
+    assert saved["01"]["charge_wh"] == pytest.approx(5.0 + 2.5)
+
+    # Nothing changed since the last save: the file is left alone
+    path.unlink()
+    analytics.save()
+    assert not path.exists()
+    analytics.update("01", sample(0.0, 0.0), 0)
+    analytics.save()
+
+    clock = Clock()
+    restarted = PackAnalytics(str(path), clock=clock)
+    assert restarted.packs["01"].charge_wh == pytest.approx(7.5)
+    assert restarted.packs["01"].deviation == pytest.approx([-0.05, 0.05])
+    # Counters keep increasing from the saved totals, the first sample only sets the baseline
+    feed(restarted, clock, "01", [(1000.0, 20.0), (1000.0, 20.0)], 36)
+    assert restarted.packs["01"].charge_wh == pytest.approx(17.5)
+
+
+def test_unreadable_totals_start_from_zero(tmp_path, caplog):
+    path = tmp_path / "totals.json"
+    path.write_text("{not json")
+    analytics = PackAnalytics(str(path), clock=Clock())
+    assert analytics.packs == {}
+    assert "Cannot read analytics totals" in caplog.text
@@ -0,0 +1,92 @@
+from availability import AvailabilityTracker, TimerWheel
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_wheel_fires_keys_in_their_slot():
+    wheel = TimerWheel(1, 10, 0)
+    wheel.schedule("a", 3.5)
+    wheel.schedule("b", 7)
+    assert wheel.advance(2.9) == []
+    assert wheel.advance(3.0) == ["a"]
+    assert wheel.advance(6.99) == []
+    assert wheel.advance(7) == ["b"]
+    assert wheel.advance(20) == []
+
+
+def test_wheel_wraps_around():
+    wheel = TimerWheel(1, 4, 0)
+    for now in range(1, 13):
+        wheel.schedule(now, now + 4)
+        assert wheel.advance(now) == ([now - 4] if now > 4 else [])
+
+
+def test_wheel_catches_up_after_a_long_gap():
+    wheel = TimerWheel(1, 4, 0)
+    wheel.schedule("a", 1)
+    wheel.schedule("b", 4)
+    assert sorted(wheel.advance(100)) == ["a", "b"]
+
+
+def test_past_deadline_fires_on_next_tick():
+    wheel = TimerWheel(1, 4, 10)
+    wheel.schedule("late", 3)
+    assert wheel.advance(11) == ["late"]
+
+
+def test_bms_goes_offline_after_timeout_without_frames():
+    clock = Clock()
+    tracker = AvailabilityTracker(10, clock)
+    assert tracker.seen("01") is True
+    assert tracker.seen("01") is False
+    clock.now += 9
+    assert tracker.expire() == []
+    clock.now += 1
+    assert tracker.expire() == ["01"]
+    assert tracker.online == 0
+    assert tracker.expire() == []
+
+
+def test_frames_push_the_deadline():
+    clock = Clock()
+    tracker = AvailabilityTracker(10, clock)
+    tracker.seen("01")
+    for _ in range(5):
+        clock.now += 6
+        tracker.seen("01")
+        assert tracker.expire() == []
+    clock.now += 10
+    assert tracker.expire() == ["01"]
+
+
+def test_bms_back_from_offline_is_tracked_again():
+    clock = Clock()
+    tracker = AvailabilityTracker(5, clock)
+    tracker.seen("01")
+    clock.now += 5
+    assert tracker.expire() == ["01"]
+    clock.now += 30
+    assert tracker.seen("01") is True
+    assert tracker.online == 1
+    clock.now += 5
+    assert tracker.expire() == ["01"]
+
+
+def test_restored_bms_goes_offline_unless_it_reports():
+    clock = Clock()
+    tracker = AvailabilityTracker(10, clock)
+    tracker.watch("01")
+    tracker.watch("02")
+    assert tracker.online == 0
+    clock.now += 4
+    assert tracker.seen("02") is True
+    clock.now += 6
+    assert tracker.expire() == ["01"]
+    clock.now += 4
+    assert tracker.expire() == ["02"]
@@ -0,0 +1,102 @@
+from bank import BankAggregator
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def pack_state(cell_min=3.300, cell_max=3.320, temp=25.0, current=10.0, soc=50, cap_total=280.0):
+    return {
+        "bat_voltage": 53.0, "bat_current": current, "bat_power": 53.0 * current,
+        "soc": soc, "cap_remaining": cap_total * soc / 100, "cap_total": cap_total,
+        "cell_avg_volt": 3.310, "cell_min_index": 1, "cell_max_index": 2,
+        "cv01": cell_min, "cv02": cell_max,
+        "temp_mos": temp, "temp1": 20.0, "temp2": 20.0, "temp3": 20.0, "temp4": 20.0,
+    }
+
+
+def test_totals_replace_each_packs_contribution():
+    bank = BankAggregator(clock=Clock())
+    assert bank.snapshot() is None
+    bank.update("01", pack_state(current=10.0, soc=40), 0)
+    bank.update("02", pack_state(current=-4.0, soc=80, cap_total=140.0), 0)
+    bank.update("01", pack_state(current=12.0, soc=40), 0)
+    snapshot = bank.snapshot()
+    assert snapshot["bat_current"] == 8.0
+    assert snapshot["bat_voltage"] == 53.0
+    assert snapshot["cap_total"] == 420.0
+    assert snapshot["soc"] == 53.3
+    assert snapshot["packs_online"] == 2
+    assert bank.dirty is False
+
+
+def test_extremes_follow_the_holder_moving_away():
+    bank = BankAggregator(clock=Clock())
+    bank.update("01", pack_state(cell_min=3.250, cell_max=3.400, temp=40.0), 0)
+    bank.update("02", pack_state(cell_min=3.280, cell_max=3.350, temp=30.0), 0)
+    snapshot = bank.snapshot()
+    assert (snapshot["cell_min_bms"], snapshot["cell_max_bms"], snapshot["temp_max_bms"]) == ("01", "01", "01")
+
+    bank.update("01", pack_state(cell_min=3.300, cell_max=3.310, temp=25.0), 0)
+    snapshot = bank.snapshot()
+    assert (snapshot["cell_min_bms"], snapshot["cell_min_volt"]) == ("02", 3.280)
+    assert (snapshot["cell_max_bms"], snapshot["cell_max_volt"]) == ("02", 3.350)
+    assert (snapshot["temp_max_bms"], snapshot["temp_max"]) == ("02", 30.0)
+
+    bank.update("01", pack_state(cell_min=3.100, cell_max=3.500, temp=45.0), 0)
+    snapshot = bank.snapshot()
+    assert (snapshot["cell_min_bms"], snapshot["cell_max_bms"], snapshot["temp_max_bms"]) == ("01", "01", "01")
+
+
+def test_extremes_after_a_pack_drops_out():
+    clock = Clock()
+    bank = BankAggregator(stale_after=60, clock=clock)
+    bank.update("01", pack_state(cell_min=3.200, cell_max=3.450, temp=50.0, current=5.0), 0)
+    clock.now += 30
+    bank.update("02", pack_state(cell_min=3.290, cell_max=3.330, temp=28.0, current=7.0), 0)
+    bank.update("03", pack_state(cell_min=3.270, cell_max=3.360, temp=31.0, current=1.0), 0)
+    assert bank.snapshot()["cell_min_bms"] == "01"
+
+    clock.now += 30
+    assert bank.expire() == ["01"]
+    assert bank.dirty is True
+    snapshot = bank.snapshot()
+    assert (snapshot["cell_min_bms"], snapshot["cell_min_volt"]) == ("03", 3.270)
+    assert (snapshot["cell_max_bms"], snapshot["cell_max_volt"]) == ("03", 3.360)
+    assert (snapshot["temp_max_bms"], snapshot["temp_max"]) == ("03", 31.0)
+    assert snapshot["bat_current"] == 8.0
+    assert (snapshot["packs_online"], snapshot["packs_stale"]) == (2, 1)
+
+    # Updates after the drop-out keep tracking incrementally against the rest
+    bank.update("02", pack_state(cell_min=3.260, cell_max=3.370, temp=29.0, current=7.0), 0)
+    snapshot = bank.snapshot()
+    assert (snapshot["cell_min_bms"], snapshot["cell_max_bms"], snapshot["temp_max_bms"]) == ("02", "02", "03")
+
+    bank.update("01", pack_state(cell_min=3.310, cell_max=3.320, temp=20.0, current=5.0), 0)
+    snapshot = bank.snapshot()
+    assert (snapshot["packs_online"], snapshot["packs_stale"]) == (3, 0)
+    assert snapshot["cell_min_bms"] == "02"
+    assert snapshot["bat_current"] == 13.0
+
+    clock.now += 200
+    assert sorted(bank.expire()) == ["01", "02", "03"]
+    assert bank.snapshot() is None
+
+
+def test_alarms_are_the_union_of_online_packs():
+    clock = Clock()
+    bank = BankAggregator(stale_after=60, clock=clock)
+    bank.update("01", pack_state(), 0b10001)
+    bank.update("02", pack_state(), 0b00001)
+    assert bank.snapshot()["alarms"] == ["Wire resistance", "Cell OVP"]
+    bank.update("01", pack_state(), 0)
+    assert bank.snapshot()["alarms"] == ["Wire resistance"]
+    clock.now += 60
+    bank.expire()
+    assert bank.snapshot() is None
+    bank.update("01", pack_state(), 0)
+    assert bank.snapshot()["alarm"] == "OFF"
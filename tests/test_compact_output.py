@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+from compact_output import SCHEMA_VERSION, CompactEncoder, pack_cbor, pack_msgpack
+from test_jk02_decoder import CELL_INFO_FRAME, SETTINGS_FRAME
+
+SAMPLES = [
+    None, True, False,
+    0, 23, 24, 127, 128, 255, 256, 65535, 65536, 2**32,
+    -1, -24, -25, -32, -33, -129, -500, -32769, -2**31 - 1,
+    1.5, -0.25, "", "abc", "x" * 40,
+    [1, 2], list(range(20)), {"a": 1}, {"cells": [3301, 3300], "soc": 27},
+]
+
+MSGPACK_GOLDEN = [
+    (None, "c0"), (True, "c3"), (False, "c2"),
+    (0, "00"), (127, "7f"), (128, "cc80"), (256, "cd0100"), (65536, "ce00010000"),
+    (2**32, "cf0000000100000000"),
+    (-1, "ff"), (-32, "e0"), (-33, "d0df"), (-129, "d1ff7f"), (-32769, "d2ffff7fff"),
+    (1.5, "cb3ff8000000000000"),
+    ("", "a0"), ("abc", "a3616263"),
+    ([1, 2], "920102"), ({"a": 1}, "81a16101"),
+]
+
+CBOR_GOLDEN = [
+    (None, "f6"), (True, "f5"), (False, "f4"),
+    (0, "00"), (23, "17"), (24, "1818"), (255, "18ff"), (256, "190100"), (65536, "1a00010000"),
+    (2**32, "1b0000000100000000"),
+    (-1, "20"), (-24, "37"), (-25, "3818"), (-500, "3901f3"),
+    (1.5, "fb3ff8000000000000"),
+    ("", "60"), ("abc", "63616263"),
+    ([1, 2], "820102"), ({"a": 1}, "a1616101"),
+]
+
+
+@pytest.mark.parametrize("value, expected", MSGPACK_GOLDEN)
+def test_msgpack_golden_bytes(value, expected):
+    assert pack_msgpack(value).hex() == expected
+
+
+@pytest.mark.parametrize("value, expected", CBOR_GOLDEN)
+def test_cbor_golden_bytes(value, expected):
+    assert pack_cbor(value).hex() == expected
+
+
+def test_long_string_and_array_headers():
+    assert pack_msgpack("x" * 40)[:5].hex() == "db00000028"
+    assert pack_msgpack(list(range(20)))[:5].hex() == "dd00000014"
+    assert pack_cbor("x" * 40)[:2].hex() == "7828"
+    assert pack_cbor(list(range(20)))[:1].hex() == "94"
+    assert pack_cbor(list(range(30)))[:2].hex() == "981e"
+
+
+def test_record_headers():
+    json_encoder = CompactEncoder("rs485tx/compact", clock=lambda: 1.5)
+    assert json.loads(json_encoder.cell_info(CELL_INFO_FRAME, 16))[:3] == [SCHEMA_VERSION, 2, 1500]
+    assert json.loads(json_encoder.settings(SETTINGS_FRAME))[:3] == [SCHEMA_VERSION, 1, 1500]
+    assert json.loads(json_encoder.schema_message()[1])["version"] == SCHEMA_VERSION
+
+    # 24 cell info and 18 settings elements, then version, frame type and 1500 ms
+    msgpack_encoder = CompactEncoder("rs485tx/compact", "msgpack", clock=lambda: 1.5)
+    assert msgpack_encoder.cell_info(CELL_INFO_FRAME, 16)[:10].hex() == "dd000000180102cd05dc"
+    assert msgpack_encoder.settings(SETTINGS_FRAME)[:10].hex() == "dd000000120101cd05dc"
+    cbor_encoder = CompactEncoder("rs485tx/compact", "cbor", clock=lambda: 1.5)
+    assert cbor_encoder.cell_info(CELL_INFO_FRAME, 16)[:7].hex() == "981801021905dc"
+    assert cbor_encoder.settings(SETTINGS_FRAME)[:6].hex() == "9201011905dc"
+
+
+def test_unknown_encoding_is_rejected():
+    with pytest.raises(ValueError):
+        CompactEncoder("rs485tx/compact", "protobuf")
+
+
+def test_msgpack_round_trips_through_reference_library():
+    msgpack = pytest.importorskip("msgpack")
+    for value in SAMPLES:
+        assert msgpack.unpackb(pack_msgpack(value)) == value
+    clock = lambda: 1.5  # noqa: E731
+    record = CompactEncoder("t", "msgpack", clock=clock).cell_info(CELL_INFO_FRAME, 16)
+    assert msgpack.unpackb(record) == json.loads(CompactEncoder("t", clock=clock).cell_info(CELL_INFO_FRAME, 16))
+
+
+def test_cbor_round_trips_through_reference_library():
+    cbor2 = pytest.importorskip("cbor2")
+    for value in SAMPLES:
+        assert cbor2.loads(pack_cbor(value)) == value
+    clock = lambda: 1.5  # noqa: E731
+    record = CompactEncoder("t", "cbor", clock=clock).cell_info(CELL_INFO_FRAME, 16)
+    assert cbor2.loads(record) == json.loads(CompactEncoder("t", clock=clock).cell_info(CELL_INFO_FRAME, 16))
@@ -0,0 +1,36 @@
+import logging
+
+import pytest
+
+from diagnostics import FrameTracer, parse_trace_rates
+
+
+def test_parse_trace_rates():
+    assert parse_trace_rates("01=1, roomA/02=0.1,*=0.01") == {"01": 1.0, "roomA/02": 0.1, "*": 0.01}
+    assert parse_trace_rates("") == {}
+    for spec in ("01", "=1", "01=x", "01=2", "*=-0.5"):
+        with pytest.raises(ValueError):
+            parse_trace_rates(spec)
+
+
+def traced(tracer, bms_id, frames, caplog):
+    caplog.clear()
+    with caplog.at_level(logging.INFO, logger="frames"):
+        for _ in range(frames):
+            tracer.trace(bms_id, 2, b"\x55\xaa")
+    return len(caplog.records)
+
+
+def test_tracer_samples_every_nth_frame(caplog):
+    tracer = FrameTracer({"01": 1, "02": 0.1, "*": 0.25})
+    assert traced(tracer, "01", 10, caplog) == 10
+    assert traced(tracer, "02", 30, caplog) == 3
+    assert traced(tracer, "03", 8, caplog) == 2
+    assert "BMS #03 frame type 2, 2 bytes: 55 aa" in caplog.text
+    assert traced(FrameTracer({"01": 1}), "02", 5, caplog) == 0
+
+
+def test_rates_above_one_trace_every_frame(caplog):
+    # round(1 / 3) would be an interval of 0 and silence the BMS instead
+    assert traced(FrameTracer({"*": 3}), "01", 4, caplog) == 4
+    assert traced(FrameTracer({"*": 1.5}), "01", 4, caplog) == 4
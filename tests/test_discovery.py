@@ -0,0 +1,123 @@
+import json
+
+import pytest
+
+mqtt = pytest.importorskip("paho.mqtt.client")
+
+from discovery import DiscoveryManager  # noqa: E402
+
+
+class Result:
+    def __init__(self, rc, mid):
+        self.rc = rc
+        self.mid = mid
+
+
+class Message:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class FakeClient:
+    def __init__(self):
+        self.published = []
+        self.subscribed = []
+        self.unsubscribed = []
+        self.rc = mqtt.MQTT_ERR_SUCCESS
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, payload))
+        return Result(self.rc, len(self.published))
+
+    def subscribe(self, topics):
+        self.subscribed.extend(topics)
+
+    def unsubscribe(self, topics):
+        self.unsubscribed.extend(topics)
+
+    def message_callback_add(self, topic, callback):
+        pass
+
+
+def topic(node, id):
+    return f"homeassistant/sensor/{node}/{id}/config"
+
+
+def make_manager(max_in_flight=10, qos=1):
+    manager = DiscoveryManager("homeassistant", max_in_flight, qos)
+    client = FakeClient()
+    manager.attach(client)
+    return manager, client
+
+
+def test_unchanged_config_not_republished():
+    manager, client = make_manager(qos=0)
+    manager.publish(topic("jk_bms_01", "soc"), {"name": "SOC"})
+    manager.publish(topic("jk_bms_01", "soc"), {"name": "SOC"})
+    manager.publish(topic("jk_bms_01", "soc"), {"name": "State of charge"})
+    assert [json.loads(payload)["name"] for _, payload in client.published] == ["SOC", "State of charge"]
+
+
+def test_publishing_paced_by_acknowledgements():
+    manager, client = make_manager(max_in_flight=2)
+    for i in range(5):
+        manager.publish(topic("jk_bms_01", f"s{i}"), {"i": i})
+    assert len(client.published) == 2
+    assert manager.pending == 3
+    manager.on_publish(client, None, 1)
+    assert len(client.published) == 3
+    manager.on_publish(client, None, 99)
+    assert len(client.published) == 3
+    manager.on_publish(client, None, 2)
+    manager.on_publish(client, None, 3)
+    assert len(client.published) == 5
+    assert manager.pending == 0
+
+
+def test_readback_of_own_nodes_suppresses_republish():
+    manager, client = make_manager(qos=0)
+    config = {"name": "SOC"}
+    manager.on_connect(client, ["jk_bms_01"])
+    assert client.subscribed == [("homeassistant/+/jk_bms_01/+/config", 0)]
+    retained = json.dumps(config, separators=(",", ":")).encode()
+    manager.on_retained_message(client, None, Message(topic("jk_bms_01", "soc"), retained))
+    manager.on_retained_message(client, None, Message(topic("other_01", "soc"), retained))
+    manager.finish_readback(client)
+    assert client.unsubscribed == ["homeassistant/+/jk_bms_01/+/config"]
+    manager.publish(topic("jk_bms_01", "soc"), config)
+    manager.publish(topic("other_01", "soc"), config)
+    assert client.published == [(topic("other_01", "soc"), retained.decode())]
+
+
+def test_remove_publishes_empty_config():
+    manager, client = make_manager(qos=0)
+    manager.remove(topic("jk_bms_01", "cv17"))
+    assert client.published == []
+    manager.publish(topic("jk_bms_01", "cv17"), {"name": "Cell 17"})
+    manager.remove(topic("jk_bms_01", "cv17"))
+    assert client.published[-1] == (topic("jk_bms_01", "cv17"), "")
+
+
+def test_not_connected_left_to_paho_with_qos1():
+    manager, client = make_manager(max_in_flight=2)
+    client.rc = mqtt.MQTT_ERR_NO_CONN
+    for i in range(3):
+        manager.publish(topic("jk_bms_01", f"s{i}"), {"i": i})
+    # paho queued the first two itself, the third waits for the window
+    assert len(client.published) == 2
+    assert manager.pending == 1
+    client.rc = mqtt.MQTT_ERR_SUCCESS
+    manager.on_connect(client)
+    assert [t for t, _ in client.published] == [topic("jk_bms_01", f"s{i}") for i in range(3)]
+
+
+def test_failed_publish_retried():
+    manager, client = make_manager(qos=0)
+    client.rc = mqtt.MQTT_ERR_NO_CONN
+    manager.publish(topic("jk_bms_01", "soc"), {"name": "SOC"})
+    assert manager.pending == 1
+    client.rc = mqtt.MQTT_ERR_SUCCESS
+    manager.on_connect(client)
+    assert manager.pending == 0
+    assert len(client.published) == 2
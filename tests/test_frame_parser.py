@@ -0,0 +1,55 @@
+import random
+
+from frame_parser import FrameReassembler
+from test_jk02_decoder import CELL_INFO_FRAME, SETTINGS_FRAME
+
+GATEWAY_PREFIX = bytes(range(11))
+
+
+def corrupt(frame):
+    frame = bytearray(frame)
+    frame[100] ^= 0xFF
+    return bytes(frame)
+
+
+def test_frames_split_across_arbitrary_chunks():
+    stream = GATEWAY_PREFIX + SETTINGS_FRAME + GATEWAY_PREFIX + CELL_INFO_FRAME + SETTINGS_FRAME
+    rnd = random.Random(7)
+    for _ in range(50):
+        reassembler = FrameReassembler()
+        frames = []
+        position = 0
+        while position < len(stream):
+            size = rnd.randrange(1, 120)
+            frames += reassembler.feed("gw", stream[position:position + size])
+            position += size
+        assert frames == [SETTINGS_FRAME, CELL_INFO_FRAME, SETTINGS_FRAME]
+        assert reassembler.counters["discarded_bytes"] == 2 * len(GATEWAY_PREFIX)
+
+
+def test_partial_header_kept_between_feeds():
+    reassembler = FrameReassembler()
+    assert reassembler.feed("gw", b"junk" + SETTINGS_FRAME[:2]) == []
+    assert reassembler.feed("gw", SETTINGS_FRAME[2:]) == [SETTINGS_FRAME]
+    assert reassembler.counters["discarded_bytes"] == 4
+
+
+def test_bad_checksum_rejected_and_resynced():
+    reassembler = FrameReassembler()
+    assert reassembler.feed("gw", corrupt(SETTINGS_FRAME) + CELL_INFO_FRAME) == [CELL_INFO_FRAME]
+    assert reassembler.counters["bad_checksum"] == 1
+    assert reassembler.counters["frames"] == 1
+
+
+def test_checksum_verification_can_be_disabled():
+    reassembler = FrameReassembler(verify_checksum=False)
+    assert reassembler.feed("gw", corrupt(SETTINGS_FRAME)) == [corrupt(SETTINGS_FRAME)]
+
+
+def test_sources_buffered_independently():
+    reassembler = FrameReassembler()
+    assert reassembler.feed("a", SETTINGS_FRAME[:150]) == []
+    assert reassembler.feed("b", CELL_INFO_FRAME[:200]) == []
+    assert reassembler.feed("a", SETTINGS_FRAME[150:]) == [SETTINGS_FRAME]
+    reassembler.reset("b")
+    assert reassembler.feed("b", CELL_INFO_FRAME[200:]) == []
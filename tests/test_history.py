@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from history import RAW_POINTS, SERIES_BYTES, HistoryStore
+from test_jk02_decoder import CELL_INFO_FRAME, SETTINGS_FRAME
+
+
+class Clock:
+    def __init__(self, now=100000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_raw_ring_keeps_the_latest_points_in_order():
+    store = HistoryStore(clock=Clock())
+    for t in range(1, RAW_POINTS + 6):
+        store.add("01", {"soc": t}, t)
+    window = store.query(["01"], ["soc"], "raw", since=1)["01"]["soc"]
+    assert window["t"] == [float(t) for t in range(6, RAW_POINTS + 6)]
+    assert window["v"] == [float(t) for t in range(6, RAW_POINTS + 6)]
+    assert store.query(["01"], ["soc"], "raw", since=100, until=102)["01"]["soc"]["v"] == [100.0, 101.0, 102.0]
+
+
+def test_tier_buckets_aggregate_closed_and_open_buckets():
+    store = HistoryStore(clock=Clock())
+    for t, value in ((60, 2.0), (61, 8.0), (119, 5.0), (120, 1.0), (150, 3.0)):
+        store.add("01", {"bat_current": value}, t)
+    window = store.query(["01"], ["bat_current"], "1m", since=60, until=179)["01"]["bat_current"]
+    assert window == {"t": [60, 120], "avg": [5.0, 2.0], "min": [2.0, 1.0], "max": [8.0, 3.0]}
+
+
+def test_overwritten_tier_slots_are_not_reported():
+    store = HistoryStore(clock=Clock())
+    store.add("01", {"soc": 10}, 60)
+    store.add("01", {"soc": 20}, 60 + 1440 * 60)
+    store.add("01", {"soc": 30}, 60 + 1441 * 60)
+    window = store.query(["01"], ["soc"], "1m", since=1, until=60 + 1441 * 60)["01"]["soc"]
+    assert window["t"] == [60 + 1440 * 60, 60 + 1441 * 60]
+    assert window["avg"] == [20.0, 30.0]
+
+
+def test_query_expands_prefixes_and_packs_relative_to_now():
+    clock = Clock(1000.0)
+    store = HistoryStore(clock=clock)
+    store.add("01", {"cv01": 3.3, "cv02": 3.2, "cr01": 0.1, "bal_mode": "Off"})
+    store.add("02", {"cv01": 3.1})
+    clock.now = 1100.0
+    result = store.query(["*"], ["cv*", "cr01"], "raw", since=-200)
+    assert list(result) == ["01", "02"]
+    assert list(result["01"]) == ["cv01", "cv02"]
+    assert result["02"]["cv01"] == {"t": [1000.0], "v": [3.1]}
+    assert store.query(["01"], ["cv01"], "raw", since=-50) == {"01": {"cv01": {"t": [], "v": []}}}
+    with pytest.raises(ValueError):
+        store.query(["01"], ["cv01"], "5m")
+
+
+def test_series_beyond_the_budget_are_rejected():
+    store = HistoryStore(budget_bytes=2 * SERIES_BYTES, clock=Clock())
+    store.add("01", {"soc": 50, "bat_current": 2.0, "bat_voltage": 53.1})
+    store.add("01", {"soc": 51, "bat_current": 2.5, "bat_voltage": 53.2})
+    assert store.memory_bytes == 2 * SERIES_BYTES
+    assert store.rejected == 2
+    assert store.query(["01"], ["soc", "bat_current", "bat_voltage"], "raw")["01"].keys() == {"soc", "bat_current"}
+
+
+def request(harness, **fields):
+    harness.feed(json.dumps({"id": "q", "bms": "*", "fields": ["soc"], "tier": "raw", **fields}),
+                 topic=harness.proxy.history_request_topic)
+    topic, payload, _ = harness.client.messages[-1]
+    return topic, json.loads(payload)
+
+
+def test_history_replies_stay_under_the_response_topic(make_proxy):
+    harness = make_proxy(history=HistoryStore())
+    harness.feed(SETTINGS_FRAME, CELL_INFO_FRAME)
+
+    topic, response = request(harness)
+    assert topic == "rs485tx/bms/history/response"
+    assert response["id"] == "q"
+    assert response["series"]["03"]["soc"]["v"] == [27.0]
+
+    topic, response = request(harness, reply_to="dashboard/1")
+    assert topic == "rs485tx/bms/history/response/dashboard/1"
+    assert "series" in response
+
+    for reply_to in ("homeassistant/#", "a/+/b", "a//b", "/a", ["a"]):
+        topic, response = request(harness, reply_to=reply_to)
+        assert topic == "rs485tx/bms/history/response"
+        assert "reply_to" in response["error"]
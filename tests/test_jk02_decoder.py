@@ -0,0 +1,94 @@
+"""
+Golden frames for the table-driven decoder.
+
+The expected JSON is what the original inline decoder published for the
+same frames, so key order, scaling and truncation must stay identical.
+"""
+
+import json
+import struct
+
+import jk02_decoder
+
+SETTINGS_FRAME = bytes.fromhex(
+    "55aaeb90010000000000280a000000000000420e000000000000050000007a0d0000540b0000c0da000080d40000c409"
+    "0000a08601000000000000000000f0490200000000000000000000000000d00700000000000000000000000000000000"
+    "000000000000000000000000000000000000100000000100000001000000010000000000000000000000480d00000000"
+    "000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000"
+    "000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000"
+    "000000000000000000000000000000000000000000000000000000000000030000000000000000000000000000000000"
+    "0000000000000000000000470000000000000000"
+)
+
+CELL_INFO_FRAME = bytes.fromhex(
+    "55aaeb900200e50cf30ce10ce80cef0ce00cdb0cfa0cf40cde0cea0ced0cdc0cfc0cf50ce40c00000000000000000000"
+    "0000000000000000000000000000000000000000000000000000e90c21000d062a002d00430042002c0037002d004b00"
+    "43002b004c002f003600500050004d000000000000000000000000000000000000000000000010000200000000000000"
+    "0701000000009fce000000000000c7cfffff0a01ff00000000000000001b50270100c04504002a000000000000006400"
+    "000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000"
+    "00000000000000000000000000000000e900f40000000000000000000000000000000000000000000000000000000000"
+    "0000000000000000000000f30300000000000000"
+)
+
+SETTINGS_JSON = (
+    '{"charge_voltage": 56.0, "float_voltage": 54.4, "max_charge_current": 100.0, "max_discharge_current": 150.0, '
+    '"charge_enabled_switch": "ON", "discharge_enabled_switch": "ON", "balance_start_voltage": 3.4, '
+    '"balance_trigger_voltage": 0.005, "max_balance_current": 2.0, "balancer_switch": "ON", "soc100_voltage": 3.45, '
+    '"soc_zero_voltage": 2.9, "cell_uvp": 2.6, "cell_ovp": 3.65, "power_off_voltage": 2.5}'
+)
+
+CELLS_JSON = (
+    '"cv01": 3.301, "cr01": 0.042, "cv02": 3.315, "cr02": 0.045, "cv03": 3.297, "cr03": 0.067, "cv04": 3.304, '
+    '"cr04": 0.066, "cv05": 3.311, "cr05": 0.044, "cv06": 3.296, "cr06": 0.055, "cv07": 3.291, "cr07": 0.045, '
+    '"cv08": 3.322, "cr08": 0.075, "cv09": 3.316, "cr09": 0.067, "cv10": 3.294, "cr10": 0.043, "cv11": 3.306, '
+    '"cr11": 0.076, "cv12": 3.309, "cr12": 0.047, "cv13": 3.292, "cr13": 0.054, "cv14": 3.324, "cr14": 0.08, '
+    '"cv15": 3.317, "cr15": 0.08, "cv16": 3.3, "cr16": 0.077'
+)
+
+CELL_INFO_JSON = (
+    '{"bat_voltage": 52.895, "bat_current": -12.345, "bat_power": -652.988, "soc": 27, "soh": 100, "cycles": 42, '
+    '"cap_remaining": 75.6, "cap_total": 280.0, "temp_mos": 26.3, "temp1": 26.6, "temp2": 25.5, "temp3": 23.3, '
+    '"temp4": 24.4, "cell_avg_volt": 3.305, "cell_volt_diff": 0.033, "cell_max_index": 14, "cell_min_index": 7, '
+    '"bal_current": 0.0, "bal_enabled": "OFF", "bal_mode": "Off", "alarm": "ON", '
+    + CELLS_JSON + ', "alarms": ["Cell OVP", "GPS Disconnected"]}'
+)
+
+BALANCING_JSON = (
+    '{"bat_voltage": 52.895, "bat_current": -12.345, "bat_power": -652.988, "soc": 27, "soh": 100, "cycles": 42, '
+    '"cap_remaining": 75.6, "cap_total": 280.0, "temp_mos": -5.5, "temp1": 26.6, "temp2": 25.5, "temp3": 23.3, '
+    '"temp4": 24.4, "cell_avg_volt": 3.305, "cell_volt_diff": 0.033, "cell_max_index": 14, "cell_min_index": 7, '
+    '"bal_current": -1.234, "bal_enabled": "ON", "bal_mode": "Discharging balancer", "alarm": "OFF", '
+    + CELLS_JSON + ', "alarms": []}'
+)
+
+
+def test_frame_header_fields():
+    assert jk02_decoder.frame_type(SETTINGS_FRAME) == jk02_decoder.FRAME_TYPE_SETTINGS
+    assert jk02_decoder.frame_type(CELL_INFO_FRAME) == jk02_decoder.FRAME_TYPE_CELL_INFO
+    assert jk02_decoder.frame_address(SETTINGS_FRAME) == 3
+    assert jk02_decoder.frame_address(CELL_INFO_FRAME) == 3
+    assert jk02_decoder.read_cell_count(SETTINGS_FRAME) == 16
+
+
+def test_decode_settings_golden():
+    assert json.dumps(jk02_decoder.decode_settings(SETTINGS_FRAME)) == SETTINGS_JSON
+
+
+def test_decode_cell_info_golden():
+    assert json.dumps(jk02_decoder.decode_cell_info(CELL_INFO_FRAME, 16)) == CELL_INFO_JSON
+
+
+def test_decode_cell_info_balancing_and_negative_values():
+    frame = bytearray(CELL_INFO_FRAME)
+    frame[jk02_decoder.BALANCING_MODE_OFFSET] = 0x02
+    struct.pack_into("<h", frame, 144, -55)    # MOS temperature
+    struct.pack_into("<h", frame, 170, -1234)  # balancing current
+    frame[jk02_decoder.ALARM_OFFSET:jk02_decoder.ALARM_OFFSET + 3] = bytes(3)
+    assert json.dumps(jk02_decoder.decode_cell_info(bytes(frame), 16)) == BALANCING_JSON
+
+
+def test_alarm_mask_and_names():
+    mask = jk02_decoder.read_alarm_mask(CELL_INFO_FRAME)
+    assert mask == (1 << 4) | (1 << 17)
+    assert jk02_decoder.alarm_names(mask) == ["Cell OVP", "GPS Disconnected"]
+    assert jk02_decoder.alarm_names(0) == []
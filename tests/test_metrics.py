@@ -0,0 +1,18 @@
+from metrics import ProxyMetrics
+
+
+def test_label_values_escaped():
+    metrics = ProxyMetrics()
+    metrics.payloads_received.inc('rs485tx/"a"\\b\nc/tx')
+    assert 'jk_bms_payloads_received_total{source="rs485tx/\\"a\\"\\\\b\\nc/tx"} 1' in metrics.registry.render()
+
+
+def test_rejected_frames_labelled():
+    metrics = ProxyMetrics()
+    metrics.frames_rejected.inc("bad_checksum", 0x02, "rs485tx/roomA/tx", "")
+    metrics.frames_rejected.inc("unregistered", 0x02, "rs485tx/roomA/tx", "roomA/01")
+    metrics.frames_rejected.inc("unsupported_type", 0x03, "rs485tx/tx", "02")
+    lines = metrics.registry.render().splitlines()
+    assert 'jk_bms_frames_rejected_total{reason="bad_checksum",type="cell_info",source="rs485tx/roomA/tx",bms=""} 1' in lines
+    assert 'jk_bms_frames_rejected_total{reason="unregistered",type="cell_info",source="rs485tx/roomA/tx",bms="roomA/01"} 1' in lines
+    assert 'jk_bms_frames_rejected_total{reason="unsupported_type",type="0x03",source="rs485tx/tx",bms="02"} 1' in lines
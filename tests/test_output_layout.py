@@ -0,0 +1,52 @@
+import json
+
+from output_layout import SplitLayout, split_subtopic, template_field
+from test_jk02_decoder import CELL_INFO_FRAME, SETTINGS_FRAME
+
+
+def test_split_subtopics():
+    assert split_subtopic("cv01") == "cells/voltage/01"
+    assert split_subtopic("cr16") == "cells/resistance/16"
+    assert split_subtopic("temp_mos") == "temperatures/mos"
+    assert split_subtopic("temp3") == "temperatures/3"
+    assert split_subtopic("alarm") == "alarms/active"
+    assert split_subtopic("alarms") == "alarms/list"
+    assert split_subtopic("soc") == "pack/soc"
+    assert split_subtopic("cvx") == "pack/cvx"
+
+
+def test_messages_format_plain_values():
+    layout = SplitLayout("rs485tx/bms")
+    state = {"soc": 87, "cv01": 3.301, "bal_enabled": "OFF", "alarms": ["Cell OVP"]}
+    assert layout.messages("roomA/01", state) == [
+        ("rs485tx/bms/roomA/01/pack/soc", "87"),
+        ("rs485tx/bms/roomA/01/cells/voltage/01", "3.301"),
+        ("rs485tx/bms/roomA/01/pack/bal_enabled", "OFF"),
+        ("rs485tx/bms/roomA/01/alarms/list", '["Cell OVP"]'),
+    ]
+    assert layout.messages("roomA/01", state, ["soc"]) == [("rs485tx/bms/roomA/01/pack/soc", "87")]
+
+
+def test_template_field():
+    assert template_field("{{ value_json.soc | float }}") == "soc"
+    assert template_field("{{ value }}") is None
+
+
+def test_proxy_split_layout(make_proxy):
+    harness = make_proxy(output_layout="split")
+    harness.feed(SETTINGS_FRAME, CELL_INFO_FRAME)
+    messages = {topic: payload for topic, payload, _ in harness.client.messages}
+    assert "rs485tx/bms/03/state" not in messages
+    assert messages["rs485tx/bms/03/pack/soc"] == "27"
+    assert messages["rs485tx/bms/03/cells/voltage/16"] == "3.3"
+    config = json.loads(messages["homeassistant/sensor/jk_bms_03/soc/config"])
+    assert config["state_topic"] == "rs485tx/bms/03/pack/soc"
+    assert "value_template" not in config
+
+
+def test_proxy_both_layouts(make_proxy):
+    harness = make_proxy(output_layout="both")
+    harness.feed(SETTINGS_FRAME, CELL_INFO_FRAME)
+    topics = harness.client.topics()
+    assert "rs485tx/bms/03/state" in topics
+    assert "rs485tx/bms/03/pack/soc" in topics
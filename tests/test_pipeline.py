@@ -0,0 +1,57 @@
+from pipeline import LaneQueue
+
+
+def drain(queue):
+    items = []
+    while (item := queue.get(0)) is not None:
+        items.append(item)
+    return items
+
+
+def test_priority_lane_served_first():
+    queue = LaneQueue(10)
+    queue.put("state")
+    queue.put("settings", priority=True)
+    assert drain(queue) == ["settings", "state"]
+
+
+def test_normal_lane_drops_oldest():
+    queue = LaneQueue(2)
+    for item in ("a", "b", "c"):
+        queue.put(item)
+    assert queue.dropped == 1
+    assert drain(queue) == ["b", "c"]
+
+
+def test_priority_items_coalesced_per_key():
+    queue = LaneQueue(10)
+    queue.put("01 online", priority=True, key="01/availability")
+    queue.put("event 1", priority=True)
+    queue.put("01 offline", priority=True, key="01/availability")
+    queue.put("event 2", priority=True)
+    queue.put("01 online again", priority=True, key="01/availability")
+    # The newest value keeps the position of the first one
+    assert drain(queue) == ["01 online again", "event 1", "event 2"]
+    queue.put("01 offline", priority=True, key="01/availability")
+    assert drain(queue) == ["01 offline"]
+
+
+def test_priority_lane_bounded():
+    queue = LaneQueue(3)
+    for i in range(5):
+        queue.put(f"event {i}", priority=True)
+    for i in range(100):
+        queue.put(i, priority=True, key="settings")
+    assert queue.priority_dropped == 3
+    assert drain(queue) == ["event 3", "event 4", 99]
+
+
+def test_put_front_skips_superseded_item():
+    queue = LaneQueue(10)
+    queue.put("old", priority=True, key="01/settings")
+    item = queue.get(0)
+    queue.put("new", priority=True, key="01/settings")
+    queue.put_front(item, "01/settings")
+    assert drain(queue) == ["new"]
+    queue.put_front("retry", "01/settings")
+    assert drain(queue) == ["retry"]
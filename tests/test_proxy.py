@@ -0,0 +1,59 @@
+import struct
+
+import jk02_decoder
+from frame_parser import CHECKSUM_OFFSET
+from test_jk02_decoder import CELL_INFO_FRAME, SETTINGS_FRAME
+
+
+def with_cell_count(frame, cell_count):
+    frame = bytearray(frame)
+    struct.pack_into("<l", frame, jk02_decoder.CELL_COUNT_OFFSET, cell_count)
+    frame[CHECKSUM_OFFSET] = sum(frame[:CHECKSUM_OFFSET]) & 0xFF
+    return bytes(frame)
+
+
+def test_settings_frame_registers_bms(make_proxy):
+    harness = make_proxy()
+    harness.feed(SETTINGS_FRAME, CELL_INFO_FRAME)
+    assert harness.proxy.bms_registry == {"03": 16}
+    assert "rs485tx/bms/03/state" in harness.client.topics()
+
+
+def test_out_of_range_cell_count_ignored(make_proxy):
+    harness = make_proxy()
+    harness.feed(SETTINGS_FRAME)
+    for cell_count in (0, jk02_decoder.MAX_CELLS + 1, 200):
+        harness.feed(with_cell_count(SETTINGS_FRAME, cell_count), CELL_INFO_FRAME)
+    assert harness.proxy.bms_registry == {"03": 16}
+    assert harness.proxy.metrics.frames_rejected.values == {("bad_cell_count", 0x01, "rs485tx/tx", "03"): 3}
+    assert harness.client.topics().count("rs485tx/bms/03/state") == 3
+
+
+def test_cell_count_change_resets_publish_filter(make_proxy):
+    from publish_filter import PublishFilter
+
+    harness = make_proxy(publish_filter=PublishFilter())
+    harness.feed(SETTINGS_FRAME, CELL_INFO_FRAME, CELL_INFO_FRAME)
+    assert harness.client.topics().count("rs485tx/bms/03/state") == 1
+    harness.feed(with_cell_count(SETTINGS_FRAME, 15))
+    assert ("03", "state") not in harness.proxy.publish_filter._published
+    harness.feed(CELL_INFO_FRAME)
+    assert harness.client.topics().count("rs485tx/bms/03/state") == 2
+
+
+class Message:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def test_backlogged_chunks_reassembled_in_arrival_order(make_proxy):
+    harness = make_proxy()
+    proxy = harness.proxy
+    chunks = [CELL_INFO_FRAME[:200], CELL_INFO_FRAME[200:] + SETTINGS_FRAME[:100], SETTINGS_FRAME[100:]]
+    for chunk in chunks:
+        proxy.on_message(None, None, Message("rs485tx/tx", chunk))
+    harness.drain()
+    assert proxy.reassembler.counters["frames"] == 2
+    assert proxy.reassembler.counters["bad_checksum"] == 0
+    assert proxy.bms_registry == {"03": 16}
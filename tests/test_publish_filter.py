@@ -0,0 +1,62 @@
+from publish_filter import PublishFilter, expand_deadbands
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_filter(clock, max_interval=300):
+    return PublishFilter(expand_deadbands({"cell_voltage": 0.005, "current": 0.1}), max_interval, clock)
+
+
+def test_longest_prefix_deadband():
+    publish_filter = PublishFilter({"c": 1, "cv": 0.005}, clock=Clock())
+    assert publish_filter._deadband("cv01") == 0.005
+    assert publish_filter._deadband("cycles") == 1
+    assert publish_filter._deadband("soc") == 0
+
+
+def test_state_published_only_when_a_field_crosses_its_deadband():
+    publish_filter = make_filter(Clock())
+    key = ("01", "state")
+    assert publish_filter.check_state(key, {"cv01": 3.300, "bat_current": 1.0, "soc": 50})
+    assert not publish_filter.check_state(key, {"cv01": 3.304, "bat_current": 1.09, "soc": 50})
+    # Compared with the last published state, not the last seen one
+    assert publish_filter.check_state(key, {"cv01": 3.305, "bat_current": 1.0, "soc": 50})
+    assert publish_filter.check_state(key, {"cv01": 3.305, "bat_current": 1.0, "soc": 51})
+    assert publish_filter.check_state(key, {"cv01": 3.305, "bat_current": 1.0, "soc": 51, "cv02": 3.3})
+
+
+def test_heartbeat_after_max_interval():
+    clock = Clock()
+    publish_filter = make_filter(clock, max_interval=60)
+    key = ("01", "state")
+    assert publish_filter.check_state(key, {"soc": 50})
+    clock.now = 59
+    assert not publish_filter.check_state(key, {"soc": 50})
+    clock.now = 60
+    assert publish_filter.check_state(key, {"soc": 50})
+
+
+def test_changed_fields():
+    clock = Clock()
+    publish_filter = make_filter(clock, max_interval=60)
+    key = ("01", "split")
+    assert publish_filter.changed_fields(key, {"cv01": 3.3, "alarms": []}) == ["cv01", "alarms"]
+    assert publish_filter.changed_fields(key, {"cv01": 3.303, "alarms": ["Cell OVP"]}) == ["alarms"]
+    assert publish_filter.changed_fields(key, {"cv01": 3.306, "alarms": ["Cell OVP"]}) == ["cv01"]
+    clock.now = 60
+    assert publish_filter.changed_fields(key, {"cv01": 3.306, "alarms": ["Cell OVP"]}) == ["cv01", "alarms"]
+
+
+def test_payload_and_forget():
+    publish_filter = make_filter(Clock())
+    key = ("01", "settings")
+    assert publish_filter.check_payload(key, "{}")
+    assert not publish_filter.check_payload(key, "{}")
+    publish_filter.forget(key)
+    assert publish_filter.check_payload(key, "{}")
@@ -0,0 +1,38 @@
+import json
+
+from registry import VERSION, BmsRegistry
+
+
+def test_registry_round_trip(tmp_path):
+    path = str(tmp_path / "registry.json")
+    registry = BmsRegistry(path)
+    registry.register("01", 16)
+    registry.update_settings("01", {"charge_voltage": 56.0})
+    registry.announced("01", "abc")
+    restored = BmsRegistry(path)
+    assert restored == {"01": 16}
+    assert restored.settings["01"] == {"charge_voltage": 56.0}
+    assert restored.discovery_hashes["01"] == "abc"
+    assert restored.restored == {"01"}
+
+
+def test_damaged_entries_skipped(tmp_path):
+    path = tmp_path / "registry.json"
+    path.write_text(json.dumps({"version": VERSION, "bms": {
+        "01": {"cell_count": 16},
+        "02": {"cell_count": "many"},
+        "03": {},
+        "04": "16",
+        "05": {"cell_count": 400},
+        "06": {"cell_count": 8, "settings": [1, 2]},
+        "roomA/07": {"cell_count": 24, "settings": None},
+    }}))
+    assert BmsRegistry(str(path)) == {"01": 16, "roomA/07": 24}
+
+
+def test_unreadable_file_ignored(tmp_path):
+    path = tmp_path / "registry.json"
+    path.write_text("{not json")
+    assert BmsRegistry(str(path)) == {}
+    path.write_text(json.dumps({"version": VERSION, "bms": []}))
+    assert BmsRegistry(str(path)) == {}
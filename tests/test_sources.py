@@ -0,0 +1,47 @@
+from sources import SourceMap, device_name, node_id, shared_topic
+
+
+def test_namespace_from_wildcard_levels():
+    sources = SourceMap("rs485tx/+/tx")
+    assert sources.namespace("rs485tx/roomA/tx") == "roomA"
+    assert sources.namespace("rs485tx/room A!/tx") == "room_A_"
+    assert sources.namespace("rs485tx/roomA/rx") == ""
+    assert sources.bms_id("roomA", 1) == "roomA/01"
+    assert sources.bms_id("", 1) == "01"
+    assert SourceMap("rs485tx/#").namespace("rs485tx/site1/bus2") == "site1/bus2"
+
+
+def test_topic_matching():
+    sources = SourceMap("rs485tx/+/tx")
+    assert sources.matches("rs485tx/roomA/tx")
+    assert not sources.matches("rs485tx/roomA/tx/more")
+    assert not sources.matches("rs485tx/tx")
+    assert SourceMap("rs485tx/tx").matches("rs485tx/tx")
+    assert SourceMap("rs485tx/#").matches("rs485tx/a/b/c")
+    assert SourceMap("rs485tx/#").matches("rs485tx/bms/01/state")
+
+
+def test_rendezvous_assignment_is_stable_and_complete():
+    gateways = [f"rs485tx/gw{i}/tx" for i in range(60)]
+    owners = {}
+    for index in range(3):
+        sources = SourceMap("rs485tx/+/tx", index, 3)
+        for topic in gateways:
+            if sources.owns(topic):
+                assert topic not in owners
+                owners[topic] = index
+    assert len(owners) == len(gateways)
+    assert set(owners.values()) == {0, 1, 2}
+    # A fourth instance only takes gateways over, it never reshuffles the others
+    for topic in gateways:
+        owner = next(i for i in range(4) if SourceMap("rs485tx/+/tx", i, 4).owns(topic))
+        assert owner in (owners[topic], 3)
+
+
+def test_names():
+    assert node_id("roomA/01") == "jk_bms_roomA_01"
+    assert device_name("roomA/01") == "JK BMS roomA #01"
+    assert device_name("01") == "JK BMS #01"
+    assert device_name("bank") == "JK BMS Bank"
+    assert shared_topic("rs485tx/tx", "") == "rs485tx/tx"
+    assert shared_topic("rs485tx/tx", "jk") == "$share/jk/rs485tx/tx"
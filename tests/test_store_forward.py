@@ -0,0 +1,63 @@
+import json
+import random
+
+from store_forward import StoreForwardBuffer, stamp_payload
+
+
+def drain(buffer):
+    messages = []
+    while (message := buffer.peek()) is not None:
+        messages.append(message)
+        buffer.pop()
+    return messages
+
+
+def test_messages_replayed_in_order(tmp_path):
+    buffer = StoreForwardBuffer(str(tmp_path / "spool.bin"), 4096)
+    buffer.append("bms/01/state", '{"soc": 50}', timestamp=100.0)
+    buffer.append("bms/02/state", b"\x01\x02", timestamp=101.5)
+    assert len(buffer) == 2
+    assert drain(buffer) == [("bms/01/state", b'{"soc": 50}', 100.0), ("bms/02/state", b"\x01\x02", 101.5)]
+    assert buffer.peek() is None
+
+
+def test_full_buffer_overwrites_oldest_across_wraps(tmp_path):
+    buffer = StoreForwardBuffer(str(tmp_path / "spool.bin"), 1000)
+    rnd = random.Random(1)
+    kept = []
+    for i in range(500):
+        payload = bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 120)))
+        buffer.append(f"t/{i}", payload, timestamp=i)
+        kept.append((f"t/{i}", payload, float(i)))
+        if rnd.random() < 0.2:
+            assert buffer.peek() == kept[-len(buffer)]
+    replayed = drain(buffer)
+    assert replayed == kept[-len(replayed):]
+    assert buffer.dropped == len(kept) - len(replayed)
+
+
+def test_oversized_message_rejected(tmp_path):
+    buffer = StoreForwardBuffer(str(tmp_path / "spool.bin"), 64)
+    assert not buffer.append("t", b"x" * 100)
+    assert buffer.dropped == 1
+    assert len(buffer) == 0
+
+
+def test_buffer_survives_reopen(tmp_path):
+    path = str(tmp_path / "spool.bin")
+    buffer = StoreForwardBuffer(path, 4096)
+    for i in range(3):
+        buffer.append(f"t/{i}", f"{i}", timestamp=i)
+    buffer.pop()
+    buffer.close()
+    reopened = StoreForwardBuffer(path, 4096)
+    assert drain(reopened) == [("t/1", b"1", 1.0), ("t/2", b"2", 2.0)]
+
+
+def test_stamp_payload():
+    assert json.loads(stamp_payload(b'{"soc": 50}', 0)) == {"time": "1970-01-01T00:00:00.000+00:00", "soc": 50}
+    assert json.loads(stamp_payload(b"{}", 1.5)) == {"time": "1970-01-01T00:00:01.500+00:00"}
+    assert json.loads(stamp_payload(b"3.301", 0)) == {"time": "1970-01-01T00:00:00.000+00:00", "value": "3.301"}
+    assert stamp_payload(b"\x93\xff", 0) == b"\x93\xff"
+    assert json.loads(stamp_payload(b"[1,[2,3]]", 0)) == {"time": "1970-01-01T00:00:00.000+00:00", "value": [1, [2, 3]]}
+    assert stamp_payload(b"abc", 0, binary=True) == b"abc"
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the decode and publish hot paths.
+
+Drives RS485MQTTClient.on_message with synthetic settings and cell info
+frames for 8/16/24/32-cell packs, runs the pipeline stages synchronously
+against a null MQTT client and reports frames per second, per-frame latency
+percentiles and tracemalloc allocation figures.
+
+    python3 tools/benchmark.py --save baseline.json
+    python3 tools/benchmark.py --compare baseline.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "jk_bms_rs485_proxy"))
+
+from bms_simulator import SimulatedBms  # noqa: E402
+from capture import NullMQTTClient  # noqa: E402
+from rs485_mqtt_ha_proxy import RS485MQTTClient  # noqa: E402
+
+CELL_COUNTS = (8, 16, 24, 32)
+TOPIC_TX = "rs485tx/tx"
+
+
+class Message:
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def build_proxy(**kwargs):
+    proxy = RS485MQTTClient("bench", 0, "", "", TOPIC_TX, "homeassistant", "rs485tx/bms", **kwargs)
+    proxy.client = NullMQTTClient()
+    proxy.discovery.attach(proxy.client)
+    proxy.discovery.qos = 0
+    return proxy
+
+
+def drain(proxy):
+    """Run the decode and publish stages synchronously until both queues are empty."""
+    pipeline = proxy.pipeline
+    while True:
+        item = pipeline.inbound.get(0)
+        if item is None:
+            break
+        proxy.process_payload(item)
+    while True:
+        item = pipeline.outbound.get(0)
+        if item is None:
+            break
+        _, topic, payload, qos, retain = item
+        proxy.safe_publish(topic, payload, qos, retain)
+
+
+def build_messages(packs, cell_count, frames, settings_every):
+    simulators = [SimulatedBms(address, cell_count) for address in range(1, packs + 1)]
+    registration = [Message(TOPIC_TX, bms.settings_frame()) for bms in simulators]
+    messages = []
+    for i in range(frames):
+        bms = simulators[i % packs]
+        if settings_every and i % settings_every == settings_every - 1:
+            messages.append(Message(TOPIC_TX, bms.settings_frame()))
+        else:
+            bms.step()
+            messages.append(Message(TOPIC_TX, bms.cell_info_frame()))
+    return registration, messages
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(packs, cell_count, frames, settings_every, proxy_kwargs=dict):
+    registration, messages = build_messages(packs, cell_count, frames, settings_every)
+
+    # Timing pass
+    proxy = build_proxy(**proxy_kwargs())
+    for msg in registration:
+        proxy.on_message(None, None, msg)
+        drain(proxy)
+    latencies = []
+    clock = time.perf_counter_ns
+    gc.collect()
+    started = clock()
+    for msg in messages:
+        t0 = clock()
+        proxy.on_message(None, None, msg)
+        drain(proxy)
+        latencies.append(clock() - t0)
+    elapsed = (clock() - started) / 1e9
+    latencies.sort()
+
+    # Allocation pass on a fresh proxy, tracemalloc slows everything down
+    proxy = build_proxy(**proxy_kwargs())
+    for msg in registration:
+        proxy.on_message(None, None, msg)
+        drain(proxy)
+    sample = messages[:min(len(messages), 2000)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    peak_total = 0
+    for msg in sample:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        proxy.on_message(None, None, msg)
+        drain(proxy)
+        peak_total += tracemalloc.get_traced_memory()[1] - base
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    net_blocks = sum(stat.count_diff for stat in stats)
+    net_bytes = sum(stat.size_diff for stat in stats)
+
+    us = lambda ns: round(ns / 1000, 2)
+    return {
+        "packs": packs,
+        "cells": cell_count,
+        "frames": frames,
+        "fps": round(frames / elapsed, 1),
+        "latency_us": {
+            "p50": us(percentile(latencies, 0.50)),
+            "p90": us(percentile(latencies, 0.90)),
+            "p99": us(percentile(latencies, 0.99)),
+            "max": us(latencies[-1]),
+        },
+        "alloc_peak_bytes_per_frame": round(peak_total / len(sample)),
+        "retained_blocks_per_frame": round(net_blocks / len(sample), 3),
+        "retained_bytes_per_frame": round(net_bytes / len(sample), 1),
+        "publishes": proxy.client.published,
+    }
+
+
+def mismatches(results, baseline):
+    """Return the run parameters that differ from the baseline.
+
+    Frames per second and allocations depend on the publish mode and on
+    the frame mix, so results of differently configured runs are not
+    comparable.
+    """
+    differences = []
+    for key in ("mode", "settings_every"):
+        if key in baseline and baseline[key] != results[key]:
+            differences.append(f"{key}: {baseline[key]} in baseline, {results[key]} now")
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            differences.append(f"{name}: not in baseline")
+            continue
+        for key in ("packs", "cells", "frames"):
+            if previous.get(key) != current[key]:
+                differences.append(f"{name}: {key} {previous.get(key)} in baseline, {current[key]} now")
+    return differences
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions of results against a baseline."""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        if current["fps"] < previous["fps"] * (1 - tolerance):
+            regressions.append(f"{name}: fps {previous['fps']} -> {current['fps']}")
+        if current["latency_us"]["p99"] > previous["latency_us"]["p99"] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {previous['latency_us']['p99']}us -> {current['latency_us']['p99']}us")
+        if current["alloc_peak_bytes_per_frame"] > previous["alloc_peak_bytes_per_frame"] * (1 + tolerance):
+            regressions.append(f"{name}: peak alloc {previous['alloc_peak_bytes_per_frame']} -> {current['alloc_peak_bytes_per_frame']} bytes/frame")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the JK-BMS proxy decode/publish path")
+    parser.add_argument("--packs", type=int, nargs="+", default=[1, 8], help="number of BMS addresses per scenario")
+    parser.add_argument("--cells", type=int, nargs="+", default=list(CELL_COUNTS))
+    parser.add_argument("--frames", type=int, default=20000, help="frames per scenario")
+    parser.add_argument("--settings-every", type=int, default=50, help="one settings frame per N frames, 0 = none")
+    parser.add_argument("--mode", choices=("all", "change", "aggregate"), default="all", help="publish mode")
+    parser.add_argument("--save", metavar="FILE", help="write results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare against a JSON baseline, exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    parser.add_argument("--force", action="store_true", help="compare even if the run parameters differ from the baseline")
+    args = parser.parse_args()
+
+    def proxy_kwargs():
+        # Filters keep per-address state, so every proxy gets its own
+        if args.mode == "change":
+            from publish_filter import PublishFilter, expand_deadbands
+            return {"publish_filter": PublishFilter(expand_deadbands({"cell_voltage": 0.005, "temperature": 0.1}))}
+        if args.mode == "aggregate":
+            from aggregator import StateAggregator
+            return {"aggregator": StateAggregator(10)}
+        return {}
+
+    results = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "mode": args.mode,
+        "settings_every": args.settings_every,
+        "scenarios": {},
+    }
+    print(f"{'scenario':<16}{'fps':>10}{'p50 us':>10}{'p90 us':>10}{'p99 us':>10}{'max us':>10}{'peak B/f':>10}{'kept B/f':>10}")
+    for packs in args.packs:
+        for cells in args.cells:
+            name = f"{packs}x{cells}s"
+            r = run_scenario(packs, cells, args.frames, args.settings_every, proxy_kwargs)
+            results["scenarios"][name] = r
+            lat = r["latency_us"]
+            print(f"{name:<16}{r['fps']:>10}{lat['p50']:>10}{lat['p90']:>10}{lat['p99']:>10}{lat['max']:>10}"
+                  f"{r['alloc_peak_bytes_per_frame']:>10}{r['retained_bytes_per_frame']:>10}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for key in ("python", "machine"):
+            if baseline.get(key) != results[key]:
+                print(f"Warning: baseline was recorded on {key} {baseline.get(key)}, this run is on {results[key]}")
+        differences = mismatches(results, baseline)
+        if differences:
+            print(f"Run parameters differ from {args.compare}:")
+            for line in differences:
+                print(f"  {line}")
+            if not args.force:
+                print("Not comparing; rerun with the baseline's parameters or pass --force")
+                return 2
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
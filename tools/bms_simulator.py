@@ -0,0 +1,130 @@
+"""
+Synthetic JK02 frames for benchmarks and load tests.
+
+Frames follow the offsets used by jk02_decoder and carry a valid checksum.
+"""
+
+import math
+import os
+import random
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "jk_bms_rs485_proxy"))
+
+from frame_parser import CHECKSUM_OFFSET  # noqa: E402
+from jk02_decoder import (  # noqa: E402
+    CELL_INFO_ADDRESS_OFFSET,
+    CELL_RESISTANCE_OFFSET,
+    CELL_VOLTAGE_OFFSET,
+    FRAME_HEADER,
+    FRAME_LENGTH,
+    FRAME_TYPE_CELL_INFO,
+    FRAME_TYPE_OFFSET,
+    FRAME_TYPE_SETTINGS,
+    SETTINGS_ADDRESS_OFFSET,
+)
+
+
+def finish_frame(frame):
+    frame[CHECKSUM_OFFSET] = sum(frame[:CHECKSUM_OFFSET]) & 0xFF
+    return bytes(frame)
+
+
+def _new_frame(frame_type):
+    frame = bytearray(FRAME_LENGTH)
+    frame[0:4] = FRAME_HEADER
+    frame[FRAME_TYPE_OFFSET] = frame_type
+    return frame
+
+
+class SimulatedBms:
+    """One pack with slowly drifting values."""
+
+    def __init__(self, address, cell_count=16, seed=None, alarm_rate=0.0):
+        self.address = address
+        self.cell_count = cell_count
+        self.alarm_rate = alarm_rate
+        self.random = random.Random(seed if seed is not None else address)
+        self.cells = [3300 + self.random.randint(-15, 15) for _ in range(cell_count)]
+        self.resistances = [self.random.randint(40, 90) for _ in range(cell_count)]
+        self.current = 0
+        self.soc = self.random.randint(20, 95)
+        self.temperatures = [250 + self.random.randint(-20, 20) for _ in range(5)]
+        self.alarm = 0
+        self.tick = 0
+        # Cycle count byte, used by the soak test to carry a frame sequence number
+        self.cycles = 42
+
+    def settings_frame(self):
+        frame = _new_frame(FRAME_TYPE_SETTINGS)
+        pack_i32 = lambda offset, value: struct.pack_into("<l", frame, offset, value)
+        pack_i32(10, 2600)                    # cell UVP
+        pack_i32(18, 3650)                    # cell OVP
+        pack_i32(26, 5)                       # balance trigger
+        pack_i32(30, 3450)                    # SOC 100% voltage
+        pack_i32(34, 2900)                    # SOC 0% voltage
+        pack_i32(38, 3500 * self.cell_count)  # charge voltage
+        pack_i32(42, 3400 * self.cell_count)  # float voltage
+        pack_i32(46, 2500)                    # power off voltage
+        pack_i32(50, 100000)                  # max charge current
+        pack_i32(62, 150000)                  # max discharge current
+        pack_i32(78, 2000)                    # max balance current
+        pack_i32(114, self.cell_count)
+        pack_i32(138, 3400)                   # balance start voltage
+        frame[118] = frame[122] = frame[126] = 1
+        frame[SETTINGS_ADDRESS_OFFSET] = self.address
+        return finish_frame(frame)
+
+    def step(self):
+        """Advance the simulated pack by one frame interval."""
+        rnd = self.random
+        self.tick += 1
+        self.current = int(20000 * math.sin(self.tick / 500.0)) + rnd.randint(-300, 300)
+        drift = 1 if self.current > 0 else -1
+        for i in range(self.cell_count):
+            if rnd.random() < 0.2:
+                self.cells[i] = min(3650, max(2600, self.cells[i] + drift * rnd.randint(0, 2) + rnd.randint(-1, 1)))
+        for i in range(len(self.temperatures)):
+            if rnd.random() < 0.05:
+                self.temperatures[i] += rnd.randint(-1, 1)
+        if self.alarm_rate and rnd.random() < self.alarm_rate:
+            self.alarm ^= 1 << rnd.randrange(24)
+
+    def cell_info_frame(self):
+        frame = _new_frame(FRAME_TYPE_CELL_INFO)
+        cells = self.cells
+        for i, (voltage, resistance) in enumerate(zip(cells, self.resistances)):
+            struct.pack_into("<h", frame, CELL_VOLTAGE_OFFSET + i * 2, voltage)
+            struct.pack_into("<h", frame, CELL_RESISTANCE_OFFSET + i * 2, resistance)
+        high = max(range(self.cell_count), key=cells.__getitem__)
+        low = min(range(self.cell_count), key=cells.__getitem__)
+        struct.pack_into("<h", frame, 74, sum(cells) // self.cell_count)
+        struct.pack_into("<h", frame, 76, cells[high] - cells[low])
+        frame[78] = high
+        frame[79] = low
+        struct.pack_into("<h", frame, 144, self.temperatures[0])
+        struct.pack_into("<l", frame, 150, sum(cells))
+        struct.pack_into("<l", frame, 158, self.current)
+        struct.pack_into("<h", frame, 162, self.temperatures[1])
+        struct.pack_into("<h", frame, 164, self.temperatures[2])
+        struct.pack_into("<h", frame, 170, 0)
+        frame[172] = 0x01 if self.current > 0 else 0x00
+        frame[173] = self.soc
+        struct.pack_into("<l", frame, 174, 280000 * self.soc // 100)
+        struct.pack_into("<l", frame, 178, 280000)
+        frame[182] = self.cycles & 0xFF
+        frame[190] = 100
+        struct.pack_into("<h", frame, 256, self.temperatures[3])
+        struct.pack_into("<h", frame, 258, self.temperatures[4])
+        frame[134:137] = self.alarm.to_bytes(3, "little")
+        frame[CELL_INFO_ADDRESS_OFFSET] = self.address
+        return finish_frame(frame)
+
+
+def corrupt(frame, rnd=random):
+    """Flip one byte of a frame so its checksum no longer matches."""
+    frame = bytearray(frame)
+    position = rnd.randrange(len(FRAME_HEADER) + 1, CHECKSUM_OFFSET)
+    frame[position] ^= 0xFF
+    return bytes(frame)
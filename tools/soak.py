@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+Load and soak test of the proxy against a simulated BMS fleet.
+
+Simulates --packs BMS addresses sending cell info frames at --rate frames
+per second each, a settings frame every --settings-every seconds, random
+alarm bits, corrupt frames (--corrupt-rate) and payloads split in two
+(--fragment-rate). Frames reach the proxy either through an in-process
+stand-in for the broker (default, runs offline: the proxy's real decode and
+publish workers run, only paho is replaced), or through a real broker such
+as a local mosquitto given with --broker, in which case the proxy runs its
+normal MQTT client and engine in this process.
+
+End-to-end latency is measured from handing a cell info frame to the broker
+until its NN/state message is published (stand-in) or received back from
+the broker; every frame carries a sequence number in its cycles byte to
+match the two. Frames without a state after 256 newer frames of the same
+address, or at the end of the run, count as dropped. Memory is the process
+RSS, CPU the process time minus the harness threads.
+
+    python3 tools/soak.py --packs 16 --rate 2 --duration 600
+    python3 tools/soak.py --packs 32 --rate 5 --duration 259200 --report-every 3600 --report soak.json
+    python3 tools/soak.py --broker localhost:1883 --engine asyncio --duration 3600
+"""
+
+import argparse
+import bisect
+import json
+import os
+import platform
+import random
+import re
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "jk_bms_rs485_proxy"))
+
+from bms_simulator import SimulatedBms, corrupt  # noqa: E402
+from capture import NullMQTTClient  # noqa: E402
+from rs485_mqtt_ha_proxy import RS485MQTTClient  # noqa: E402
+
+TOPIC_TX = "rs485tx/tx"
+TOPIC_VALUES = "rs485tx/bms"
+
+_STATE_TOPIC = re.compile(r"/(\d+)/state$")
+_CYCLES = re.compile(rb'"cycles": (\d+)')
+
+# Latency buckets from 10 us to 100 s, 5% apart
+_BOUNDS = [10e-6 * 1.05 ** i for i in range(331)]
+
+
+class Message:
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(_BOUNDS) + 1)
+        self.count = 0
+        self.maximum = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(_BOUNDS, seconds)] += 1
+        self.count += 1
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction, in seconds."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(_BOUNDS[index], self.maximum) if index < len(_BOUNDS) else self.maximum
+        return self.maximum
+
+    def summary(self):
+        ms = lambda seconds: None if seconds is None else round(seconds * 1000, 3)
+        return {
+            "count": self.count,
+            "p50_ms": ms(self.percentile(0.50)),
+            "p90_ms": ms(self.percentile(0.90)),
+            "p99_ms": ms(self.percentile(0.99)),
+            "p999_ms": ms(self.percentile(0.999)),
+            "max_ms": ms(self.maximum if self.count else None),
+        }
+
+
+class Tracker:
+    """Matches state publishes to the frames they came from."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.total = LatencyHistogram()
+        self.interval = LatencyHistogram()
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+        self.unmatched = 0
+
+    def sent_frame(self, address, sequence, sent_ns):
+        with self.lock:
+            if self.pending.pop((address, sequence), None) is not None:
+                self.dropped += 1
+            self.pending[(address, sequence)] = sent_ns
+            self.sent += 1
+
+    def on_publish(self, topic, payload):
+        received_ns = time.perf_counter_ns()
+        match = _STATE_TOPIC.search(topic)
+        if match is None:
+            return
+        payload = payload if isinstance(payload, bytes) else payload.encode()
+        cycles = _CYCLES.search(payload)
+        if cycles is None:
+            return
+        key = (int(match.group(1)), int(cycles.group(1)))
+        with self.lock:
+            sent_ns = self.pending.pop(key, None)
+            if sent_ns is None:
+                self.unmatched += 1
+                return
+            self.received += 1
+            latency = (received_ns - sent_ns) / 1e9
+            self.total.add(latency)
+            self.interval.add(latency)
+
+    def take_interval(self):
+        with self.lock:
+            interval, self.interval = self.interval, LatencyHistogram()
+        return interval
+
+    def finish(self):
+        with self.lock:
+            self.dropped += len(self.pending)
+            self.pending.clear()
+
+
+class LoopbackClient(NullMQTTClient):
+    """Stands in for paho and the broker: every publish is handed to deliver(topic, payload)."""
+
+    def __init__(self, deliver):
+        super().__init__()
+        self.deliver = deliver
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        result = super().publish(topic, payload, qos, retain)
+        self.deliver(topic, payload)
+        return result
+
+
+class Fleet:
+    """Frame source for all simulated packs, paced at rate frames/s per pack."""
+
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.packs = [SimulatedBms(address, args.cells, seed=args.seed * 1000 + address, alarm_rate=args.alarm_rate)
+                      for address in range(1, args.packs + 1)]
+        self.sequences = [0] * len(self.packs)
+        self.counters = {"cell_info": 0, "settings": 0, "corrupt": 0, "fragmented": 0}
+        # CPU seconds of the fleet thread, updated as it runs
+        self.cpu = 0.0
+
+    def run(self, send, tracker, stop, duration):
+        """Generate frames until duration elapsed or stop is set; runs on its own thread."""
+        args = self.args
+        interval = 1.0 / (args.rate * len(self.packs))
+        settings_every = max(1, round(args.settings_every * args.rate))
+        rnd = self.random
+        for bms in self.packs:
+            send(bms.settings_frame())
+            self.counters["settings"] += 1
+        started = time.monotonic()
+        next_send = started
+        tick = 0
+        while not stop.is_set():
+            now = time.monotonic()
+            if now - started >= duration:
+                break
+            if next_send > now:
+                time.sleep(next_send - now)
+            next_send += interval
+
+            index = tick % len(self.packs)
+            cycle = tick // len(self.packs)
+            tick += 1
+            if not index:
+                self.cpu = time.thread_time()
+            bms = self.packs[index]
+            if cycle % settings_every == settings_every - 1:
+                send(bms.settings_frame())
+                self.counters["settings"] += 1
+                continue
+            bms.step()
+            if args.corrupt_rate and rnd.random() < args.corrupt_rate:
+                send(corrupt(bms.cell_info_frame(), rnd))
+                self.counters["corrupt"] += 1
+                continue
+            sequence = self.sequences[index] = (self.sequences[index] + 1) & 0xFF
+            bms.cycles = sequence
+            frame = bms.cell_info_frame()
+            self.counters["cell_info"] += 1
+            if args.fragment_rate and rnd.random() < args.fragment_rate:
+                split = rnd.randrange(1, len(frame))
+                send(frame[:split])
+                tracker.sent_frame(bms.address, sequence, time.perf_counter_ns())
+                send(frame[split:])
+                self.counters["fragmented"] += 1
+            else:
+                tracker.sent_frame(bms.address, sequence, time.perf_counter_ns())
+                send(frame)
+        self.cpu = time.thread_time()
+        return time.monotonic() - started
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def thread_cpu(native_ids):
+    """CPU seconds used by the given running threads (Linux), 0 where unavailable."""
+    total = 0.0
+    ticks = os.sysconf("SC_CLK_TCK")
+    for tid in native_ids:
+        try:
+            with open(f"/proc/self/task/{tid}/stat") as f:
+                fields = f.read().rpartition(")")[2].split()
+            total += (int(fields[11]) + int(fields[12])) / ticks
+        except (OSError, ValueError, IndexError):
+            pass
+    return total
+
+
+def slope_per_hour(samples):
+    """Least-squares slope of (seconds, value) samples, per hour."""
+    if len(samples) < 2:
+        return 0.0
+    n = len(samples)
+    mean_t = sum(t for t, _ in samples) / n
+    mean_v = sum(v for _, v in samples) / n
+    var = sum((t - mean_t) ** 2 for t, _ in samples)
+    if not var:
+        return 0.0
+    return sum((t - mean_t) * (v - mean_v) for t, v in samples) / var * 3600
+
+
+def start_loopback(args, tracker):
+    proxy = RS485MQTTClient("soak", 0, None, None, TOPIC_TX, "homeassistant", TOPIC_VALUES, queue_size=args.queue_size)
+    proxy.client = LoopbackClient(tracker.on_publish)
+    proxy.discovery.attach(proxy.client)
+    # Nothing acknowledges publishes here, so do not wait for PUBACKs
+    proxy.discovery.qos = 0
+    proxy.pipeline.connected.set()
+    proxy.pipeline.start()
+
+    def send(payload):
+        # Called on the fleet thread, standing in for paho's network thread
+        proxy.on_message(None, None, Message(TOPIC_TX, payload))
+
+    return proxy, send, [], lambda: proxy.pipeline.stop()
+
+
+def start_broker(args, tracker):
+    import paho.mqtt.client as mqtt
+
+    host, _, port = args.broker.partition(":")
+    port = int(port or 1883)
+    proxy = RS485MQTTClient(host, port, args.username, args.password, TOPIC_TX, "homeassistant", TOPIC_VALUES,
+                            queue_size=args.queue_size, engine=args.engine)
+    # Frames sent before the proxy's topic_tx subscription is acknowledged would be lost
+    proxy_subscribed = threading.Event()
+    on_subscribe = proxy.on_subscribe
+
+    def watch_subscriptions(client, userdata, mid, *args, **kwargs):
+        on_subscribe(client, userdata, mid, *args, **kwargs)
+        if mid == proxy.subscription_mid:
+            proxy_subscribed.set()
+
+    proxy.on_subscribe = watch_subscriptions
+    proxy_thread = threading.Thread(target=proxy.connect_and_listen, name="soak-proxy", daemon=True)
+    proxy_thread.start()
+
+    subscribed = threading.Event()
+    harness = mqtt.Client()
+    if args.username:
+        harness.username_pw_set(args.username, args.password)
+    harness.on_connect = lambda client, userdata, flags, rc: client.subscribe(f"{TOPIC_VALUES}/+/state")
+    harness.on_subscribe = lambda client, userdata, mid, granted_qos: subscribed.set()
+    harness.on_message = lambda client, userdata, msg: tracker.on_publish(msg.topic, msg.payload)
+    harness.connect(host, port, 60)
+    harness.loop_start()
+    if not subscribed.wait(10):
+        raise SystemExit(f"No subscription acknowledged by {args.broker}")
+    if not proxy_subscribed.wait(30):
+        raise SystemExit(f"Proxy did not subscribe to {TOPIC_TX} on {args.broker}")
+
+    def send(payload):
+        harness.publish(TOPIC_TX, payload)
+
+    def stop():
+        harness.loop_stop()
+        harness.disconnect()
+        if proxy.client is not None:
+            proxy.client.disconnect()
+
+    return proxy, send, [harness._thread.native_id], stop
+
+
+def proxy_counters(proxy):
+    pipeline = proxy.pipeline
+    return {
+        "inbound_dropped": pipeline.inbound.dropped,
+        "outbound_dropped": pipeline.outbound.dropped,
+        "publish_failures": pipeline.publish_failures,
+        "reassembler": dict(proxy.reassembler.counters),
+        "registered_bms": len(proxy.bms_registry),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load / soak test the JK-BMS proxy with a simulated BMS fleet")
+    parser.add_argument("--packs", type=int, default=16, help="number of simulated BMS addresses")
+    parser.add_argument("--cells", type=int, default=16, help="cells per pack")
+    parser.add_argument("--rate", type=float, default=2, help="cell info frames per second per pack")
+    parser.add_argument("--duration", type=float, default=60, help="test duration in seconds")
+    parser.add_argument("--settings-every", type=float, default=30, help="seconds between settings frames of a pack")
+    parser.add_argument("--alarm-rate", type=float, default=0.001, help="probability of an alarm bit toggling per frame")
+    parser.add_argument("--corrupt-rate", type=float, default=0.001, help="fraction of cell info frames sent corrupted")
+    parser.add_argument("--fragment-rate", type=float, default=0.01, help="fraction of frames split over two payloads")
+    parser.add_argument("--queue-size", type=int, default=1000, help="proxy queue_size")
+    parser.add_argument("--broker", metavar="HOST[:PORT]", help="use a real broker instead of the in-process stand-in")
+    parser.add_argument("--username")
+    parser.add_argument("--password")
+    parser.add_argument("--engine", choices=("thread", "asyncio"), default="thread", help="proxy engine (with --broker)")
+    parser.add_argument("--warmup", type=float, default=30, help="seconds excluded from the memory growth estimate")
+    parser.add_argument("--sample-every", type=float, default=5, help="seconds between memory/CPU samples")
+    parser.add_argument("--report-every", type=float, default=60, help="seconds between progress lines")
+    parser.add_argument("--drain", type=float, default=5, help="seconds to wait for outstanding states at the end")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--report", metavar="FILE", help="write the summary as JSON")
+    args = parser.parse_args()
+
+    tracker = Tracker()
+    fleet = Fleet(args)
+    proxy, send, harness_threads, stop_proxy = (start_broker if args.broker else start_loopback)(args, tracker)
+
+    stop = threading.Event()
+    result = {}
+    fleet_thread = threading.Thread(
+        target=lambda: result.setdefault("elapsed", fleet.run(send, tracker, stop, args.duration)),
+        name="soak-fleet", daemon=True)
+
+    mode = f"broker {args.broker} ({args.engine} engine)" if args.broker else "in-process stand-in"
+    print(f"Soak test: {args.packs} packs x {args.cells} cells at {args.rate} frames/s each for {args.duration:.0f}s via {mode}")
+    print(f"{'elapsed':>9}{'frames/s':>10}{'states/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'dropped':>9}{'RSS MB':>9}{'CPU %':>8}")
+
+    started = time.monotonic()
+    cpu_started = time.process_time()
+    rss_started = rss_bytes()
+    rss_samples = []
+    rss_peak = rss_started
+    last_report = (started, 0, 0, cpu_started, 0.0)
+    fleet_thread.start()
+    harness_cpu_of = lambda: fleet.cpu + thread_cpu(harness_threads)
+    try:
+        while fleet_thread.is_alive():
+            fleet_thread.join(args.sample_every)
+            now = time.monotonic()
+            rss = rss_bytes()
+            rss_peak = max(rss_peak, rss)
+            if now - started >= args.warmup:
+                rss_samples.append((now - started, rss))
+            if now - last_report[0] >= args.report_every or not fleet_thread.is_alive():
+                report_time, sent, received, cpu, harness_cpu = last_report
+                cpu_now, harness_now = time.process_time(), harness_cpu_of()
+                span = now - report_time
+                interval = tracker.take_interval().summary()
+                proxy_cpu = (cpu_now - cpu - (harness_now - harness_cpu)) / span * 100
+                print(f"{now - started:>9.0f}{(tracker.sent - sent) / span:>10.1f}{(tracker.received - received) / span:>10.1f}"
+                      f"{interval['p50_ms'] or 0:>9.2f}{interval['p99_ms'] or 0:>9.2f}{interval['max_ms'] or 0:>9.2f}"
+                      f"{tracker.dropped:>9}{rss / 2**20:>9.1f}{proxy_cpu:>8.1f}")
+                last_report = (now, tracker.sent, tracker.received, cpu_now, harness_now)
+    except KeyboardInterrupt:
+        stop.set()
+        fleet_thread.join()
+
+    time.sleep(args.drain)
+    tracker.finish()
+    wall = time.monotonic() - started
+    cpu_total = time.process_time() - cpu_started
+    harness_cpu = harness_cpu_of()
+    stop_proxy()
+
+    counters = proxy_counters(proxy)
+    summary = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "mode": mode,
+        "packs": args.packs,
+        "cells": args.cells,
+        "rate_per_pack": args.rate,
+        "duration_s": round(result.get("elapsed", wall), 1),
+        "frames": fleet.counters,
+        "states_received": tracker.received,
+        "states_unmatched": tracker.unmatched,
+        "dropped": tracker.dropped,
+        "drop_ratio": round(tracker.dropped / tracker.sent, 6) if tracker.sent else 0,
+        "latency": tracker.total.summary(),
+        "rss_start_mb": round(rss_started / 2**20, 1),
+        "rss_peak_mb": round(rss_peak / 2**20, 1),
+        "rss_growth_mb_per_hour": round(slope_per_hour(rss_samples) / 2**20, 3),
+        "cpu_percent": round((cpu_total - harness_cpu) / wall * 100, 1),
+        "harness_cpu_percent": round(harness_cpu / wall * 100, 1),
+        "proxy": counters,
+    }
+
+    latency = summary["latency"]
+    print()
+    print(f"Frames sent:      {fleet.counters['cell_info']} cell info ({fleet.counters['fragmented']} fragmented), "
+          f"{fleet.counters['settings']} settings, {fleet.counters['corrupt']} corrupt")
+    print(f"States received:  {tracker.received}, dropped {tracker.dropped} ({summary['drop_ratio']:.4%}), unmatched {tracker.unmatched}")
+    print(f"Latency:          p50 {latency['p50_ms']} ms, p90 {latency['p90_ms']} ms, p99 {latency['p99_ms']} ms, "
+          f"p99.9 {latency['p999_ms']} ms, max {latency['max_ms']} ms")
+    print(f"Memory:           RSS {summary['rss_start_mb']} MB at start, peak {summary['rss_peak_mb']} MB, "
+          f"growth {summary['rss_growth_mb_per_hour']} MB/h after warm-up")
+    print(f"CPU:              proxy {summary['cpu_percent']}% of one core, harness {summary['harness_cpu_percent']}%")
+    print(f"Proxy counters:   {counters}")
+    if counters["reassembler"].get("bad_checksum", 0) != fleet.counters["corrupt"]:
+        print(f"Note: {fleet.counters['corrupt']} corrupt frames sent, "
+              f"{counters['reassembler'].get('bad_checksum', 0)} rejected for their checksum")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Report written to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())